@@ -0,0 +1,369 @@
+"""
+Модуль async_database.py
+
+Асинхронный слой доступа к PostgreSQL с теми же операциями, что у `Database` и `DatabaseUtils`.
+
+Класс `AsyncDatabase` работает через пул соединений asyncpg. asyncpg подготавливает каждый
+запрос на соединении (prepared statement) и кэширует подготовленные запросы, поэтому
+повторные вызовы одних и тех же операций не разбираются сервером заново. Запросы
+с переменным количеством параметров (например, поиск отсутствующих кандидатов) передают
+список одним параметром-массивом, чтобы текст запроса и подготовленный запрос не менялись.
+
+Условия WHERE записываются так же, как для `Database`, с параметрами %s; они заменяются
+на нумерованные параметры asyncpg ($1, $2, ...). Значения передаются в типах Python
+(например, дата рождения - datetime.date, массив фотографий - list[str]).
+
+Зависимость asyncpg необязательна: синхронный бот работает без нее, а при создании пула
+без установленного asyncpg выбрасывается RuntimeError.
+
+Пример использования:
+    async with AsyncDatabase() as db:
+        user_info, candidates = await asyncio.gather(
+            loop.run_in_executor(None, vk_api.get_users_info, vk_id),
+            db.search_for_candidates_db([25, 30], 1, 'москва', vk_id, limit=20),
+        )
+"""
+import logging
+import re
+
+from functools import lru_cache
+from time import perf_counter
+from config import DB_NAME, DB_USER, DB_PASSWORD, DB_HOST, DB_PORT
+from database import query_observer
+from metrics import current_origin, timed
+from utils import CANDIDATE_COLUMNS, ADD_DECISION_QUERY, UPDATE_DECISION_QUERY, DatabaseUtils, \
+    LRUCache
+
+try:
+    import asyncpg
+except ImportError:  # asyncpg - необязательная зависимость
+    asyncpg = None
+
+# Ошибки сервера, которые insert_data логирует вместо выбрасывания (как Database.insert_data)
+_DB_ERRORS = (asyncpg.PostgresError,) if asyncpg is not None else ()
+
+logger = logging.getLogger(__name__)
+
+_PLACEHOLDER_RE = re.compile(r'%s')
+
+
+@lru_cache(maxsize=1024)
+def numbered(query: str) -> str:
+    """
+    Заменяет параметры %s на нумерованные параметры asyncpg ($1, $2, ...).
+
+    :param query: str Текст запроса с параметрами %s.
+    :return: str Текст запроса с параметрами $n.
+    """
+    counter = iter(range(1, query.count('%s') + 1))
+    return _PLACEHOLDER_RE.sub(lambda _: f'${next(counter)}', query)
+
+
+class AsyncDatabase:
+    """
+        Асинхронный доступ к базе данных бота.
+
+    Атрибуты:
+    - pool: Пул соединений asyncpg (создается в `connect` или передается готовым).
+    - min_size, max_size: Границы размера пула.
+    - seen: Фильтр оцененных кандидатов (SeenCandidates), который пополняется новыми
+      оценками, или None.
+
+        Кэши регистрации и id пользователей общие с `DatabaseUtils`, поэтому синхронный
+    и асинхронный код видят одни и те же данные.
+    """
+
+    def __init__(self, dbname=DB_NAME, user=DB_USER, password=DB_PASSWORD, host=DB_HOST,
+                 port=DB_PORT, min_size: int = 1, max_size: int = 10, pool=None, seen=None):
+        """
+        :param dbname: Имя базы данных.
+        :param user: Имя пользователя базы данных.
+        :param password: Пароль пользователя базы данных.
+        :param host: Хост базы данных.
+        :param port: Порт базы данных.
+        :param min_size: int Минимальное количество соединений в пуле.
+        :param max_size: int Максимальное количество соединений в пуле.
+        :param pool: Готовый пул соединений (если передан, `connect` его не создает).
+        :param seen: SeenCandidates Фильтр оцененных кандидатов (например, `AuxiliaryUtils.seen`).
+        """
+        self._connect_params = {'database': dbname, 'user': user, 'password': password,
+                                'host': host, 'port': port}
+        self.min_size = min_size
+        self.max_size = max_size
+        self.pool = pool
+        self.seen = seen
+
+    async def connect(self):
+        """Создает пул соединений, если он еще не создан."""
+        if self.pool is not None:
+            return
+        if asyncpg is None:
+            raise RuntimeError("Для AsyncDatabase требуется пакет asyncpg: pip install asyncpg")
+        self.pool = await asyncpg.create_pool(min_size=self.min_size, max_size=self.max_size,
+                                              **self._connect_params)
+        logger.info(f"Пул соединений с {self._connect_params['database']} создан")
+
+    async def close(self):
+        """Закрывает пул соединений."""
+        if self.pool is not None:
+            await self.pool.close()
+            self.pool = None
+
+    async def __aenter__(self):
+        await self.connect()
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.close()
+
+    async def _run(self, method: str, query: str, params: tuple = ()):
+        """
+        Выполняет запрос методом пула и передает сведения о нем `query_observer`.
+
+        :param method: str Метод пула: 'fetch', 'fetchrow', 'fetchval' или 'execute'.
+        :param query: str Текст запроса с параметрами %s.
+        :param params: tuple Параметры запроса.
+        :return: Результат метода пула.
+        """
+        await self.connect()
+        start = perf_counter()
+        result = await getattr(self.pool, method)(numbered(query), *params)
+        duration = perf_counter() - start
+        rows = len(result) if isinstance(result, list) else None
+        query_fp = query_observer.record(query, duration, rows)
+        if query_observer.is_slow(duration):
+            logger.warning("Медленный запрос %.2f мс (%s): %s", duration * 1000,
+                           current_origin.get(), query_fp)
+        return result
+
+    @timed('adb.insert_data')
+    async def insert_data(self, table_name: str, data: dict, conflict_target: str = None):
+        """
+        Вставка данных в таблицу.
+
+        :param table_name: Имя таблицы.
+        :param data: Словарь с данными для вставки.
+        :param conflict_target: Уникальный столбец; при конфликте запись обновляется.
+        :return: ID вставленной (или обновленной) записи или None при ошибке.
+        """
+        columns = list(data)
+        on_conflict = ''
+        if conflict_target:
+            updates = [f"{col} = EXCLUDED.{col}" for col in columns if col != conflict_target]
+            updates = updates or [f"{conflict_target} = EXCLUDED.{conflict_target}"]
+            on_conflict = f" ON CONFLICT ({conflict_target}) DO UPDATE SET {', '.join(updates)}"
+        query = (f"INSERT INTO {table_name} ({', '.join(columns)})"
+                 f" VALUES ({', '.join(['%s'] * len(columns))}){on_conflict} RETURNING id")
+        try:
+            return await self._run('fetchval', query, tuple(data.values()))
+        except _DB_ERRORS as e:
+            logger.error(f"Ошибка при вставке данных в таблицу {table_name}: {e}")
+            return None
+
+    @timed('adb.select_data')
+    async def select_data(self, table_name, columns: str = '*',
+                          condition: str = None, values: tuple = None) -> list:
+        """
+        Выполнение SELECT-запроса.
+
+        :param table_name: Имя таблицы.
+        :param columns: Список столбцов для выборки, по умолчанию '*' - все столбцы.
+        :param condition: Условие WHERE с параметрами %s.
+        :param values: Значения для подстановки в условие WHERE.
+        :return: Список строк (asyncpg.Record).
+        """
+        columns_str = ', '.join(columns) if isinstance(columns, list) else columns
+        query = f"SELECT {columns_str} FROM {table_name}"
+        if condition:
+            query += f" WHERE {condition}"
+        return await self._run('fetch', query, tuple(values or ()))
+
+    @timed('adb.update_data')
+    async def update_data(self, table_name: str, data: dict, condition: str,
+                          values: tuple = None) -> bool:
+        """
+        Обновление данных в таблице.
+
+        :param table_name: Имя таблицы.
+        :param data: Словарь {столбец: значение}.
+        :param condition: Условие WHERE с параметрами %s.
+        :param values: Значения для подстановки в условие WHERE.
+        :return: True, если запрос выполнен.
+        """
+        set_clause = ', '.join(f"{column} = %s" for column in data)
+        query = f"UPDATE {table_name} SET {set_clause} WHERE {condition}"
+        await self._run('execute', query, (*data.values(), *(values or ())))
+        return True
+
+    @timed('adb.delete_data')
+    async def delete_data(self, table_name: str, condition: str = None,
+                          values: tuple = None) -> bool:
+        """
+        Выполнение DELETE-запроса.
+
+        :param table_name: Имя таблицы.
+        :param condition: Условие WHERE с параметрами %s.
+        :param values: Значения для подстановки в условие WHERE.
+        :return: True, если запрос выполнен.
+        """
+        query = f"DELETE FROM {table_name}"
+        if condition:
+            query += f" WHERE {condition}"
+        await self._run('execute', query, tuple(values or ()))
+        return True
+
+    @timed('adb.execute_query')
+    async def execute_query(self, query: str, params: tuple = None, fetch: bool = False):
+        """
+        Выполнение произвольного SQL-запроса.
+
+        :param query: Текст запроса с параметрами %s.
+        :param params: Параметры запроса.
+        :param fetch: Если True, возвращаются строки результата.
+        :return: Список строк при fetch=True, иначе None.
+        """
+        result = await self._run('fetch' if fetch else 'execute', query, tuple(params or ()))
+        return result if fetch else None
+
+    async def get_user_id(self, user_vk_id: int) -> int | None:
+        """
+        Возвращает id пользователя в таблице `users` по VK ID (см. `DatabaseUtils.get_user_id`).
+
+        :param user_vk_id: int VK ID пользователя.
+        :return: int | None id пользователя или None, если пользователь не зарегистрирован.
+        """
+        user_id = DatabaseUtils.user_id_cache.get(user_vk_id)
+        if user_id is not LRUCache._MISSING:
+            return user_id
+        user_id = await self._run('fetchval', "SELECT id FROM users WHERE vk_id = %s",
+                                  (user_vk_id,))
+        if user_id is not None:
+            DatabaseUtils.user_id_cache.set(user_vk_id, user_id)
+        return user_id
+
+    async def check_user_existence_db(self, user_vk_id: int) -> list | None:
+        """
+        Проверяет, зарегистрирован ли пользователь (см. `DatabaseUtils.check_user_existence_db`).
+
+        :param user_vk_id: int VK ID пользователя.
+        :return: Строки с VK ID пользователя или None, если пользователь не найден.
+        """
+        cached = DatabaseUtils.registration_cache.get(user_vk_id)
+        if cached is not LRUCache._MISSING:
+            return cached
+        rows = await self.select_data('users', 'vk_id', 'vk_id = %s', (user_vk_id,))
+        result = [tuple(row) for row in rows] or None
+        DatabaseUtils.registration_cache.set(user_vk_id, result)
+        return result
+
+    async def find_missing_candidates(self, vk_ids: list) -> list[int]:
+        """
+        Возвращает VK ID кандидатов из списка, которых нет в таблице candidate.
+
+        Список передается одним параметром-массивом, поэтому для любого количества
+        VK ID используется один подготовленный запрос.
+
+        :param vk_ids: Список VK ID кандидатов.
+        :return: Список отсутствующих VK ID.
+        """
+        if not vk_ids:
+            return []
+        rows = await self._run('fetch', """
+            SELECT missing.vk_id
+            FROM unnest(%s::bigint[]) AS missing(vk_id)
+            WHERE NOT EXISTS (SELECT 1 FROM candidate c WHERE c.vk_id = missing.vk_id)
+        """, (list(vk_ids),))
+        return [row[0] for row in rows]
+
+    @timed('adb.search_for_candidates_db')
+    async def search_for_candidates_db(self, age: list, sex: int, city: str, user_vk_id: int,
+                                       limit: int = None, city_id: int = None) -> list:
+        """
+        Поиск кандидатов, которых пользователь еще не оценил
+        (см. `DatabaseUtils.search_for_candidates_db`).
+
+        :param age: Список [age] или [min_age, max_age]; значения могут быть строками
+                    (как в данных регистрации) и приводятся к int.
+        :param sex: Пол кандидатов (1 - женский, 2 - мужской).
+        :param city: Город кандидатов.
+        :param user_vk_id: VK ID пользователя.
+        :param limit: Количество кандидатов (по умолчанию все).
+        :param city_id: id города VK; если не указан, город сравнивается по названию.
+        :return: Список строк с `CANDIDATE_COLUMNS`.
+        """
+        # asyncpg не приводит строки к числам, в отличие от подстановки параметров psycopg2
+        age_from, age_to = int(age[0]), int(age[-1])
+        query = f"""
+            SELECT {CANDIDATE_COLUMNS}
+            FROM candidate_search s JOIN candidate c ON c.id = s.candidate_id
+            WHERE (s.city_id = %s OR ((%s::int IS NULL OR s.city_id IS NULL)
+                                      AND s.city_key = lower(trim(%s))))
+              AND s.gender = %s
+              AND s.birth_year BETWEEN EXTRACT(YEAR FROM CURRENT_DATE) - %s - 1
+                                   AND EXTRACT(YEAR FROM CURRENT_DATE) - %s
+              AND DATE_PART('year', AGE(CURRENT_DATE, c.birthday)) BETWEEN %s AND %s
+              AND NOT EXISTS (
+                  SELECT 1 FROM user_candidate uc
+                  WHERE uc.user_id = %s AND uc.candidate_id = c.id
+              )
+              AND NOT EXISTS (
+                  SELECT 1 FROM user_candidate_archive a
+                  WHERE a.user_id = %s AND a.candidate_id = c.id
+              )
+            LIMIT %s
+        """
+        user_id = await self.get_user_id(user_vk_id)
+        params = (city_id, city_id, city, sex, age_to, age_from, age_from, age_to,
+                  user_id, user_id, limit)
+        return await self._run('fetch', query, params)
+
+    @timed('adb.search_favorites')
+    async def search_favorites(self, user_vk_id: int) -> list:
+        """
+        Возвращает избранных кандидатов пользователя (см. `DatabaseUtils.search_favorites`).
+
+        :param user_vk_id: int VK ID пользователя.
+        :return: Список строк с `CANDIDATE_COLUMNS`.
+        """
+        user_id = await self.get_user_id(user_vk_id)
+        if user_id is None:
+            return []
+        return await self.select_data('candidate c', CANDIDATE_COLUMNS, """
+            c.id IN (
+                SELECT uc.candidate_id FROM user_candidate uc
+                WHERE uc.user_id = %s AND uc.preference = TRUE
+            )
+        """, (user_id,))
+
+    async def adding_candidate_status(self, candidate_id: int, user_vk_id: int,
+                                      preference: bool):
+        """
+        Сохраняет оценку кандидата пользователем вместе со счетчиками оценок
+        (см. `AuxiliaryUtils.adding_candidate_status`).
+
+        :param candidate_id: Идентификатор кандидата.
+        :param user_vk_id: VK ID пользователя.
+        :param preference: True для лайка, False для дизлайка.
+        :return: ID записи оценки или None при ошибке.
+        """
+        params = (await self.get_user_id(user_vk_id), candidate_id, preference)
+        try:
+            row = await self._run('fetchrow', ADD_DECISION_QUERY, params)
+        except _DB_ERRORS as e:
+            logger.error(f"Ошибка при сохранении оценки кандидата {candidate_id}: {e}")
+            return None
+        DatabaseUtils.decision_saved(user_vk_id, row[1] if row else None, self.seen)
+        return row[0] if row else None
+
+    async def candidate_status_update(self, candidate_id: int, user_vk_id: int,
+                                      preference: bool):
+        """
+        Обновляет оценку кандидата пользователем вместе со счетчиками оценок.
+
+        :param candidate_id: Идентификатор кандидата.
+        :param user_vk_id: VK ID пользователя.
+        :param preference: True - нравится, False - не нравится.
+        """
+        await self._run('execute', UPDATE_DECISION_QUERY,
+                        (await self.get_user_id(user_vk_id), candidate_id, preference))
+        DatabaseUtils.decision_saved(user_vk_id)
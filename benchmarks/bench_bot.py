@@ -0,0 +1,222 @@
+"""
+Модуль bench_bot.py
+
+Бенчмарк пропускной способности основных сценариев бота.
+
+Бот (`VKBot` + `Handler`) получает синтетические события long poll и работает с локальной
+базой данных PostgreSQL и фейковым бэкендом VK (см. fake_vk.py). Для каждого сценария
+измеряются количество событий в секунду и квантили задержки обработки события:
+- register: "начать" -> кнопка регистрации (фоновая задача регистрации дожидается окончания);
+- search: "найти пару" -> пол -> возраст -> город (поиск кандидатов и показ первого);
+- rate: серия лайков и дизлайков;
+- favorites: открытие избранных и навигация вперед/назад.
+
+Результаты сохраняются в JSON; при указании --compare сравниваются с сохраненной базовой
+линией, и при регрессии больше порога скрипт завершается с кодом 1.
+
+ВНИМАНИЕ: бенчмарк удаляет и заново создает таблицы бота в базе --dbname.
+
+Пример запуска из корня репозитория:
+    python -m benchmarks.bench_bot --dbname vkbot_bench --output benchmarks/baselines/current.json
+    python -m benchmarks.bench_bot --dbname vkbot_bench --compare benchmarks/baselines/main.json
+"""
+import argparse
+import json
+import os
+import sys
+
+from time import perf_counter
+
+FLOWS = ('register', 'search', 'rate', 'favorites')
+
+
+def percentile(values: list[float], q: float) -> float:
+    """
+    Возвращает квантиль q (0..1) списка значений.
+
+    :param values: list[float] Значения.
+    :param q: float Квантиль.
+    :return: float Значение квантиля или 0.0 для пустого списка.
+    """
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def summarize(latencies: list[float], elapsed: float) -> dict:
+    """
+    Формирует сводку по задержкам сценария.
+
+    :param latencies: list[float] Время обработки каждого события в секундах.
+    :param elapsed: float Общее время прогона сценария в секундах.
+    :return: dict Сводка: количество событий, события/с и квантили в миллисекундах.
+    """
+    return {
+        'events': len(latencies),
+        'seconds': round(elapsed, 4),
+        'events_per_sec': round(len(latencies) / elapsed, 2) if elapsed else 0.0,
+        'p50_ms': round(percentile(latencies, 0.50) * 1000, 3),
+        'p95_ms': round(percentile(latencies, 0.95) * 1000, 3),
+        'p99_ms': round(percentile(latencies, 0.99) * 1000, 3),
+    }
+
+
+def build_scripts(users: list[int], rate_steps: int, favorites_steps: int) -> dict:
+    """
+    Формирует сценарии событий для каждого измеряемого потока.
+
+    :param users: list[int] VK ID синтетических пользователей.
+    :param rate_steps: int Количество оценок кандидатов на пользователя.
+    :param favorites_steps: int Количество переходов по избранным на пользователя.
+    :return: dict {поток: список событий}.
+    """
+    from benchmarks.fake_vk import FakeEvent
+    from btn_text import BTN_REGISTRATION, BTN_FIND_PAIR, BTN_SEX_WOMAN, BTN_LIKE, \
+        BTN_DISLIKE, BTN_CHOSEN, BTN_NEXT, BTN_BACK, BTN_MAIN_MENU
+
+    scripts = {flow: [] for flow in FLOWS}
+    for user_id in users:
+        scripts['register'] += [FakeEvent(user_id, 'Начать'), FakeEvent(user_id, BTN_REGISTRATION)]
+        scripts['search'] += [FakeEvent(user_id, BTN_FIND_PAIR), FakeEvent(user_id, BTN_SEX_WOMAN),
+                              FakeEvent(user_id, '25,30'), FakeEvent(user_id, 'Москва')]
+        scripts['rate'] += [FakeEvent(user_id, BTN_LIKE if step % 2 == 0 else BTN_DISLIKE)
+                            for step in range(rate_steps)]
+        scripts['rate'].append(FakeEvent(user_id, BTN_MAIN_MENU))
+        scripts['favorites'].append(FakeEvent(user_id, BTN_CHOSEN))
+        scripts['favorites'] += [FakeEvent(user_id, BTN_NEXT if step % 3 != 2 else BTN_BACK)
+                                 for step in range(favorites_steps)]
+        scripts['favorites'].append(FakeEvent(user_id, BTN_MAIN_MENU))
+    return scripts
+
+
+def reset_schema():
+    """
+    Пересоздает таблицы бота, чтобы каждый прогон начинался с пустой базы.
+
+        Вместе с `schema_migrations` удаляется и файл отпечатка схемы, иначе следующий
+    запуск бота на этой базе счел бы пустую схему проверенной.
+    """
+    from config import SCHEMA_STAMP_FILE
+    from utils import DatabaseUtils
+
+    db = DatabaseUtils()
+    # user_candidate_unpartitioned удаляется раньше user_candidate: последовательность
+    # user_candidate_id_seq, на которую ссылается ее id, принадлежит новой таблице
+    for table in ('user_candidate_unpartitioned', 'user_candidate', 'user_candidate_archive',
+                  'candidate_stats', 'user_stats', 'user_daily_decisions', 'candidate_search',
+                  'candidate', 'users', 'city_alias', 'schema_migrations'):
+        db.drop_table(table)
+    if os.path.exists(SCHEMA_STAMP_FILE):
+        os.remove(SCHEMA_STAMP_FILE)
+    db.add_table()
+    DatabaseUtils.registration_cache.clear()
+
+
+def run_benchmark(users: int, rate_steps: int, favorites_steps: int, latency: float) -> dict:
+    """
+    Прогоняет все сценарии и возвращает результаты.
+
+    :param users: int Количество синтетических пользователей.
+    :param rate_steps: int Количество оценок кандидатов на пользователя.
+    :param favorites_steps: int Количество переходов по избранным на пользователя.
+    :param latency: float Искусственная задержка каждого вызова VK в секундах.
+    :return: dict Результаты по потокам и снимок метрик этапов.
+    """
+    from benchmarks.fake_vk import FakeVKBackend, ScriptedLongPoll, build_bot, run_script, \
+        wait_registrations
+    from metrics import registry
+
+    reset_schema()
+    backend = FakeVKBackend(latency=latency)
+    longpoll = ScriptedLongPoll()
+    vk_bot, patches = build_bot(backend, longpoll)
+
+    user_ids = list(range(1, users + 1))
+    scripts = build_scripts(user_ids, rate_steps, favorites_steps)
+    results = {'flows': {}, 'stages': {}, 'vk_calls': {}}
+
+    with patches:
+        for flow in FLOWS:
+            registry.reset()
+            backend.reset_calls()
+            start = perf_counter()
+            latencies = run_script(vk_bot, longpoll, scripts[flow])
+            if flow == 'register':
+                wait_registrations(vk_bot, user_ids)
+            elapsed = perf_counter() - start
+
+            results['flows'][flow] = summarize(latencies, elapsed)
+            results['stages'][flow] = registry.snapshot()
+            results['vk_calls'][flow] = dict(backend.calls)
+
+    vk_bot.handler.registration_pipeline.shutdown(wait=True)
+    return results
+
+
+def compare(current: dict, baseline: dict, threshold: float) -> list[str]:
+    """
+    Сравнивает результаты с базовой линией.
+
+    :param current: dict Текущие результаты.
+    :param baseline: dict Результаты базовой линии.
+    :param threshold: float Допустимое ухудшение в долях (0.1 = 10%).
+    :return: list[str] Описания регрессий; пустой список, если регрессий нет.
+    """
+    regressions = []
+    for flow, base in baseline.get('flows', {}).items():
+        cur = current['flows'].get(flow)
+        if cur is None:
+            continue
+        if base['events_per_sec'] and \
+                cur['events_per_sec'] < base['events_per_sec'] * (1 - threshold):
+            regressions.append(f"{flow}: events/s {base['events_per_sec']} -> "
+                               f"{cur['events_per_sec']}")
+        for key in ('p95_ms', 'p99_ms'):
+            if base[key] and cur[key] > base[key] * (1 + threshold):
+                regressions.append(f"{flow}: {key} {base[key]} -> {cur[key]}")
+    return regressions
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description='Бенчмарк основных сценариев VK бота.')
+    parser.add_argument('--dbname', default='vkbot_bench',
+                        help='База данных для прогона (таблицы будут пересозданы).')
+    parser.add_argument('--users', type=int, default=20)
+    parser.add_argument('--rate-steps', type=int, default=20)
+    parser.add_argument('--favorites-steps', type=int, default=15)
+    parser.add_argument('--vk-latency', type=float, default=0.0,
+                        help='Искусственная задержка каждого вызова VK, с.')
+    parser.add_argument('--output', default='benchmarks/baselines/current.json')
+    parser.add_argument('--compare', help='JSON базовой линии для сравнения.')
+    parser.add_argument('--threshold', type=float, default=0.15,
+                        help='Допустимое ухудшение относительно базовой линии (доля).')
+    args = parser.parse_args(argv)
+
+    # Переопределяем базу до импорта config, чтобы бот подключился к базе бенчмарка
+    os.environ['DB_NAME'] = args.dbname
+    os.environ['METRICS_PORT'] = '0'
+
+    results = run_benchmark(args.users, args.rate_steps, args.favorites_steps, args.vk_latency)
+    results['params'] = {'users': args.users, 'rate_steps': args.rate_steps,
+                         'favorites_steps': args.favorites_steps, 'vk_latency': args.vk_latency}
+
+    os.makedirs(os.path.dirname(args.output) or '.', exist_ok=True)
+    with open(args.output, 'w', encoding='utf-8') as file:
+        json.dump(results, file, ensure_ascii=False, indent=2)
+
+    for flow, summary in results['flows'].items():
+        print(f"{flow:10} {summary['events_per_sec']:>10} ev/s  p50 {summary['p50_ms']} ms  "
+              f"p95 {summary['p95_ms']} ms  p99 {summary['p99_ms']} ms")
+
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as file:
+            regressions = compare(results, json.load(file), args.threshold)
+        for line in regressions:
+            print(f"РЕГРЕССИЯ {line}")
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,272 @@
+"""
+Модуль fake_vk.py
+
+Фейковый бэкенд ВКонтакте для бенчмарков и нагрузочного тестирования бота.
+
+Содержит:
+- FakeVKBackend: детерминированная подмена HTTP-запросов `VKAPI` (`users.get`, `photos.get`,
+  `database.getCities`, `users.search`) и методов API сообщества (`messages.send`,
+  `users.get`) со счетчиками вызовов и искусственной задержкой.
+- FakeEvent: событие long poll с теми же атрибутами, что использует бот.
+- ScriptedLongPoll: источник событий для `VKBot.run`, выдающий заранее подготовленные события
+  и замеряющий время обработки каждого из них.
+- build_bot: создание `VKBot`, подключенного к фейковому бэкенду.
+
+Бот работает с настоящей базой данных PostgreSQL, параметры которой берутся из окружения
+(см. config.py).
+"""
+import threading
+
+from contextlib import ExitStack
+from datetime import date
+from time import perf_counter, sleep
+from unittest import mock
+
+from vk_api.longpoll import VkEventType
+
+
+class FakeResponse:
+    """Ответ `requests.get` с заранее подготовленным JSON."""
+
+    def __init__(self, payload: dict, status_code: int = 200):
+        self._payload = payload
+        self.status_code = status_code
+
+    def json(self):
+        return self._payload
+
+
+class FakeVKBackend:
+    """
+        Детерминированный фейковый бэкенд VK API.
+
+        Профили кандидатов генерируются в `users.search` под параметры поиска (возраст,
+    пол, город), поэтому кандидаты, найденные ботом через VK, затем находятся и в базе данных.
+
+    Атрибуты:
+    - latency: Искусственная задержка каждого вызова VK в секундах.
+    - calls: Словарь {метод VK: количество вызовов}.
+    - city_title: Название города, возвращаемое в профилях.
+    """
+
+    def __init__(self, latency: float = 0.0, city_title: str = 'Москва', search_page: int = 10):
+        """
+        :param latency: float Искусственная задержка каждого вызова VK в секундах.
+        :param city_title: str Название города в профилях пользователей и кандидатов.
+        :param search_page: int Количество кандидатов, возвращаемых `users.search`.
+        """
+        self.latency = latency
+        self.city_title = city_title
+        self.search_page = search_page
+        self.calls = {}
+        self._profiles = {}
+        self._next_candidate_id = 10_000_000
+        self._lock = threading.Lock()
+
+    def _count(self, method: str):
+        with self._lock:
+            self.calls[method] = self.calls.get(method, 0) + 1
+        if self.latency:
+            sleep(self.latency)
+
+    def reset_calls(self):
+        """Обнуляет счетчики вызовов."""
+        with self._lock:
+            self.calls = {}
+
+    def _profile(self, vk_id: int) -> dict:
+        """Возвращает профиль пользователя, создавая профиль по умолчанию при необходимости."""
+        with self._lock:
+            profile = self._profiles.get(vk_id)
+            if profile is None:
+                profile = {'sex': 2, 'age': 30}
+                self._profiles[vk_id] = profile
+            return profile
+
+    # Подмена requests.get для VKAPI
+
+    def requests_get(self, url: str, params: dict = None, timeout: float = None) -> FakeResponse:
+        """
+        Подмена `requests.get`, используемая модулем vk_api_service.
+
+        :param url: str URL метода VK API.
+        :param params: dict Параметры запроса.
+        :param timeout: float Не используется.
+        :return: FakeResponse Ответ в формате VK API.
+        """
+        method = url.rsplit('/', 1)[-1]
+        self._count(method)
+        params = params or {}
+
+        if method == 'users.get':
+            return FakeResponse({'response': [self._user(int(params['user_ids']))]})
+        if method == 'photos.get':
+            owner_id = params['owner_id']
+            items = [{'owner_id': owner_id, 'id': i, 'likes': {'count': i * 3 % 7}}
+                     for i in range(1, 5)]
+            return FakeResponse({'response': {'count': len(items), 'items': items}})
+        if method == 'database.getCities':
+            return FakeResponse({'response': {'count': 1, 'items': [{'id': 1,
+                                                                     'title': self.city_title}]}})
+        if method == 'users.search':
+            return FakeResponse({'response': self._search(params)})
+        return FakeResponse({'error': {'error_code': 3, 'error_msg': 'Unknown method'}})
+
+    def _user(self, vk_id: int) -> dict:
+        profile = self._profile(vk_id)
+        birth_year = date.today().year - profile['age'] - 1
+        return {
+            'id': vk_id,
+            'first_name': f'Имя{vk_id}',
+            'last_name': f'Фамилия{vk_id}',
+            'sex': profile['sex'],
+            'bdate': f'1.1.{birth_year}',
+            'city': {'id': 1, 'title': self.city_title},
+        }
+
+    def _search(self, params: dict) -> dict:
+        age_from, age_to = int(params['age_from']), int(params['age_to'])
+        items = []
+        with self._lock:
+            for _ in range(int(params.get('count', self.search_page))):
+                vk_id = self._next_candidate_id
+                self._next_candidate_id += 1
+                self._profiles[vk_id] = {'sex': int(params['sex']),
+                                         'age': (age_from + age_to) // 2}
+                items.append({'id': vk_id})
+        return {'count': len(items), 'items': items}
+
+    # Подмена API сообщества (VkApi.get_api())
+
+    def get_api(self):
+        """Возвращает объект, имитирующий `VkApi.get_api()` для бота."""
+        return _FakeGroupApi(self)
+
+
+class _FakeGroupApi:
+    """Имитация `vk_api.VkApiMethod` с методами, используемыми ботом."""
+
+    def __init__(self, backend: FakeVKBackend):
+        self.messages = _FakeMethods(backend, 'messages', {'send': lambda **kw: 1})
+        self.users = _FakeMethods(backend, 'users', {
+            'get': lambda user_ids, **kw: [{'first_name': f'Имя{user_ids}',
+                                            'last_name': f'Фамилия{user_ids}'}]
+        })
+
+
+class _FakeMethods:
+    """Группа методов API сообщества со счетчиками вызовов."""
+
+    def __init__(self, backend: FakeVKBackend, section: str, methods: dict):
+        self._backend = backend
+        self._section = section
+        self._methods = methods
+
+    def __getattr__(self, name):
+        func = self._methods[name]
+
+        def call(**kwargs):
+            self._backend._count(f'{self._section}.{name}')
+            return func(**kwargs)
+        return call
+
+
+class FakeEvent:
+    """Событие `MESSAGE_NEW` long poll, адресованное боту."""
+
+    def __init__(self, user_id: int, text: str, payload: str = None):
+        self.type = VkEventType.MESSAGE_NEW
+        self.to_me = True
+        self.user_id = user_id
+        self.text = text
+        self.payload = payload
+
+
+class ScriptFinished(BaseException):
+    """Сигнал окончания сценария; не перехватывается `except Exception` в `VKBot.run`."""
+
+
+class ScriptedLongPoll:
+    """
+        Источник событий для `VKBot.run`.
+
+        Выдает события из очереди сценария. Время между выдачей события и запросом следующего
+    считается временем обработки события ботом и сохраняется в `latencies`.
+    """
+
+    def __init__(self, events=None):
+        """
+        :param events: Итерируемый объект событий FakeEvent.
+        """
+        self.events = iter(events or [])
+        self.latencies = []
+
+    def load(self, events):
+        """
+        Заменяет сценарий событий.
+
+        :param events: Итерируемый объект событий FakeEvent.
+        """
+        self.events = iter(events)
+        self.latencies = []
+
+    def listen(self):
+        for event in self.events:
+            start = perf_counter()
+            yield event
+            self.latencies.append(perf_counter() - start)
+        raise ScriptFinished()
+
+
+def build_bot(backend: FakeVKBackend, longpoll: ScriptedLongPoll):
+    """
+    Создает `VKBot`, подключенный к фейковому бэкенду VK и сценарию событий.
+
+    Подмена `requests.get` в vk_api_service остается активной, пока жив возвращаемый
+    ExitStack; его нужно закрыть по окончании работы.
+
+    :param backend: FakeVKBackend Фейковый бэкенд VK.
+    :param longpoll: ScriptedLongPoll Источник событий.
+    :return: tuple (VKBot, ExitStack).
+    """
+    import bot as bot_module
+
+    stack = ExitStack()
+    stack.enter_context(mock.patch('vk_api_service.requests.get', backend.requests_get))
+    with mock.patch.object(bot_module.vk_api, 'VkApi', return_value=backend):
+        vk_bot = bot_module.VKBot('fake-token')
+    vk_bot.longpoll = longpoll
+    return vk_bot, stack
+
+
+def run_script(vk_bot, longpoll: ScriptedLongPoll, events) -> list[float]:
+    """
+    Прогоняет сценарий событий через `VKBot.run`.
+
+    :param vk_bot: VKBot Бот, созданный `build_bot`.
+    :param longpoll: ScriptedLongPoll Источник событий бота.
+    :param events: Итерируемый объект событий FakeEvent.
+    :return: list[float] Время обработки каждого события в секундах.
+    """
+    longpoll.load(events)
+    try:
+        vk_bot.run()
+    except ScriptFinished:
+        pass
+    return longpoll.latencies
+
+
+def wait_registrations(vk_bot, user_ids, timeout: float = 60.0):
+    """
+    Дожидается завершения фоновой регистрации пользователей.
+
+    :param vk_bot: VKBot Бот, созданный `build_bot`.
+    :param user_ids: Итерируемый объект VK ID пользователей.
+    :param timeout: float Максимальное время ожидания в секундах.
+    """
+    pipeline = vk_bot.handler.registration_pipeline
+    deadline = perf_counter() + timeout
+    while any(pipeline.is_pending(user_id) for user_id in user_ids):
+        if perf_counter() > deadline:
+            raise TimeoutError('Фоновая регистрация не завершилась вовремя')
+        sleep(0.01)
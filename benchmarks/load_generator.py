@@ -0,0 +1,233 @@
+"""
+Модуль load_generator.py
+
+Генератор нагрузки, имитирующий множество одновременных пользователей VK.
+
+Каждый сеанс пользователя проходит реалистичный сценарий:
+"начать" -> регистрация -> "найти пару" -> пол -> возраст -> город -> серия лайков и
+дизлайков -> главное меню -> просмотр избранных -> главное меню.
+
+Сеансы начинаются по пуассоновскому потоку с заданной интенсивностью (--arrival-rate,
+сеансов в секунду), между шагами сценария пользователь "думает" случайное время со средним
+--think-time. События попадают в очередь, из которой их читает `VKBot.run` через фейковый
+long poll, поэтому бот обрабатывает их так же, как в продакшене - по одному.
+
+Отчет содержит:
+- глубину очереди событий (среднее, p95, максимум);
+- количество SQL-запросов и вызовов VK на событие;
+- задержку от поступления события до окончания его обработки (p50/p95/p99/максимум).
+
+ВНИМАНИЕ: генератор удаляет и заново создает таблицы бота в базе --dbname.
+
+Пример запуска из корня репозитория:
+    python -m benchmarks.load_generator --dbname vkbot_load --sessions 2000 --arrival-rate 50
+"""
+import argparse
+import heapq
+import json
+import os
+import queue
+import random
+import sys
+import threading
+
+from time import perf_counter, sleep
+
+
+class QueueLongPoll:
+    """
+        Источник событий для `VKBot.run`, читающий события из очереди.
+
+        Для каждого события сохраняется задержка от момента поступления в очередь до запроса
+    следующего события (то есть окончания обработки), а при каждом чтении - глубина очереди.
+    """
+
+    def __init__(self, events_queue: queue.Queue):
+        """
+        :param events_queue: queue.Queue Очередь событий; None в очереди завершает сценарий.
+        """
+        self.queue = events_queue
+        self.latencies = []
+        self.depths = []
+
+    def listen(self):
+        from benchmarks.fake_vk import ScriptFinished
+
+        while True:
+            self.depths.append(self.queue.qsize())
+            event = self.queue.get()
+            if event is None:
+                raise ScriptFinished()
+            yield event
+            self.latencies.append(perf_counter() - event.arrived)
+
+
+def session_script(user_id: int, rng: random.Random, decisions: int,
+                   favorites_steps: int) -> list:
+    """
+    Формирует сценарий одного пользователя.
+
+    :param user_id: int VK ID пользователя.
+    :param rng: random.Random Генератор случайных чисел.
+    :param decisions: int Среднее количество оценок кандидатов за сеанс.
+    :param favorites_steps: int Количество переходов по избранным.
+    :return: list[FakeEvent] События сеанса.
+    """
+    from benchmarks.fake_vk import FakeEvent
+    from btn_text import BTN_REGISTRATION, BTN_FIND_PAIR, BTN_SEX_MAN, BTN_SEX_WOMAN, \
+        BTN_LIKE, BTN_DISLIKE, BTN_MAIN_MENU, BTN_CHOSEN, BTN_NEXT, BTN_BACK
+
+    age_from = rng.randint(18, 45)
+    script = [
+        FakeEvent(user_id, 'Начать'),
+        FakeEvent(user_id, BTN_REGISTRATION),
+        FakeEvent(user_id, BTN_FIND_PAIR),
+        FakeEvent(user_id, rng.choice((BTN_SEX_MAN, BTN_SEX_WOMAN))),
+        FakeEvent(user_id, f'{age_from},{age_from + rng.randint(0, 10)}'),
+        FakeEvent(user_id, 'Москва'),
+    ]
+    for _ in range(max(1, int(rng.expovariate(1 / decisions)))):
+        script.append(FakeEvent(user_id, BTN_LIKE if rng.random() < 0.3 else BTN_DISLIKE))
+    script += [FakeEvent(user_id, BTN_MAIN_MENU), FakeEvent(user_id, BTN_CHOSEN)]
+    script += [FakeEvent(user_id, rng.choice((BTN_NEXT, BTN_NEXT, BTN_BACK)))
+               for _ in range(favorites_steps)]
+    script.append(FakeEvent(user_id, BTN_MAIN_MENU))
+    return script
+
+
+def build_timeline(sessions: int, arrival_rate: float, think_time: float, decisions: int,
+                   favorites_steps: int, seed: int) -> list[tuple[float, int, object]]:
+    """
+    Строит расписание событий всех сеансов.
+
+    :param sessions: int Количество сеансов пользователей.
+    :param arrival_rate: float Интенсивность начала сеансов, сеансов в секунду.
+    :param think_time: float Среднее время между шагами одного пользователя, с.
+    :param decisions: int Среднее количество оценок кандидатов за сеанс.
+    :param favorites_steps: int Количество переходов по избранным.
+    :param seed: int Зерно генератора случайных чисел.
+    :return: list Отсортированный список (время от старта, порядковый номер, событие).
+    """
+    rng = random.Random(seed)
+    timeline = []
+    started = 0.0
+    order = 0
+    for user_id in range(1, sessions + 1):
+        started += rng.expovariate(arrival_rate)
+        at = started
+        for event in session_script(user_id, rng, decisions, favorites_steps):
+            heapq.heappush(timeline, (at, order, event))
+            order += 1
+            at += rng.expovariate(1 / think_time)
+    return [heapq.heappop(timeline) for _ in range(len(timeline))]
+
+
+def produce(timeline: list, events_queue: queue.Queue):
+    """
+    Помещает события в очередь в моменты времени по расписанию.
+
+    :param timeline: list Расписание из `build_timeline`.
+    :param events_queue: queue.Queue Очередь событий бота.
+    """
+    start = perf_counter()
+    for at, _, event in timeline:
+        delay = at - (perf_counter() - start)
+        if delay > 0:
+            sleep(delay)
+        event.arrived = perf_counter()
+        events_queue.put(event)
+    events_queue.put(None)
+
+
+def run_load(args) -> dict:
+    """
+    Запускает нагрузку и формирует отчет.
+
+    :param args: argparse.Namespace Параметры запуска.
+    :return: dict Отчет о прогоне.
+    """
+    from benchmarks.bench_bot import percentile, reset_schema
+    from benchmarks.fake_vk import FakeVKBackend, ScriptFinished, build_bot
+    from database import query_observer
+
+    reset_schema()
+    query_observer.reset()
+    backend = FakeVKBackend(latency=args.vk_latency)
+    events_queue = queue.Queue()
+    longpoll = QueueLongPoll(events_queue)
+    vk_bot, patches = build_bot(backend, longpoll)
+
+    timeline = build_timeline(args.sessions, args.arrival_rate, args.think_time,
+                              args.decisions, args.favorites_steps, args.seed)
+    producer = threading.Thread(target=produce, args=(timeline, events_queue), daemon=True)
+
+    with patches:
+        start = perf_counter()
+        producer.start()
+        try:
+            vk_bot.run()
+        except ScriptFinished:
+            pass
+        elapsed = perf_counter() - start
+    vk_bot.handler.registration_pipeline.shutdown(wait=True)
+
+    events = len(longpoll.latencies)
+    sql_calls = query_observer.total()
+    vk_calls = sum(backend.calls.values())
+    depths = longpoll.depths
+
+    return {
+        'params': vars(args),
+        'events': events,
+        'seconds': round(elapsed, 3),
+        'events_per_sec': round(events / elapsed, 2) if elapsed else 0.0,
+        'queue_depth': {
+            'mean': round(sum(depths) / len(depths), 2) if depths else 0,
+            'p95': percentile(depths, 0.95),
+            'max': max(depths, default=0),
+        },
+        'sql_per_event': round(sql_calls / events, 2) if events else 0.0,
+        'vk_per_event': round(vk_calls / events, 2) if events else 0.0,
+        'vk_calls': dict(backend.calls),
+        'latency_ms': {
+            'p50': round(percentile(longpoll.latencies, 0.50) * 1000, 3),
+            'p95': round(percentile(longpoll.latencies, 0.95) * 1000, 3),
+            'p99': round(percentile(longpoll.latencies, 0.99) * 1000, 3),
+            'max': round(max(longpoll.latencies, default=0) * 1000, 3),
+        },
+    }
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description='Генератор нагрузки для VK бота.')
+    parser.add_argument('--dbname', default='vkbot_load',
+                        help='База данных для прогона (таблицы будут пересозданы).')
+    parser.add_argument('--sessions', type=int, default=1000,
+                        help='Количество сеансов пользователей.')
+    parser.add_argument('--arrival-rate', type=float, default=20.0,
+                        help='Интенсивность начала сеансов, сеансов/с.')
+    parser.add_argument('--think-time', type=float, default=2.0,
+                        help='Среднее время между шагами пользователя, с.')
+    parser.add_argument('--decisions', type=int, default=15,
+                        help='Среднее количество оценок кандидатов за сеанс.')
+    parser.add_argument('--favorites-steps', type=int, default=5)
+    parser.add_argument('--vk-latency', type=float, default=0.05,
+                        help='Искусственная задержка каждого вызова VK, с.')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output', help='Файл для сохранения отчета в JSON.')
+    args = parser.parse_args(argv)
+
+    # Переопределяем базу до импорта config, чтобы бот подключился к базе нагрузочного теста
+    os.environ['DB_NAME'] = args.dbname
+    os.environ['METRICS_PORT'] = '0'
+
+    report = run_load(args)
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as file:
+            json.dump(report, file, ensure_ascii=False, indent=2)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
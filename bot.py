@@ -20,18 +20,29 @@
     2. Используйте метод `run` для запуска бота:
        `bot.run()`
 """
+import json
 import logging
+
+from contextlib import contextmanager
+from time import perf_counter, sleep
+
+# Начало импорта зависимостей (для отчета о времени запуска)
+_IMPORTS_STARTED = perf_counter()
+
+import psycopg2
 import vk_api
 
-from time import sleep
-from database import Database
+from database import Database, query_observer
 from vk_api_service import VKAPI
-from config import config_logging, VK_GROUP_TOKEN
+from config import config_logging, VK_GROUP_TOKEN, METRICS_PORT, PROFILE_DIR
+from metrics import registry, timed, start_metrics_server
 from vk_api.longpoll import VkLongPoll, VkEventType
 from vk_api.keyboard import VkKeyboard, VkKeyboardColor
 from vk_api.utils import get_random_id
 from handler import Handler
-from utils import DatabaseUtils
+from vk_accounting import vk_accounting
+
+IMPORTS_SECONDS = perf_counter() - _IMPORTS_STARTED
 
 # Настройка логирования
 config_logging()
@@ -55,6 +66,12 @@ class VKBot:
     - vk_api: Дополнительный объект API.
     - handler: Объект класса Handler для обработки сообщений и состояний пользователей.
     - user_states: Словарь для хранения состояний пользователей.
+    - profiler: Профайлер процесса, управляемый сигналом SIGUSR1 (переключается в основном цикле)
+      и командами администратора.
+    - startup_timings: Словарь {этап запуска: длительность в секундах}.
+
+        Запуск сделан ленивым: сессия long poll, соединения с базой данных и профайлер
+    создаются при первом обращении, поэтому конструктор не выполняет сетевых запросов.
     """
 
     def __init__(self, vk_group_token: str):
@@ -65,21 +82,74 @@ class VKBot:
 
         Инициализация включает:
         - VkApi для работы с методами VK.
-        - VkLongPoll для отслеживания событий.
-        - Базы данных для хранения и извлечения данных.
+        - Базы данных для хранения и извлечения данных (соединение открывается лениво).
         - Handler для обработки взаимодействий с пользователями.
         - Словарь user_states для хранения состояний пользователей.
-        """
-        self.vk_bot = vk_api.VkApi(token=vk_group_token)
-        self.longpoll = VkLongPoll(self.vk_bot)
-        self.vk = self.vk_bot.get_api()
 
-        self.db = Database()
-        self.vk_api = VKAPI()
-        self.handler = Handler(self)
+        VkLongPoll для отслеживания событий создается при первом обращении к `longpoll`.
+        """
+        self.startup_timings = {'imports': IMPORTS_SECONDS}
+        self.token = vk_group_token
+        with self._startup_stage('vk_session'):
+            self.vk_bot = vk_api.VkApi(token=vk_group_token)
+            self.vk = self.vk_bot.get_api()
+        self._longpoll = None
+        self._profiler = None
+
+        with self._startup_stage('handler'):
+            self.db = Database()
+            self.vk_api = VKAPI()
+            self.handler = Handler(self)
         self.user_states = {}
         logger.info("Бот успешно инициализирован")
 
+    @property
+    def longpoll(self) -> VkLongPoll:
+        """Сессия long poll (создается при первом обращении, это сетевой запрос к VK)."""
+        if self._longpoll is None:
+            with self._startup_stage('longpoll'):
+                self._longpoll = VkLongPoll(self.vk_bot)
+        return self._longpoll
+
+    @longpoll.setter
+    def longpoll(self, value):
+        self._longpoll = value
+
+    @property
+    def profiler(self):
+        """Профайлер процесса (модуль profiling импортируется при первом обращении)."""
+        if self._profiler is None:
+            from profiling import Profiler
+
+            self._profiler = Profiler(PROFILE_DIR)
+        return self._profiler
+
+    @contextmanager
+    def _startup_stage(self, stage: str):
+        """
+        Замеряет длительность этапа запуска и сохраняет ее в `startup_timings`.
+
+        :param stage: str Имя этапа.
+        """
+        start = perf_counter()
+        try:
+            yield
+        finally:
+            duration = perf_counter() - start
+            self.startup_timings[stage] = duration
+            registry.observe(f'startup.{stage}', duration)
+
+    def startup_report(self) -> str:
+        """
+        Возвращает сводку времени запуска по этапам.
+
+        :return: str Строка вида 'Запуск за 123.4 мс: imports 80.1 мс, ...'.
+        """
+        total = sum(self.startup_timings.values())
+        stages = ', '.join(f'{stage} {seconds * 1000:.1f} мс'
+                           for stage, seconds in self.startup_timings.items())
+        return f"Запуск за {total * 1000:.1f} мс: {stages}"
+
     def create_keyboard(self, buttons: list[tuple[str, VkKeyboardColor]] = None,
                         one_time: bool = True) -> VkKeyboard:
         """
@@ -113,8 +183,25 @@ class VKBot:
 
         return keyboard
 
+    def create_carousel(self, elements: list[dict]) -> str:
+        """
+        Создание шаблона-карусели для отправки нескольких карточек в одном сообщении.
+
+        :param elements: Список элементов карусели (не более 10), каждый элемент - словарь
+                         с ключами 'title', 'description', 'action', 'buttons' и,
+                         опционально, 'photo_id'.
+
+        :return: str Шаблон карусели в формате JSON.
+        """
+        # VK требует одинаковую структуру всех элементов карусели
+        if not all(element.get('photo_id') for element in elements):
+            elements = [{key: value for key, value in element.items() if key != 'photo_id'}
+                        for element in elements]
+
+        return json.dumps({'type': 'carousel', 'elements': elements[:10]}, ensure_ascii=False)
+
     def send_message(self, user_id: int, message: str, photo_id_list: list = None,
-                     keyboard: VkKeyboard = None):
+                     keyboard: VkKeyboard = None, template: str = None):
         """
         Отправка сообщения пользователю с опциональной клавиатурой.
 
@@ -135,20 +222,26 @@ class VKBot:
 
         :param keyboard: str Текст сообщения, которое будет отправлено пользователю.
                              Не должно быть пустым.
+
+        :param template: str Шаблон сообщения (например, карусель из `create_carousel`).
         """
         attachment = None
         if photo_id_list:
             attachment = photo_id_list
 
-        self.vk.messages.send(
-            user_id=user_id,
-            message=message,
-            random_id=get_random_id(),
-            keyboard=keyboard.get_keyboard() if keyboard else None,
-            attachment=','.join(attachment) if attachment is not None else None
-        )
-        logger.info(f"Отправлено сообщение пользователю {user_id}: {message}")
-
+        with registry.timer('vk.messages.send'):
+            self._call_vk(
+                'messages.send',
+                user_id=user_id,
+                message=message,
+                random_id=get_random_id(),
+                keyboard=keyboard.get_keyboard() if keyboard else None,
+                attachment=','.join(attachment) if attachment is not None else None,
+                template=template
+            )
+        logger.debug("Отправлено сообщение пользователю %s: %s", user_id, message)
+
+    @timed('bot.get_user_name')
     def get_user_name(self, user_id: int) -> str:
         """
         Получает имя и фамилию пользователя по его user_id.
@@ -156,11 +249,33 @@ class VKBot:
         :param user_id: int Уникальный идентификатор пользователя ВКонтакте.
         :return: str Имя и фамилия пользователя в формате 'Имя Фамилия'.
         """
-        user_info = self.vk.users.get(user_ids=user_id)
+        user_info = self._call_vk('users.get', user_ids=user_id)
         first_name = user_info[0]['first_name']
         last_name = user_info[0]['last_name']
         return f"{first_name} {last_name}"
 
+    def _call_vk(self, method: str, **params):
+        """
+        Вызывает метод VK API сообщества и записывает вызов в учет `vk_accounting`.
+
+        :param method: str Имя метода, например 'messages.send'.
+        :param params: Параметры метода.
+        :return: Ответ метода.
+        """
+        section, name = method.split('.')
+        status, error_code = 200, None
+        start = perf_counter()
+        try:
+            return getattr(getattr(self.vk, section), name)(**params)
+        except vk_api.ApiError as e:
+            error_code = e.code
+            raise
+        except Exception:
+            status = None
+            raise
+        finally:
+            vk_accounting.record(method, perf_counter() - start, status, error_code, self.token)
+
     def set_user_state(self, user_id: int, state: str):
         """
         Устанавливает состояние для пользователя.
@@ -188,10 +303,18 @@ class VKBot:
         функция обрабатывает текст сообщения и отправляет соответствующий ответ.
         """
         flag = 0
-        DatabaseUtils().add_table()
+        reported = False
+        with self._startup_stage('schema'):
+            self.handler.util_db.add_table()
         while True:
             try:
-                for event in self.longpoll.listen():
+                events = self._timed_events(self.longpoll.listen())
+                if not reported:
+                    logger.info(self.startup_report())
+                    reported = True
+                for event in events:
+                    if self._profiler is not None:
+                        self._profiler.run_pending()
                     if flag == 0:
                         logger.info("Бот начал прослушивание событий...")
                         flag = 1
@@ -201,16 +324,51 @@ class VKBot:
                         user_name = self.get_user_name(user_id)
                         state = self.get_user_state(user_id)
 
-                        if state:
-                            self.handler.state_handler(state, event, user_id, user_name, request)
-                        else:
-                            self.handler.message_handler(event, user_name, request)
+                        query_observer.begin_event()
+                        try:
+                            with registry.timer('bot.dispatch'):
+                                if state:
+                                    self.handler.state_handler(state, event, user_id, user_name,
+                                                               request)
+                                else:
+                                    self.handler.message_handler(event, user_name, request)
+                        except psycopg2.Error as e:
+                            # Транзакция обработчика уже откачена; остальные события пакета
+                            # обрабатываются дальше
+                            logger.error(f"Ошибка базы данных при обработке события: {e}",
+                                         exc_info=True)
+                            self.send_message(user_id, 'Не удалось выполнить действие, '
+                                                       'попробуйте еще раз')
+                        finally:
+                            queries = query_observer.end_event()
+                            registry.observe('bot.queries_per_event', sum(queries.values()))
             except Exception as e:
                 logger.error(f'Ошибка основного цикла {e}', exc_info=True)
                 flag = 0
                 sleep(5)
 
+    @staticmethod
+    def _timed_events(events):
+        """
+        Оборачивает поток событий long poll, замеряя время ожидания каждого события.
+
+        :param events: Итератор событий `VkLongPoll.listen()`.
+        :return: Генератор тех же событий.
+        """
+        events = iter(events)
+        while True:
+            with registry.timer('bot.longpoll_receive'):
+                event = next(events, None)
+            if event is None:
+                return
+            yield event
 
 if __name__ == '__main__':
+    from profiling import install_signal_handler
+
+    if METRICS_PORT:
+        registry.add_collector(vk_accounting.collect)
+        start_metrics_server(METRICS_PORT)
     bot = VKBot(VK_GROUP_TOKEN)
+    install_signal_handler(bot.profiler)
     bot.run()
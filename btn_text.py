@@ -21,6 +21,9 @@ btn_text.py
 - buttons_choice: Список кнопок, которые отображаются при выборе действия.
   Включает кнопки "Нравится", "Не нравится" и "Следующий".
 
+- buttons_carousel: Список кнопок под каруселью кандидатов.
+  Включает кнопки "Следующий" и "Главное меню".
+
 Использование:
 --------------
 Импортируйте этот модуль в основной код бота, чтобы получить доступ к
@@ -62,6 +65,10 @@ buttons_choice = [(BTN_LIKE, VkKeyboardColor.POSITIVE),
                   (BTN_MAIN_MENU, VkKeyboardColor.PRIMARY)
                   ]
 
+buttons_carousel = [(BTN_NEXT, VkKeyboardColor.PRIMARY),
+                    (BTN_MAIN_MENU, VkKeyboardColor.POSITIVE)
+                    ]
+
 buttons_choice_sex = [(BTN_SEX_MAN, VkKeyboardColor.PRIMARY),
                       (BTN_SEX_WOMAN, VkKeyboardColor.POSITIVE),
                       (BTN_MAIN_MENU, VkKeyboardColor.PRIMARY)
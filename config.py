@@ -1,5 +1,11 @@
+import atexit
 import os
 import logging
+import queue
+import threading
+
+from logging.handlers import QueueHandler, QueueListener
+from time import monotonic
 from dotenv import load_dotenv
 
 load_dotenv()  # Загружает переменные окружения из файла .env
@@ -10,6 +16,14 @@ DB_USER = os.getenv('DB_USER')
 DB_PASSWORD = os.getenv('DB_PASSWORD')
 DB_HOST = os.getenv('DB_HOST')
 DB_PORT = os.getenv('DB_PORT')
+# Реплики для чтения: строки подключения (DSN) через точку с запятой
+DB_REPLICA_DSNS = [dsn.strip() for dsn in os.getenv('DB_REPLICA_DSNS', '').split(';') if dsn.strip()]
+# Сколько секунд после записи данных пользователя его чтения выполняются на основном сервере
+REPLICA_READ_YOUR_WRITES_SECONDS = float(os.getenv('REPLICA_READ_YOUR_WRITES_SECONDS', 5))
+# На сколько секунд неисправная реплика исключается из чтения
+REPLICA_RETRY_SECONDS = float(os.getenv('REPLICA_RETRY_SECONDS', 30))
+# Количество строк, получаемых за одно обращение при потоковом чтении (серверные курсоры)
+STREAM_BATCH_SIZE = int(os.getenv('STREAM_BATCH_SIZE', 100))
 
 # Токены группы и API VK
 VK_API_TOKEN = os.getenv('VK_API_TOKEN')
@@ -19,19 +33,150 @@ VK_GROUP_TOKEN = os.getenv('VK_GROUP_TOKEN')
 # Версия VK API
 VK_API_VERSION = '5.131'
 
+# Режим просмотра кандидатов: 'single' - по одному, 'carousel' - несколько кандидатов каруселью
+BROWSING_MODE = os.getenv('BROWSING_MODE', 'single')
+# Порт локального HTTP-сервера метрик в формате Prometheus (0 - сервер не запускается)
+METRICS_PORT = int(os.getenv('METRICS_PORT', 9108))
+
+# Порог медленного SQL-запроса в миллисекундах: такие запросы логируются с планом EXPLAIN
+SLOW_QUERY_MS = float(os.getenv('SLOW_QUERY_MS', 200))
+
+# VK ID администраторов бота через запятую (доступ к служебным командам, например /profile)
+ADMIN_IDS = {int(admin_id) for admin_id in os.getenv('ADMIN_IDS', '').split(',') if admin_id.strip()}
+
+# Каталог для результатов профилирования
+PROFILE_DIR = os.getenv('PROFILE_DIR', 'profiles')
+
+# Количество кандидатов в одной карусели (VK допускает не более 10 элементов)
+CAROUSEL_SIZE = min(int(os.getenv('CAROUSEL_SIZE', 5)), 10)
+
+# Сколько найденных кандидатов загружается из базы за один поиск (первая страница выдачи)
+CANDIDATE_PAGE_SIZE = max(int(os.getenv('CANDIDATE_PAGE_SIZE', 20)), CAROUSEL_SIZE, 10)
+
+# Сколько избранных кандидатов загружается за один запрос при просмотре избранного
+FAVORITES_PAGE_SIZE = max(int(os.getenv('FAVORITES_PAGE_SIZE', 5)), 1)
+
+# Файл с отпечатком проверенной схемы базы данных: проверка выполняется один раз на развертывание
+SCHEMA_STAMP_FILE = os.getenv('SCHEMA_STAMP_FILE', '.schema_stamp')
+
+# Количество секций user_candidate по хешу user_id (0 - таблица без секционирования)
+USER_CANDIDATE_PARTITIONS = int(os.getenv('USER_CANDIDATE_PARTITIONS', 16))
+
+# Доля ложноположительных ответов фильтра просмотренных кандидатов и число пользователей в памяти
+SEEN_SET_ERROR_RATE = float(os.getenv('SEEN_SET_ERROR_RATE', 0.01))
+SEEN_SET_MAX_USERS = int(os.getenv('SEEN_SET_MAX_USERS', 1000))
+
+# Перенос холодных оценок в архив (retention.py): срок хранения дизлайков и срок неактивности
+# пользователя в днях, размер пакета, пауза между пакетами и интервал повторного запуска
+RETENTION_DISLIKE_DAYS = int(os.getenv('RETENTION_DISLIKE_DAYS', 180))
+RETENTION_INACTIVE_DAYS = int(os.getenv('RETENTION_INACTIVE_DAYS', 180))
+RETENTION_BATCH_SIZE = int(os.getenv('RETENTION_BATCH_SIZE', 1000))
+RETENTION_PAUSE_SECONDS = float(os.getenv('RETENTION_PAUSE_SECONDS', 1))
+RETENTION_INTERVAL_SECONDS = float(os.getenv('RETENTION_INTERVAL_SECONDS', 6 * 3600))
+# Сколько секунд хранится в кэше отметка "пользователь не зарегистрирован"
+REGISTRATION_NEGATIVE_TTL_SECONDS = float(os.getenv('REGISTRATION_NEGATIVE_TTL_SECONDS', 60))
+# Как часто (в секундах) обновляется время последнего обращения пользователя к боту
+USER_ACTIVITY_TOUCH_SECONDS = float(os.getenv('USER_ACTIVITY_TOUCH_SECONDS', 3600))
+
+# Суточные лимиты методов VK API на один токен (https://dev.vk.com/ru/reference/roadmap)
+VK_DAILY_QUOTAS = {
+    'users.search': int(os.getenv('VK_USERS_SEARCH_DAILY_LIMIT', 1000)),
+}
+# Доля суточного лимита, после которой бот перестает предзагружать кандидатов из VK
+VK_QUOTA_WARNING_RATIO = float(os.getenv('VK_QUOTA_WARNING_RATIO', 0.8))
+
+
+class RateLimitFilter(logging.Filter):
+    """
+        Фильтр, ограничивающий частоту повторяющихся записей лога.
 
-def config_logging(level=logging.INFO):
+        Записи группируются по месту вызова (логгер, файл, строка). Из каждой группы
+    пропускается не более `burst` записей за `interval` секунд; количество подавленных
+    записей добавляется к первой записи следующего интервала.
+        Записи уровня `exempt_level` и выше (по умолчанию ERROR и CRITICAL) не ограничиваются.
+    """
+
+    def __init__(self, burst: int = 20, interval: float = 1.0, exempt_level: int = logging.ERROR):
+        """
+        :param burst: int Максимальное количество записей одной группы за интервал.
+        :param interval: float Длина интервала в секундах.
+        :param exempt_level: int Уровень, начиная с которого записи пропускаются без ограничения.
+        """
+        super().__init__()
+        self.burst = burst
+        self.interval = interval
+        self.exempt_level = exempt_level
+        self._windows = {}
+        self._lock = threading.Lock()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= self.exempt_level:
+            return True
+        key = (record.name, record.pathname, record.lineno)
+        now = monotonic()
+        with self._lock:
+            window = self._windows.get(key)
+            if window is None or now - window[0] >= self.interval:
+                suppressed = window[2] if window else 0
+                self._windows[key] = [now, 1, 0]
+                if suppressed:
+                    # Аргументы подставляются сразу: в сообщении могут быть символы '%'
+                    record.msg = f"{record.getMessage()} (подавлено повторов: {suppressed})"
+                    record.args = None
+                return True
+            if window[1] < self.burst:
+                window[1] += 1
+                return True
+            window[2] += 1
+            return False
+
+
+_log_listener = None
+
+
+def config_logging(level=logging.INFO, burst: int = 20, interval: float = 1.0,
+                   exempt_level: int = logging.ERROR):
     """
         Настройка логирования для приложения.
+
+        Записи помещаются в очередь, а оформление строки (время, модуль, уровень) и вывод
+    выполняет фоновый поток (QueueListener), поэтому логирование не блокирует обработку
+    событий на системных вызовах. Подстановка аргументов в сообщение и текст трассировки
+    исключения формируются в вызывающем потоке (`QueueHandler.prepare`), чтобы в очередь
+    попадало сообщение с аргументами на момент вызова.
+    Повторяющиеся записи ниже уровня `exempt_level` ограничиваются фильтром `RateLimitFilter`.
+
         :param level: Уровень логирования. По умолчанию - INFO.
+        :param burst: Максимальное количество записей из одного места вызова за интервал.
+        :param interval: Длина интервала ограничения в секундах.
+        :param exempt_level: Уровень, начиная с которого записи не ограничиваются.
     """
+    global _log_listener
 
-    logging.basicConfig(
-        level=level,
+    formatter = logging.Formatter(
         datefmt="%Y-%m-%d %H:%M:%S",
-        format="[%(asctime)s.%(msecs)03d] %(module)s:%(lineno)d %(levelname)10s - %(message)s"
-
+        fmt="[%(asctime)s.%(msecs)03d] %(module)s:%(lineno)d %(levelname)10s - %(message)s"
     )
+    stream_handler = logging.StreamHandler()
+    stream_handler.setFormatter(formatter)
+
+    log_queue = queue.SimpleQueue()
+    queue_handler = QueueHandler(log_queue)
+    queue_handler.addFilter(RateLimitFilter(burst, interval, exempt_level))
+
     logger = logging.getLogger()  # Корневой логгер
+    # Повторный вызов заменяет ранее установленный конвейер
+    if _log_listener is not None:
+        atexit.unregister(_log_listener.stop)
+        _log_listener.stop()
+    for handler in logger.handlers[:]:
+        if isinstance(handler, QueueHandler):
+            logger.removeHandler(handler)
+
+    logger.addHandler(queue_handler)
+    _log_listener = QueueListener(log_queue, stream_handler, respect_handler_level=True)
+    _log_listener.start()
+    atexit.register(_log_listener.stop)
+
     logger.setLevel(level)
-    logger.info(f"Текущий уровень логирования: {logger.getEffectiveLevel()}")
+    logger.info("Текущий уровень логирования: %s", logger.getEffectiveLevel())
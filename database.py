@@ -1,46 +1,626 @@
 import psycopg2
 import logging
+import re
+import threading
+
+from collections import Counter
+from contextlib import closing, contextmanager
+from itertools import count
+from contextvars import ContextVar
+from functools import lru_cache
+from time import monotonic, perf_counter
 from psycopg2 import sql
-from config import DB_NAME, DB_USER, DB_PASSWORD, DB_HOST, DB_PORT, config_logging
+from psycopg2.extensions import TRANSACTION_STATUS_IDLE
+from config import DB_NAME, DB_USER, DB_PASSWORD, DB_HOST, DB_PORT, SLOW_QUERY_MS, \
+    DB_REPLICA_DSNS, REPLICA_READ_YOUR_WRITES_SECONDS, REPLICA_RETRY_SECONDS, STREAM_BATCH_SIZE, \
+    config_logging
+from metrics import registry, timed, current_origin
 
 # Настройка логирования
 
 logger = logging.getLogger(__name__)
 
+_LITERAL_RE = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b|%s")
+_LIST_RE = re.compile(r"\(?\?\)?(?:\s*,\s*\(?\?\)?)+")
+_SPACE_RE = re.compile(r"\s+")
+# Запросы, которые только читают данные и не требуют фиксации транзакции
+_READ_ONLY_RE = re.compile(r"^\s*(SELECT|SHOW|EXPLAIN|VALUES|TABLE)\b"
+                           r"(?!.*\bFOR\s+(UPDATE|SHARE)\b)", re.IGNORECASE | re.DOTALL)
+
+# Операторы, для которых PostgreSQL строит план (EXPLAIN); для LOCK, ALTER, SET и т.п. плана нет
+_EXPLAINABLE_RE = re.compile(r"^\s*\(?\s*(SELECT|INSERT|UPDATE|DELETE|WITH|VALUES)\b", re.IGNORECASE)
+
+# Номера именованных (серверных) курсоров потокового чтения
+_stream_ids = count(1)
+
+
+@lru_cache(maxsize=1024)
+def fingerprint(query: str) -> str:
+    """
+    Приводит текст запроса к отпечатку: литералы и параметры заменяются на '?',
+    списки параметров сворачиваются, пробелы нормализуются.
+
+    :param query: str Текст SQL-запроса.
+    :return: str Отпечаток запроса.
+    """
+    text = _LITERAL_RE.sub('?', query)
+    text = _LIST_RE.sub('?+', text)
+    return _SPACE_RE.sub(' ', text).strip()
+
+
+class QueryObserver:
+    """
+        Наблюдатель за SQL-запросами, выполняемыми через `Database`.
+
+        Для каждого запроса записывает отпечаток, длительность, количество строк и
+    обработчик, из которого выполнен запрос (см. `metrics.current_origin`). Считает запросы
+    в рамках события бота (`begin_event`/`end_event`) и предупреждает о повторении одного
+    отпечатка (признак N+1). Запросы дольше `slow_ms` логируются вместе с планом EXPLAIN.
+
+    Атрибуты:
+    - slow_ms: Порог медленного запроса в миллисекундах.
+    - repeat_threshold: Количество повторов одного отпечатка за событие для предупреждения N+1.
+    - stats: Словарь {отпечаток: {'count', 'total_ms', 'max_ms', 'rows', 'origins'}}.
+    """
+
+    def __init__(self, slow_ms: float = SLOW_QUERY_MS, repeat_threshold: int = 5):
+        """
+        :param slow_ms: float Порог медленного запроса в миллисекундах.
+        :param repeat_threshold: int Порог повторов одного отпечатка за событие.
+        """
+        self.slow_ms = slow_ms
+        self.repeat_threshold = repeat_threshold
+        self.stats = {}
+        self._event = ContextVar('query_observer_event', default=None)
+        self._lock = threading.Lock()
+
+    def begin_event(self):
+        """Начинает подсчет запросов для нового события в текущем контексте."""
+        self._event.set(Counter())
+
+    def end_event(self) -> Counter:
+        """
+        Завершает подсчет запросов события.
+
+        :return: Counter {отпечаток: количество выполнений} за событие.
+        """
+        queries = self._event.get() or Counter()
+        self._event.set(None)
+        repeated = {fp: n for fp, n in queries.items() if n >= self.repeat_threshold}
+        if repeated:
+            logger.warning("Возможный N+1 в %s: %s", current_origin.get(), repeated)
+        return queries
+
+    def record(self, query: str, duration: float, rows: int | None) -> str:
+        """
+        Записывает выполненный запрос.
+
+        :param query: str Текст запроса.
+        :param duration: float Длительность в секундах.
+        :param rows: int | None Количество строк, затронутых или возвращенных запросом.
+        :return: str Отпечаток запроса.
+        """
+        query_fp = fingerprint(query)
+        origin = current_origin.get()
+        duration_ms = duration * 1000
+        with self._lock:
+            stat = self.stats.get(query_fp)
+            if stat is None:
+                stat = self.stats[query_fp] = {'count': 0, 'total_ms': 0.0, 'max_ms': 0.0,
+                                               'rows': 0, 'origins': Counter()}
+            stat['count'] += 1
+            stat['total_ms'] += duration_ms
+            stat['max_ms'] = max(stat['max_ms'], duration_ms)
+            stat['rows'] += rows or 0
+            stat['origins'][origin] += 1
+
+        queries = self._event.get()
+        if queries is not None:
+            queries[query_fp] += 1
+        logger.debug("SQL %.2f мс, строк %s, %s: %s", duration_ms, rows, origin, query_fp)
+        return query_fp
+
+    def total(self) -> int:
+        """Возвращает общее количество записанных запросов."""
+        with self._lock:
+            return sum(stat['count'] for stat in self.stats.values())
+
+    def reset(self):
+        """Очищает накопленную статистику запросов."""
+        with self._lock:
+            self.stats = {}
+
+    def is_slow(self, duration: float) -> bool:
+        """Проверяет, превышает ли длительность порог медленного запроса."""
+        return duration * 1000 >= self.slow_ms
+
+    def top(self, n: int = 10, key: str = 'total_ms') -> list[tuple[str, dict]]:
+        """
+        Возвращает самые "дорогие" отпечатки запросов.
+
+        :param n: int Количество отпечатков.
+        :param key: str Поле для сортировки ('total_ms', 'count', 'max_ms', 'rows').
+        :return: list[tuple[str, dict]] Отпечатки и их статистика.
+        """
+        with self._lock:
+            return sorted(self.stats.items(), key=lambda item: item[1][key], reverse=True)[:n]
+
+
+# Общий наблюдатель запросов процесса
+query_observer = QueryObserver()
+
+
+class RecentWrites:
+    """
+        Время последних записей в базу по ключам (например, VK ID пользователя).
+
+        Пока с момента записи не прошло `window` секунд, чтения для этого ключа выполняются
+    на основном сервере, а не на реплике, чтобы пользователь видел свои изменения
+    (read-your-writes) несмотря на отставание репликации.
+    """
+
+    def __init__(self, window: float = REPLICA_READ_YOUR_WRITES_SECONDS, maxsize: int = 100_000):
+        """
+        :param window: float Длительность окна read-your-writes в секундах.
+        :param maxsize: int Количество ключей, после которого удаляются устаревшие записи.
+        """
+        self.window = window
+        self.maxsize = maxsize
+        self._writes = {}
+        self._lock = threading.Lock()
+
+    def mark(self, key):
+        """
+        Отмечает запись для ключа.
+
+        :param key: Ключ, например VK ID пользователя.
+        """
+        now = monotonic()
+        with self._lock:
+            self._writes[key] = now
+            if len(self._writes) > self.maxsize:
+                self._writes = {k: t for k, t in self._writes.items() if now - t < self.window}
+
+    def is_recent(self, key) -> bool:
+        """
+        Проверяет, была ли запись для ключа в пределах окна.
+
+        :param key: Ключ, например VK ID пользователя.
+        """
+        written = self._writes.get(key)
+        return written is not None and monotonic() - written < self.window
+
+
+# Общие для процесса записи, требующие чтения с основного сервера
+recent_writes = RecentWrites()
+
+
+class ReplicaPool:
+    """
+        Набор реплик для чтения с выбором по кругу (round-robin).
+
+        Соединения с репликами открываются лениво в режиме только чтения с autocommit.
+    Реплика, на которой произошла ошибка соединения, исключается из выбора на
+    `retry_after` секунд.
+    """
+
+    def __init__(self, dsns: list[str], retry_after: float = REPLICA_RETRY_SECONDS):
+        """
+        :param dsns: list[str] Строки подключения к репликам.
+        :param retry_after: float Время в секундах, на которое исключается неисправная реплика.
+        """
+        self.dsns = list(dsns)
+        self.retry_after = retry_after
+        self._connections = [None] * len(self.dsns)
+        self._down_until = [0.0] * len(self.dsns)
+        self._next = 0
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """
+        Возвращает соединение со следующей исправной репликой.
+
+        :return: tuple (номер реплики, соединение) или None, если исправных реплик нет.
+        """
+        with self._lock:
+            for _ in range(len(self.dsns)):
+                index = self._next
+                self._next = (self._next + 1) % len(self.dsns)
+                if self._down_until[index] > monotonic():
+                    continue
+                conn = self._connections[index]
+                if conn is None or conn.closed:
+                    try:
+                        conn = psycopg2.connect(self.dsns[index])
+                        conn.set_session(readonly=True, autocommit=True)
+                    except psycopg2.OperationalError as e:
+                        self._mark_down(index, e)
+                        continue
+                    self._connections[index] = conn
+                return index, conn
+        return None
+
+    def mark_down(self, index: int, error: Exception):
+        """
+        Исключает реплику из выбора на `retry_after` секунд.
+
+        :param index: int Номер реплики.
+        :param error: Exception Ошибка, из-за которой реплика исключается.
+        """
+        with self._lock:
+            self._mark_down(index, error)
+
+    def _mark_down(self, index: int, error: Exception):
+        conn = self._connections[index]
+        self._connections[index] = None
+        if conn is not None:
+            try:
+                conn.close()
+            except psycopg2.Error:
+                pass
+        self._down_until[index] = monotonic() + self.retry_after
+        logger.warning(f"Реплика #{index} недоступна, чтение переключено: {error}")
+
+    def close(self):
+        """Закрывает соединения с репликами."""
+        with self._lock:
+            for conn in self._connections:
+                if conn is not None:
+                    conn.close()
+            self._connections = [None] * len(self.dsns)
+
 
 class Database:
     """
     Класс для управления подключением и операциями с базой данных.
+
+        Вне `transaction` каждая запись (insert_data, update_data, delete_data, execute_query)
+    фиксируется сразу. Внутри `transaction` записи накапливаются и фиксируются одним COMMIT
+    при выходе из блока. Читающие запросы транзакцию не фиксируют.
     """
 
     def __init__(self, dbname=DB_NAME, user=DB_USER, password=DB_PASSWORD,
-                 host=DB_HOST, port=DB_PORT):
+                 host=DB_HOST, port=DB_PORT, replicas: list[str] = None):
         """
-            Инициализация соединения с базой данных.
+            Инициализация параметров соединения с базой данных.
+
+            Соединение открывается лениво, при первом обращении к `conn` или `cur`, поэтому
+        создание объекта не обращается к серверу базы данных.
 
             :param dbname: Имя базы данных.
             :param user: Имя пользователя базы данных.
             :param password: Пароль пользователя базы данных.
             :param host: Хост базы данных (по умолчанию 'localhost').
             :param port: Порт базы данных (по умолчанию 5432).
+            :param replicas: Строки подключения к репликам для чтения
+                             (по умолчанию DB_REPLICA_DSNS из конфигурации).
         """
-        self.conn = None
-        self.cur = None
+        self.dbname = dbname
+        self._connect_params = {'dbname': dbname, 'user': user, 'password': password,
+                                'host': host, 'port': port}
+        self._conn = None
+        self._cur = None
+        self._tx_depth = 0
+        self._tx_failed = False
+        self._on_commit = []
+        replicas = DB_REPLICA_DSNS if replicas is None else replicas
+        self.replicas = ReplicaPool(replicas) if replicas else None
+
+    def _connect(self):
+        """Открывает соединение с базой данных и курсор."""
         try:
-            self.conn = psycopg2.connect(dbname=dbname, user=user,
-                                         password=password, host=host, port=port)
-            self.cur = self.conn.cursor()
-            logger.info(f"Соединение с {dbname} успешно")
+            with registry.timer('db.connect'):
+                self._conn = psycopg2.connect(**self._connect_params)
+            self._cur = self._conn.cursor()
+            logger.info(f"Соединение с {self.dbname} успешно")
         except psycopg2.OperationalError:
-            logger.error(f"Ошибка подключения к {dbname}")
+            logger.error(f"Ошибка подключения к {self.dbname}")
+
+    @property
+    def conn(self):
+        """Соединение с базой данных (открывается при первом обращении)."""
+        if self._conn is None:
+            self._connect()
+        return self._conn
+
+    @conn.setter
+    def conn(self, value):
+        self._conn = value
+
+    @property
+    def cur(self):
+        """Курсор соединения (открывается при первом обращении)."""
+        if self._cur is None and self.conn is not None:
+            self._cur = self._conn.cursor()
+        return self._cur
+
+    @cur.setter
+    def cur(self, value):
+        self._cur = value
+
+    @contextmanager
+    def transaction(self):
+        """
+        Группирует операции блока в одну транзакцию (unit of work).
+
+            Операции внутри блока не фиксируются по отдельности: при выходе из блока
+        выполняется один COMMIT. Если в блоке возникло исключение, транзакция откатывается
+        целиком. Ошибка базы данных внутри блока не заменяется результатом []/None/False,
+        как вне блока, а передается из операции (см. `_rollback`): после нее каждый следующий
+        запрос транзакции завершился бы InFailedSqlTransaction. Вложенные блоки входят во
+        внешнюю транзакцию.
+
+        Пример:
+            with db.transaction():
+                db.insert_data('user_candidate', data)
+                db.update_data('users', {'name': name}, 'id = %s', (user_id,))
+        """
+        self._tx_depth += 1
+        try:
+            yield self
+        except Exception:
+            self._tx_failed = True
+            raise
+        finally:
+            self._tx_depth -= 1
+            if self._tx_depth == 0:
+                failed, self._tx_failed = self._tx_failed, False
+                callbacks, self._on_commit = self._on_commit, []
+                self._finish_transaction(failed)
+                if not failed:
+                    for callback in callbacks:
+                        callback()
+
+    def on_commit(self, callback):
+        """
+        Вызывает `callback` после фиксации текущей транзакции.
+
+            Внутри `transaction` вызов откладывается до успешного COMMIT при выходе из блока;
+        при откате транзакции `callback` не вызывается. Вне `transaction` изменения уже
+        зафиксированы, и `callback` вызывается сразу.
+
+        :param callback: Функция без аргументов (например, обновление кэша процесса).
+        """
+        if self._tx_depth:
+            self._on_commit.append(callback)
+        else:
+            callback()
+
+    def _finish_transaction(self, failed: bool):
+        """
+        Завершает транзакцию блока `transaction`.
+
+        Если в блоке не выполнялось запросов (соединение не открыто или транзакция
+        не начата), COMMIT не отправляется.
+
+        :param failed: bool Откатить транзакцию вместо фиксации.
+        """
+        conn = self._conn
+        if conn is None or conn.get_transaction_status() == TRANSACTION_STATUS_IDLE:
+            return
+        if failed:
+            logger.warning("Транзакция откатывается из-за ошибки")
+            conn.rollback()
+        else:
+            conn.commit()
+
+    def _commit(self):
+        """Фиксирует изменения, если вызов выполняется вне `transaction`."""
+        if not self._tx_depth:
+            self.conn.commit()
+
+    def _rollback(self):
+        """
+        Откатывает транзакцию после ошибки базы данных; вызывается из блока except.
+
+        Внутри `transaction` обрабатываемая ошибка передается дальше: блок прерывается,
+        и транзакция откатывается при выходе из него.
+        """
+        if self._tx_depth:
+            self._tx_failed = True
+            raise
+        self.conn.rollback()
+
+    def _execute(self, query, params=None, conn=None, cursor=None):
+        """
+        Выполняет запрос на курсоре соединения и передает сведения о нем `query_observer`.
+
+        :param query: Запрос (строка или объект psycopg2.sql).
+        :param params: Параметры запроса.
+        :param conn: Соединение (по умолчанию основное).
+        :param cursor: Курсор соединения `conn` (по умолчанию курсор основного соединения).
+        """
+        conn = self.conn if conn is None else conn
+        cursor = self.cur if cursor is None else cursor
+        start = perf_counter()
+        cursor.execute(query, params)
+        duration = perf_counter() - start
+
+        rows = cursor.rowcount if isinstance(cursor.rowcount, int) else None
+        text = self._query_text(query, conn)
+        query_fp = query_observer.record(text, duration, rows)
+        if query_observer.is_slow(duration):
+            logger.warning("Медленный запрос %.2f мс (%s): %s\n%s", duration * 1000,
+                           current_origin.get(), query_fp, self._explain(query, params, conn))
+
+    def _fetch_all(self, query, params=None, use_replica: bool = False, user_key=None) -> list:
+        """
+        Выполняет читающий запрос и возвращает все строки результата.
+
+            При `use_replica` запрос отправляется на реплику, если они настроены и для
+        `user_key` не было записей в пределах окна read-your-writes (см. `recent_writes`).
+        При ошибке соединения с репликой она исключается из выбора, а запрос повторяется
+        на основном сервере.
+
+        :param query: Запрос (строка или объект psycopg2.sql).
+        :param params: Параметры запроса.
+        :param use_replica: bool Разрешить выполнение на реплике.
+        :param user_key: Ключ пользователя для проверки read-your-writes (например, VK ID).
+        :return: list Строки результата.
+        """
+        replica = self._replica_for(use_replica, user_key)
+        if replica is not None:
+            index, conn = replica
+            try:
+                with conn.cursor() as cursor:
+                    self._execute(query, params, conn, cursor)
+                    return cursor.fetchall()
+            except (psycopg2.OperationalError, psycopg2.InterfaceError) as e:
+                self.replicas.mark_down(index, e)
+
+        self._execute(query, params)
+        return self.cur.fetchall()
+
+    def _replica_for(self, use_replica: bool, user_key=None):
+        """
+        Выбирает реплику для читающего запроса.
+
+        :param use_replica: bool Разрешить выполнение на реплике.
+        :param user_key: Ключ пользователя для проверки read-your-writes.
+        :return: tuple (номер реплики, соединение) или None, если читать нужно с основного сервера.
+        """
+        if not use_replica or self.replicas is None:
+            return None
+        if user_key is not None and recent_writes.is_recent(user_key):
+            return None
+        return self.replicas.acquire()
+
+    def _stream(self, query, params=None, batch_size: int = STREAM_BATCH_SIZE,
+                use_replica: bool = False, user_key=None):
+        """
+        Выполняет читающий запрос на именованном (серверном) курсоре и возвращает строки
+        по мере чтения пакетами по `batch_size`.
+
+            Результат не загружается в память целиком: если вызывающий код прекращает
+        итерацию (например, взял только первую страницу), курсор закрывается, и остальные
+        строки не передаются. Курсор открывается WITH HOLD, поэтому остается действительным,
+        даже если между пакетами на том же соединении фиксируется транзакция.
+            Ошибка чтения не прерывает итерацию молча, а передается вызывающему коду. Если
+        соединение с репликой потеряно до передачи первой строки, реплика исключается из выбора,
+        а запрос повторяется на основном сервере; после переданных строк ошибка передается
+        дальше, чтобы результат не оказался усеченным или с повторами. Откатывается только
+        транзакция основного сервера и только при ошибке на нем: реплики работают в autocommit.
+
+        :param query: Запрос (строка или объект psycopg2.sql).
+        :param params: Параметры запроса.
+        :param batch_size: int Количество строк, получаемых с сервера за одно обращение.
+        :param use_replica: bool Разрешить выполнение на реплике.
+        :param user_key: Ключ пользователя для проверки read-your-writes.
+        :return: Генератор строк результата.
+        """
+        replica = self._replica_for(use_replica, user_key)
+        if replica is not None:
+            index, conn = replica
+            sent = 0
+            try:
+                with closing(self._read_stream(conn, query, params, batch_size)) as rows:
+                    for row in rows:
+                        sent += 1
+                        yield row
+                return
+            except (psycopg2.OperationalError, psycopg2.InterfaceError) as e:
+                self.replicas.mark_down(index, e)
+                if sent:
+                    logger.error(f"Потоковое чтение с реплики #{index} прервано: {e}")
+                    raise
+            except psycopg2.DatabaseError as e:
+                logger.error(f"Ошибка при потоковом чтении с реплики #{index}: {e}")
+                raise
+
+        try:
+            yield from self._read_stream(self.conn, query, params, batch_size)
+        except psycopg2.DatabaseError as e:
+            logger.error(f"Ошибка при потоковом чтении: {e}")
+            self._rollback()
+            raise
+
+    def _read_stream(self, conn, query, params, batch_size: int):
+        """Открывает именованный курсор на соединении `conn` и возвращает его строки пакетами."""
+        with self._open_stream(conn, query, params, batch_size) as cursor:
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    return
+                yield from rows
+
+    def _open_stream(self, conn, query, params, batch_size: int):
+        """Открывает именованный курсор на соединении `conn` и выполняет запрос."""
+        cursor = conn.cursor(name=f'stream_{next(_stream_ids)}', withhold=True)
+        cursor.itersize = batch_size
+        try:
+            self._execute(query, params, conn, cursor)
+        except psycopg2.Error:
+            cursor.close()
+            raise
+        return cursor
+
+    def note_write(self, user_key):
+        """
+        Отмечает запись данных пользователя: его чтения временно выполняются на основном
+        сервере (read-your-writes).
+
+        :param user_key: Ключ пользователя, например VK ID.
+        """
+        recent_writes.mark(user_key)
+
+    def _query_text(self, query, conn=None) -> str:
+        """Возвращает текст запроса, в том числе для объектов psycopg2.sql."""
+        if isinstance(query, sql.Composable):
+            try:
+                return query.as_string(self.conn if conn is None else conn)
+            except (psycopg2.Error, TypeError, AttributeError):
+                return repr(query)
+        return query
+
+    def _explain(self, query, params, conn=None) -> str:
+        """
+        Возвращает план выполнения запроса (EXPLAIN без выполнения самого запроса).
+
+        План получается на отдельном курсоре, чтобы не потерять результат основного запроса.
+        Строится только для операторов, у которых есть план (SELECT, INSERT, UPDATE, DELETE,
+        WITH, VALUES). Вне autocommit EXPLAIN выполняется под точкой сохранения: его ошибка
+        откатывается до нее и не прерывает транзакцию вызывающего кода.
+
+        :param query: Запрос (строка или объект psycopg2.sql).
+        :param params: Параметры запроса.
+        :param conn: Соединение, на котором выполнялся запрос (по умолчанию основное).
+        :return: str План запроса или описание ошибки.
+        """
+        conn = self.conn if conn is None else conn
+        if not _EXPLAINABLE_RE.match(self._query_text(query, conn)):
+            return "EXPLAIN недоступен для этого оператора"
+        if isinstance(query, sql.Composable):
+            query = sql.SQL('EXPLAIN ') + query
+        else:
+            query = 'EXPLAIN ' + query
+        savepoint = not conn.autocommit
+        try:
+            with conn.cursor() as cursor:
+                if savepoint:
+                    cursor.execute("SAVEPOINT query_observer_explain")
+                try:
+                    cursor.execute(query, params)
+                    plan = '\n'.join(row[0] for row in cursor.fetchall())
+                except psycopg2.Error as e:
+                    if savepoint:
+                        cursor.execute("ROLLBACK TO SAVEPOINT query_observer_explain")
+                    return f"EXPLAIN недоступен: {e}"
+                if savepoint:
+                    cursor.execute("RELEASE SAVEPOINT query_observer_explain")
+                return plan
+        except psycopg2.Error as e:
+            return f"EXPLAIN недоступен: {e}"
 
     def __del__(self):
         """Закрытие соединения и курсора при уничтожении объекта."""
-        if self.cur:
-            self.cur.close()
-        if self.conn:
-            self.conn.close()
-
+        if self._cur:
+            self._cur.close()
+        if self._conn:
+            self._conn.close()
+        if self.replicas is not None:
+            self.replicas.close()
+
+    @timed('db.create_table')
     def create_table(self, table_name: str, columns: list | tuple):
         """
         Создание таблицы в базе данных.
@@ -64,11 +644,12 @@ class Database:
                 columns_str = ', '.join(f'{col[0]} {col[1]}' for col in columns)
                 query = sql.SQL(f"CREATE TABLE IF NOT EXISTS {table_name} ({columns_str})")
                 self.cur.execute(query)
-                self.conn.commit()
+                self._commit()
                 logger.info(f"Таблица {table_name} успешно создана")
         except psycopg2.DatabaseError as e:
             logger.error(f"Ошибка при создании таблицы {table_name}: {e}")
 
+    @timed('db.drop_table')
     def drop_table(self, table_name: str):
         """
         Удаление таблицы из базы данных.
@@ -78,19 +659,23 @@ class Database:
         try:
             query = sql.SQL(f"DROP TABLE IF EXISTS {table_name}")
             self.cur.execute(query)
-            self.conn.commit()
+            self._commit()
             logger.info(f'Таблица успешно удалена {table_name}')
         except psycopg2.DatabaseError as e:
             logger.error(f"Ошибка при удалении таблицы {table_name}: {e}")
 
-    def insert_data(self, table_name: str, data: dict):
+    @timed('db.insert_data')
+    def insert_data(self, table_name: str, data: dict, conflict_target: str = None):
         """
         Вставка данных в таблицу.
 
         :param table_name: Имя таблицы.
         :param data: Словарь с данными для вставки
         в формате {'column1': value1, 'column2': value2, ...}.
-        :return: ID вставленной записи.
+        :param conflict_target: Необязательный параметр. Уникальный столбец (например, 'vk_id').
+        Если указан, при конфликте существующая запись обновляется данными из `data`,
+        что делает повторную вставку идемпотентной.
+        :return: ID вставленной (или обновленной) записи.
         """
         try:
             columns = data.keys()
@@ -100,23 +685,34 @@ class Database:
                 if isinstance(value, list):
                     values[i] = '{' + ','.join(f'"{v}"' for v in value) + '}'
 
+            on_conflict = ''
+            if conflict_target:
+                updates = [f"{col} = EXCLUDED.{col}" for col in columns if col != conflict_target]
+                updates = updates or [f"{conflict_target} = EXCLUDED.{conflict_target}"]
+                on_conflict = f" ON CONFLICT ({conflict_target}) DO UPDATE SET {', '.join(updates)}"
+
             query = sql.SQL(
                 f"INSERT INTO {table_name} ({', '.join(columns)})"
-                f" VALUES ({', '.join(['%s'] * len(values))}) RETURNING id"
+                f" VALUES ({', '.join(['%s'] * len(values))}){on_conflict} RETURNING id"
             )
 
-            self.cur.execute(query, values)
+            self._execute(query, values)
             inserted_id = self.cur.fetchone()[0]
-            self.conn.commit()
-            logger.info(f'Данные {data} в таблицу {table_name} успешно добавлены')
+            self._commit()
+            logger.debug('Данные %s в таблицу %s успешно добавлены', data, table_name)
             return inserted_id
 
         except psycopg2.DatabaseError as e:
             logger.error(f"Ошибка при вставке данных в таблицу {table_name}: {e}")
+            self._rollback()
             return None
 
+    @timed('db.select_data')
     def select_data(self, table_name, columns: str = '*',
-                    condition: str = None, values: tuple = None):
+                    condition: str = None, values: tuple = None,
+                    use_replica: bool = False, user_key=None,
+                    stream: bool = False, batch_size: int = STREAM_BATCH_SIZE,
+                    none_on_error: bool = False):
         """
         Выполнение SELECT-запроса.
 
@@ -124,20 +720,48 @@ class Database:
         :param columns: Список столбцов для выборки, по умолчанию '*' - все столбцы.
         :param condition: Условие WHERE для фильтрации данных, строка SQL.
         :param values: Значения для подстановки в условие WHERE, кортеж.
-        :return: Список кортежей с данными.
+        :param use_replica: Разрешить выполнение на реплике для чтения (см. `_fetch_all`).
+        :param user_key: Ключ пользователя для проверки read-your-writes.
+        :param stream: Вернуть генератор строк, читаемых с серверного курсора пакетами
+                       (см. `_stream`), вместо списка. Ошибки чтения передаются при итерации.
+        :param batch_size: Размер пакета при потоковом чтении.
+        :param none_on_error: Вернуть None при ошибке запроса вместо пустого списка, чтобы
+                              отличить ошибку от пустого результата.
+        :return: Список кортежей с данными (или генератор кортежей при `stream`).
         """
         try:
             columns_str = ', '.join(columns) if isinstance(columns, list) else columns
             query = sql.SQL(f"SELECT {columns_str} FROM {table_name}")
             if condition:
                 query += sql.SQL(f" WHERE {condition}")
-            self.cur.execute(query, values)
-            rows = self.cur.fetchall()
-            return rows
+            if stream:
+                return self._stream(query, values, batch_size, use_replica, user_key)
+            return self._fetch_all(query, values, use_replica, user_key)
         except psycopg2.DatabaseError as e:
             logger.error(f"Ошибка при выполнении SELECT из таблицы {table_name}: {e}")
-            return []
+            self._rollback()
+            return None if none_on_error else []
+
+    @timed('db.select_query')
+    def select_query(self, query: str, params: tuple = None, use_replica: bool = False,
+                     user_key=None) -> list | None:
+        """
+        Выполнение произвольного читающего SQL-запроса.
 
+        :param query: Строка SQL-запроса.
+        :param params: Параметры для вставки в запрос (опционально).
+        :param use_replica: Разрешить выполнение на реплике для чтения (см. `_fetch_all`).
+        :param user_key: Ключ пользователя для проверки read-your-writes.
+        :return: Список кортежей с данными или None при ошибке.
+        """
+        try:
+            return self._fetch_all(query, params, use_replica, user_key)
+        except psycopg2.DatabaseError as e:
+            logger.error(f"Ошибка при выполнении запроса: {e}")
+            self._rollback()
+            return None
+
+    @timed('db.update_data')
     def update_data(self, table_name: str, data: dict, condition: str, values: tuple = None):
         """
         Обновление данных в таблице.
@@ -169,14 +793,16 @@ class Database:
             if values:
                 query_values.extend(values)
 
-            self.cur.execute(query, query_values)
-            self.conn.commit()
-            logger.info(f'Обновление в таблице {table_name} прошло успешно')
+            self._execute(query, query_values)
+            self._commit()
+            logger.debug('Обновление в таблице %s прошло успешно', table_name)
             return True
         except psycopg2.DatabaseError as e:
             logger.error(f"Ошибка при обновлении данных в таблице {table_name}: {e}")
+            self._rollback()
             return False
 
+    @timed('db.delete_data')
     def delete_data(self, table_name: str, condition: str = None, values: tuple = None) -> bool:
         """
         Выполнение DELETE-запроса.
@@ -190,14 +816,15 @@ class Database:
             query = sql.SQL(f"DELETE FROM {table_name}")
             if condition:
                 query += sql.SQL(f" WHERE {condition}")
-            self.cur.execute(query, values)
-            self.conn.commit()
+            self._execute(query, values)
+            self._commit()
             return True
         except psycopg2.DatabaseError as e:
             logger.error(f"Ошибка при удалении данных из таблицы {table_name}: {e}")
-            self.conn.rollback()
+            self._rollback()
             return False
 
+    @timed('db.execute_query')
     def execute_query(self, query: str, params: tuple = None, fetch: bool = False):
         """
         Выполнение произвольного SQL-запроса.
@@ -206,17 +833,21 @@ class Database:
         :param params: Параметры для вставки в запрос (опционально).
         :param fetch: Если True, будет выполнен fetchall() для получения данных.
 
+            Читающие запросы (SELECT, SHOW, EXPLAIN без FOR UPDATE/SHARE) не фиксируются,
+        остальные фиксируются сразу или при выходе из `transaction`.
+
         :return: Список кортежей с данными, если fetch=True. Иначе None.
         """
         try:
-            self.cur.execute(query, params)
-            self.conn.commit()
+            self._execute(query, params)
+            if not (isinstance(query, str) and _READ_ONLY_RE.match(query)):
+                self._commit()
             if fetch:
                 return self.cur.fetchall()
-            logger.info(f'Запрос успешно выполнен: {query}')
+            logger.debug('Запрос успешно выполнен: %s', query)
         except psycopg2.DatabaseError as e:
             logger.error(f"Ошибка при выполнении запроса: {e}")
-            self.conn.rollback()
+            self._rollback()
             return None
 
 
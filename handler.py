@@ -12,6 +12,7 @@
         и создания клавиатур.
     - messag_handler: Обрабатывает текстовые сообщения от пользователей.
     - state_handler: Управляет сообщениями, связанными с состояниями пользователей.
+    - Обработчики переходов регистрируются в таблице `Router` (см. router.py).
 
 Пример использования:
     1. Создайте экземпляр класса Handler, передав объект VKBot:
@@ -23,15 +24,38 @@
     3. Используйте метод `state_handler` для обработки текущего состояния пользователя:
        `handler.state_handler(state, event, user_id, user_name, request)`
 """
+import json
 import logging
 from btn_text import BTN_FIND_PAIR, buttons_regist, buttons_start, \
     buttons_choice, WELCOME_MESSAGE, BTN_REGISTRATION, \
     buttons_choice_sex, BTN_SEX_MAN, BTN_LIKE, BTN_HELP, HELP_MESSAGE, BTN_DISLIKE, BTN_MAIN_MENU, BTN_CHOSEN, \
-    buttons_favorites, BTN_NEXT, BTN_BACK, BTN_REMOVE_FAVORITES, buttons_favorites_next, buttons_favorites_back
+    buttons_favorites, BTN_NEXT, BTN_BACK, BTN_REMOVE_FAVORITES, buttons_favorites_next, buttons_favorites_back, \
+    buttons_carousel
+from config import BROWSING_MODE, CAROUSEL_SIZE, ADMIN_IDS
+from registration import RegistrationPipeline
+from router import Router, normalize_text
 from utils import DatabaseUtils, AuxiliaryUtils
 
 logger = logging.getLogger(__name__)
 
+# Состояния пользователя
+STATE_WAITING_FOR_SEX = 'waiting_for_sex'
+STATE_WAITING_FOR_AGE = 'waiting_for_age'
+STATE_WAITING_FOR_CITY = 'waiting_for_city'
+STATE_WAITING_FOR_LIKE_DISLIKE = 'waiting_for_like_dislike'
+STATE_WAITING_FOR_FAVORITE = 'waiting_for_favorite'
+STATE_WAITING_FOR_CAROUSEL = 'waiting_for_carousel'
+
+# Служебные команды
+CMD_START = 'начать'
+CMD_SHOW = 'show'
+CMD_PROFILE_START = '/profile start'
+CMD_PROFILE_START_SAMPLING = '/profile start sampling'
+CMD_PROFILE_STOP = '/profile stop'
+CMD_PROFILE_MEMORY = '/profile memory'
+
+BTN_SEX_MAN_NORMALIZED = normalize_text(BTN_SEX_MAN)
+
 
 class Handler:
     """
@@ -60,14 +84,75 @@ class Handler:
             (например, стадия взаимодействия).
             - self.user_candidate_data: Словарь для хранения данных о кандидатах и их статусах
             для каждого пользователя.
+            - self.router: Таблица переходов конечного автомата диалога.
+            - self.registration_pipeline: Фоновый конвейер регистрации пользователей.
+            - self.browsing_mode: Режим просмотра кандидатов ('single' или 'carousel').
+            - self.carousel_pending: Словарь {VK ID пользователя: {ID кандидата: кандидат}}
+            с кандидатами из последней карусели, которые пользователь еще не оценил.
+            - self.carousel_skipped: Словарь {VK ID пользователя: множество ID кандидатов},
+            пропущенных без оценки в текущем сеансе просмотра карусели.
         """
         self.vk_bot = vk_bot
         self.send_message = vk_bot.send_message
         self.create_keyboard = vk_bot.create_keyboard
         self.util_db = DatabaseUtils()
-        self.utils_auxiliary = AuxiliaryUtils()
+        self.utils_auxiliary = AuxiliaryUtils(self.util_db)
         self.user_data = {}
         self.user_candidate_data = {}
+        self.router = self._build_router()
+        self.registration_pipeline = RegistrationPipeline(self._on_registration_complete)
+        self.browsing_mode = BROWSING_MODE
+        self.carousel_pending = {}
+        self.carousel_skipped = {}
+
+    def _build_router(self) -> Router:
+        """
+        Заполняет таблицу переходов конечного автомата диалога.
+
+        Обработчики сообщений без состояния принимают (event, user_name, request, is_user_in_db),
+        обработчики состояний - (event, user_id, user_name, request).
+
+        :return: Router Заполненный маршрутизатор.
+        """
+        router = Router()
+
+        router.add(None, CMD_START, self._on_start)
+        router.add(None, BTN_HELP, self._on_help)
+        router.add(None, BTN_REGISTRATION, self._on_registration)
+        router.add(None, BTN_FIND_PAIR, self._on_find_pair)
+        router.add(None, CMD_SHOW, self._on_show)
+        router.add(None, BTN_CHOSEN, self._on_favorites)
+        router.add(None, CMD_PROFILE_START, self._on_profile)
+        router.add(None, CMD_PROFILE_START_SAMPLING, self._on_profile)
+        router.add(None, CMD_PROFILE_STOP, self._on_profile)
+        router.add(None, CMD_PROFILE_MEMORY, self._on_profile)
+        router.set_default(None, self._on_unknown)
+
+        router.add(STATE_WAITING_FOR_SEX, BTN_MAIN_MENU, self._on_main_menu)
+        router.set_default(STATE_WAITING_FOR_SEX, self._on_sex)
+
+        router.set_default(STATE_WAITING_FOR_AGE, self._on_age)
+
+        router.set_default(STATE_WAITING_FOR_CITY, self._on_city)
+
+        router.add(STATE_WAITING_FOR_LIKE_DISLIKE, BTN_LIKE, self._on_like)
+        router.add(STATE_WAITING_FOR_LIKE_DISLIKE, BTN_DISLIKE, self._on_dislike)
+        router.add(STATE_WAITING_FOR_LIKE_DISLIKE, BTN_MAIN_MENU, self._on_main_menu)
+        router.set_default(STATE_WAITING_FOR_LIKE_DISLIKE, self._on_unexpected)
+
+        router.add(STATE_WAITING_FOR_FAVORITE, BTN_NEXT, self._on_favorite_next)
+        router.add(STATE_WAITING_FOR_FAVORITE, BTN_BACK, self._on_favorite_back)
+        router.add(STATE_WAITING_FOR_FAVORITE, BTN_REMOVE_FAVORITES, self._on_favorite_remove)
+        router.add(STATE_WAITING_FOR_FAVORITE, BTN_MAIN_MENU, self._on_main_menu)
+        router.set_default(STATE_WAITING_FOR_FAVORITE, self._on_unexpected)
+
+        router.add(STATE_WAITING_FOR_CAROUSEL, BTN_LIKE, self._on_carousel_rate)
+        router.add(STATE_WAITING_FOR_CAROUSEL, BTN_DISLIKE, self._on_carousel_rate)
+        router.add(STATE_WAITING_FOR_CAROUSEL, BTN_NEXT, self._on_carousel_next)
+        router.add(STATE_WAITING_FOR_CAROUSEL, BTN_MAIN_MENU, self._on_main_menu)
+        router.set_default(STATE_WAITING_FOR_CAROUSEL, self._on_unexpected)
+
+        return router
 
     def message_handler(self, event, user_name: str, request: str):
         """
@@ -75,181 +160,357 @@ class Handler:
 
         В зависимости от текста сообщения бот отвечает пользователю приветствием,
         ищет ему пару или отправляет сообщение о том, что он не понял запрос.
+        Обработчик выбирается по таблице переходов `self.router`. Обращение
+        зарегистрированного пользователя отмечается `DatabaseUtils.touch_user`.
+            Транзакции (см. `Database.transaction`) охватывают только работу с базой данных
+        и фиксируются до обращений к VK и отправки ответа, чтобы не удерживать блокировки
+        строк и таблиц на время HTTP-запросов.
 
         :param event: Объект события из VK API, содержащий информацию о сообщении.
         :param user_name: str Имя пользователя, которому бот отвечает.
         :param request: str Текст сообщения, отправленного пользователем.
         """
+        with self.util_db.transaction():
+            is_user_in_db = self.util_db.check_user_existence_db(event.user_id)
+            if is_user_in_db:
+                self.util_db.touch_user(event.user_id)
+        self.router.dispatch(None, request, event, user_name, request, is_user_in_db)
 
-        is_user_in_db = self.util_db.check_user_existence_db(event.user_id)
-        if request == "начать":
-            if is_user_in_db is None:
-                self.send_message(event.user_id, f"Привет, {user_name}! 👋 {WELCOME_MESSAGE}",
-                                  keyboard=self.create_keyboard(buttons_regist))
-            else:
-                self.send_message(event.user_id, f"Привет, {user_name}! 👋",
-                                  keyboard=self.create_keyboard(buttons_start))
-        elif request == BTN_HELP.lower():
-            self.send_message(event.user_id, HELP_MESSAGE,
-                              keyboard=self.create_keyboard(buttons_start))
+    def state_handler(self, state: str, event, user_id: int, user_name: str, request: str):
+        """
+        Обрабатывает состояние пользователя и отвечает соответствующим сообщением.
 
-        elif request == BTN_REGISTRATION.lower():
-            info_message = self.utils_auxiliary.prepare_user_candidate_data(event.user_id)
+        Этот метод вызывается, когда у пользователя есть состояние, которое нужно обработать
+        (например, ожидание поиска пары). Обработчик выбирается по таблице переходов
+        `self.router` по паре (состояние, запрос). Как и в `message_handler`, транзакции
+        фиксируются до обращений к VK и отправки ответа.
+
+        :param state: str Текущее состояние пользователя (например, "waiting_for_pair").
+        :param event: Объект события из VK API.
+        :param user_id: int Идентификатор пользователя ВКонтакте.
+        :param user_name: str Имя пользователя.
+        :param request: str Текст сообщения, отправленного пользователем.
+        """
+        with self.util_db.transaction():
+            self.util_db.touch_user(user_id)
+        self.router.dispatch(state, request, event, user_id, user_name, request)
 
-            self.send_message(event.user_id, f"{user_name} {info_message}",
+    # Обработчики сообщений без состояния
+
+    def _on_start(self, event, user_name: str, request: str, is_user_in_db):
+        """Приветствие пользователя по команде "начать"."""
+        if is_user_in_db is None:
+            self.send_message(event.user_id, f"Привет, {user_name}! 👋 {WELCOME_MESSAGE}",
+                              keyboard=self.create_keyboard(buttons_regist))
+        else:
+            self.send_message(event.user_id, f"Привет, {user_name}! 👋",
                               keyboard=self.create_keyboard(buttons_start))
 
-        elif request == BTN_FIND_PAIR.lower() and is_user_in_db:
-            self.send_message(event.user_id, f"{user_name} кого вы ищете: "
-                                             f"даму сердца или кавалера?",
-                              keyboard=self.create_keyboard(buttons_choice_sex))
-            self.vk_bot.set_user_state(event.user_id, "waiting_for_sex")
-
-        elif request == 'show':
-            if self.user_candidate_data[event.user_id]:
-                try:
-                    candidate = self.user_candidate_data[event.user_id][0]
-                    massage, photo_id_list = self.utils_auxiliary.creating_kadiat_message(candidate)
-
-                    self.send_message(event.user_id, massage,
-                                      keyboard=self.create_keyboard(buttons_choice),
-                                      photo_id_list=photo_id_list
-                                      )
-                finally:
-                    self._filling_user_candidate_data_dict(self.user_data, event.user_id)
-
-                self.vk_bot.set_user_state(event.user_id, "waiting_for_like_dislike")
-
-            else:
-                self.send_message(event.user_id, 'Город вы указали не верно. Попробуйте еще раз',
-                                  keyboard=self.create_keyboard(buttons_start)
-                                  )
-                self.vk_bot.set_user_state(event.user_id, None)
+    def _on_help(self, event, user_name: str, request: str, is_user_in_db):
+        """Отправка справки по командам бота."""
+        self.send_message(event.user_id, HELP_MESSAGE,
+                          keyboard=self.create_keyboard(buttons_start))
+
+    def _on_registration(self, event, user_name: str, request: str, is_user_in_db):
+        """
+        Регистрация пользователя по данным его страницы ВКонтакте.
 
-        elif request == BTN_CHOSEN.lower():
-            list_favorites = self.utils_auxiliary.get_favorites(event.user_id)
+        Пользователь сразу получает ответ, а получение профиля и сохранение в базу данных
+        выполняются в фоне. О результате сообщает `_on_registration_complete`.
+        """
+        if self.registration_pipeline.is_pending(event.user_id):
+            self.send_message(event.user_id, f"{user_name}, ваша регистрация уже выполняется⏳")
+            return
 
-            if list_favorites is not None:
+        self.send_message(event.user_id,
+                          f"{user_name}, регистрация началась, это займет несколько секунд⏳")
+        self.registration_pipeline.submit(event.user_id, user_name)
 
-                self.user_candidate_data[event.user_id] = {'favorites': list_favorites,
-                                                           'index': 0
-                                                           }
-                self._show_next_favorite(event, 0)
+    def _on_registration_complete(self, user_vk_id: int, user_name: str, info_message: str):
+        """
+        Сообщает пользователю о результате фоновой регистрации.
 
-            else:
-                self.send_message(event.user_id, "у вас нет избранных",
-                                  keyboard=self.create_keyboard(buttons_start)
+        :param user_vk_id: int VK ID пользователя.
+        :param user_name: str Имя пользователя.
+        :param info_message: str Итоговое сообщение о регистрации.
+        """
+        self.send_message(user_vk_id, f"{user_name} {info_message}",
+                          keyboard=self.create_keyboard(buttons_start))
+
+    def _on_find_pair(self, event, user_name: str, request: str, is_user_in_db):
+        """Начало поиска пары: выбор пола кандидата."""
+        if not is_user_in_db:
+            self._on_unknown(event, user_name, request, is_user_in_db)
+            return
+
+        self.send_message(event.user_id, f"{user_name} кого вы ищете: "
+                                         f"даму сердца или кавалера?",
+                          keyboard=self.create_keyboard(buttons_choice_sex))
+        self.vk_bot.set_user_state(event.user_id, STATE_WAITING_FOR_SEX)
+
+    def _on_show(self, event, user_name: str, request: str, is_user_in_db):
+        """Показ текущего кандидата (или карусели кандидатов) из списка пользователя."""
+        if self.browsing_mode == 'carousel':
+            self.carousel_pending[event.user_id] = {}
+            self.carousel_skipped[event.user_id] = set()
+            self._send_carousel_page(event)
+            return
+
+        if self.user_candidate_data[event.user_id]:
+            try:
+                candidate = self.user_candidate_data[event.user_id][0]
+                massage, photo_id_list = self.utils_auxiliary.creating_kadiat_message(candidate)
+
+                self.send_message(event.user_id, massage,
+                                  keyboard=self.create_keyboard(buttons_choice),
+                                  photo_id_list=photo_id_list
                                   )
+            finally:
+                self._filling_user_candidate_data_dict(self.user_data, event.user_id)
+
+            self.vk_bot.set_user_state(event.user_id, STATE_WAITING_FOR_LIKE_DISLIKE)
 
         else:
-            text = 'Я вас не понял. Активирую главное меню.'
-            if is_user_in_db is None:
-                self.send_message(event.user_id, text,
-                                  keyboard=self.create_keyboard(buttons_regist)
-                                  )
-            else:
-                self.send_message(event.user_id, text,
-                                  keyboard=self.create_keyboard(buttons_start)
-                                  )
+            self.send_message(event.user_id,
+                              self._no_candidates_text('Город вы указали не верно. Попробуйте еще раз'),
+                              keyboard=self.create_keyboard(buttons_start)
+                              )
+            self.vk_bot.set_user_state(event.user_id, None)
 
-    def state_handler(self, state: str, event, user_id: int, user_name: str, request: str):
-        """
-        Обрабатывает состояние пользователя и отвечает соответствующим сообщением.
+    def _on_favorites(self, event, user_name: str, request: str, is_user_in_db):
+        """Переход к просмотру избранных кандидатов."""
+        with self.util_db.transaction():
+            favorites = self.utils_auxiliary.browse_favorites(event.user_id)
 
-        Этот метод вызывается, когда у пользователя есть состояние, которое нужно обработать
-        (например, ожидание поиска пары). Бот отвечает пользователю, что продолжает поиск,
-        и сбрасывает текущее состояние.
+        if favorites is not None:
+
+            self.user_candidate_data[event.user_id] = {'favorites': favorites}
+            self._show_next_favorite(event, 0)
+
+        else:
+            self.send_message(event.user_id, "у вас нет избранных",
+                              keyboard=self.create_keyboard(buttons_start)
+                              )
+
+    def _on_unknown(self, event, user_name: str, request: str, is_user_in_db):
+        """Ответ на нераспознанный запрос с возвратом в главное меню."""
+        text = 'Я вас не понял. Активирую главное меню.'
+        if is_user_in_db is None:
+            self.send_message(event.user_id, text,
+                              keyboard=self.create_keyboard(buttons_regist)
+                              )
+        else:
+            self.send_message(event.user_id, text,
+                              keyboard=self.create_keyboard(buttons_start)
+                              )
+
+    def _on_profile(self, event, user_name: str, request: str, is_user_in_db):
+        """Служебные команды профилирования, доступные только администраторам."""
+        if event.user_id not in ADMIN_IDS:
+            self._on_unknown(event, user_name, request, is_user_in_db)
+            return
+
+        profiler = self.vk_bot.profiler
+        if request == CMD_PROFILE_START:
+            text = profiler.start('cprofile')
+        elif request == CMD_PROFILE_START_SAMPLING:
+            text = profiler.start('sampling')
+        elif request == CMD_PROFILE_STOP:
+            text = profiler.stop()
+        else:
+            text = profiler.memory_snapshot()
+        self.send_message(event.user_id, text)
+
+    # Обработчики состояний
+
+    def _on_main_menu(self, event, user_id: int, user_name: str, request: str):
+        """Возврат в главное меню со сбросом состояния."""
+        self.send_message(event.user_id, BTN_MAIN_MENU,
+                          keyboard=self.create_keyboard(buttons_start)
+                          )
+        self.vk_bot.set_user_state(user_id, None)
+
+    def _on_unexpected(self, event, user_id: int, user_name: str, request: str):
+        """Ответ на неожиданный ввод в состоянии с возвратом в главное меню."""
+        self.send_message(event.user_id, 'Не ожиданий ответ, перенаправляю в главное меню',
+                          keyboard=self.create_keyboard(buttons_start)
+                          )
+        self.vk_bot.set_user_state(user_id, None)
+
+    def _on_sex(self, event, user_id: int, user_name: str, request: str):
+        """Сохранение пола кандидата и запрос возраста."""
+        sex = 2 if request == BTN_SEX_MAN_NORMALIZED else 1
+        self.user_data[user_id] = {'sex': sex}
+
+        self.send_message(user_id,
+                          "Введите возраст или укажите диапазон возрастов, "
+                          "разделяя значения запятой.")
+        self.vk_bot.set_user_state(user_id, STATE_WAITING_FOR_AGE)
+
+    def _on_age(self, event, user_id: int, user_name: str, request: str):
+        """Сохранение возраста кандидата и запрос города."""
+        age = request.split(',')
+        self.user_data[user_id].update({'age': age})
+
+        self.send_message(user_id,
+                          "Укажите город в котором искать спутника жизни")
+        self.vk_bot.set_user_state(user_id, STATE_WAITING_FOR_CITY)
+
+    def _on_city(self, event, user_id: int, user_name: str, request: str):
+        """Сохранение города, подбор кандидатов и показ первого из них."""
+        self.user_data[user_id].update({'city': request})
+        self._filling_user_candidate_data_dict(self.user_data, user_id)
+        self.vk_bot.set_user_state(user_id, None)
+        self.message_handler(event, user_name, CMD_SHOW)
+
+    def _on_like(self, event, user_id: int, user_name: str, request: str):
+        """Сохранение лайка текущему кандидату и показ следующего."""
+        self._rate_candidate(event, user_name, True)
+
+    def _on_dislike(self, event, user_id: int, user_name: str, request: str):
+        """Сохранение дизлайка текущему кандидату и показ следующего."""
+        self._rate_candidate(event, user_name, False)
+
+    def _rate_candidate(self, event, user_name: str, preference: bool):
+        """
+        Сохраняет оценку текущего кандидата и переходит к следующему.
 
-        :param state: str Текущее состояние пользователя (например, "waiting_for_pair").
         :param event: Объект события из VK API.
-        :param user_id: int Идентификатор пользователя ВКонтакте.
         :param user_name: str Имя пользователя.
-        :param request: str Текст сообщения, отправленного пользователем.
+        :param preference: bool True для лайка, False для дизлайка.
         """
-        if state == "waiting_for_sex":
-            if request != BTN_MAIN_MENU.lower():
-                sex = 2 if request == BTN_SEX_MAN.lower() else 1
-                self.user_data[user_id] = {'sex': sex}
-
-                self.send_message(user_id,
-                                  "Введите возраст или укажите диапазон возрастов, "
-                                  "разделяя значения запятой.")
-                self.vk_bot.set_user_state(user_id, "waiting_for_age")
-
-            else:
-                self.send_message(event.user_id, BTN_MAIN_MENU,
-                                  keyboard=self.create_keyboard(buttons_start)
-                                  )
-                self.vk_bot.set_user_state(user_id, None)
-
-        elif state == "waiting_for_age":
-            age = request.split(',')
-            self.user_data[user_id].update({'age': age})
-
-            self.send_message(user_id,
-                              "Укажите город в котором искать спутника жизни")
-            self.vk_bot.set_user_state(user_id, "waiting_for_city")
+        candidate_id = self.user_candidate_data[event.user_id][0].id
+        self.utils_auxiliary.adding_candidate_status(candidate_id, event.user_id, preference)
+        del self.user_candidate_data[event.user_id][0]
+        self._transfer_show(event, user_name)
+
+    def _on_favorite_next(self, event, user_id: int, user_name: str, request: str):
+        """Показ следующего избранного кандидата."""
+        self._show_next_favorite(event, 1)
+
+    def _on_favorite_back(self, event, user_id: int, user_name: str, request: str):
+        """Показ предыдущего избранного кандидата."""
+        self._show_next_favorite(event, -1)
+
+    def _on_favorite_remove(self, event, user_id: int, user_name: str, request: str):
+        """Удаление текущего кандидата из избранных."""
+        favorites = self.user_candidate_data[event.user_id]['favorites']
+        with self.util_db.transaction():
+            self.util_db.candidate_status_update(favorites.current.id, event.user_id, False)
+            remaining = favorites.remove_current()
+        if remaining is None:
+            self.send_message(event.user_id, "у вас нет избранных",
+                              keyboard=self.create_keyboard(buttons_start)
+                              )
+            self.vk_bot.set_user_state(event.user_id, None)
+            return
+        self._show_next_favorite(event, 0)
+
+    def _on_carousel_rate(self, event, user_id: int, user_name: str, request: str):
+        """
+        Сохраняет оценку кандидата из карусели.
 
-        elif state == "waiting_for_city":
-            self.user_data[user_id].update({'city': request})
-            self._filling_user_candidate_data_dict(self.user_data, user_id)
-            self.vk_bot.set_user_state(user_id, None)
-            request = 'show'
-            self.message_handler(event, user_name, request)
+        ID кандидата и оценка берутся из полезной нагрузки нажатой кнопки. Если кандидат
+        уже был оценен ранее (кнопка из старой карусели), оценка обновляется; пропущенный
+        кандидат из старой карусели оценивается впервые.
+        Когда все кандидаты текущей карусели оценены, отправляется следующая.
+        """
+        payload = self._parse_payload(event)
+        if payload is None or 'candidate_id' not in payload:
+            self._on_unexpected(event, user_id, user_name, request)
+            return
+
+        candidate_id = payload['candidate_id']
+        preference = payload.get('cmd') == 'like'
+        pending = self.carousel_pending.setdefault(user_id, {})
+        skipped = self.carousel_skipped.setdefault(user_id, set())
+
+        if pending.pop(candidate_id, None) is not None or candidate_id in skipped:
+            skipped.discard(candidate_id)
+            self.utils_auxiliary.adding_candidate_status(candidate_id, user_id, preference)
+        else:
+            self.util_db.candidate_status_update(candidate_id, user_id, preference)
 
-        elif state == "waiting_for_like_dislike":
-            candidate_id = self.user_candidate_data[event.user_id][0]['id']
+        if not pending:
+            self._send_carousel_page(event)
 
-            if request == BTN_LIKE.lower():
+    def _on_carousel_next(self, event, user_id: int, user_name: str, request: str):
+        """Пропуск неоцененных кандидатов текущей карусели и показ следующей."""
+        self._send_carousel_page(event)
 
-                self.utils_auxiliary.adding_candidate_status(candidate_id, event.user_id, True)
-                del self.user_candidate_data[event.user_id][0]
-                self._transfer_show(event, user_name)
+    def _no_candidates_text(self, default: str) -> str:
+        """
+        Возвращает текст сообщения об отсутствии кандидатов.
 
-            elif request == BTN_DISLIKE.lower():
-                self.utils_auxiliary.adding_candidate_status(candidate_id, event.user_id, False)
-                del self.user_candidate_data[event.user_id][0]
-                self._transfer_show(event, user_name)
+        Если суточная квота поиска VK исчерпана, новые кандидаты не запрашивались, и причина
+        не в параметрах поиска, поэтому пользователю сообщается о лимите.
 
-            elif request == BTN_MAIN_MENU.lower():
-                self.send_message(event.user_id, BTN_MAIN_MENU,
-                                  keyboard=self.create_keyboard(buttons_start)
-                                  )
-                self.vk_bot.set_user_state(user_id, None)
+        :param default: str Текст сообщения, если квота не исчерпана.
+        :return: str Текст сообщения.
+        """
+        if self.utils_auxiliary.search_quota_reached():
+            return 'Лимит поиска новых анкет на сегодня исчерпан. Попробуйте завтра'
+        return default
 
-            else:
-                self.send_message(event.user_id, 'Не ожиданий ответ, перенаправляю в главное меню',
-                                  keyboard=self.create_keyboard(buttons_start)
-                                  )
-                self.vk_bot.set_user_state(user_id, None)
+    def _send_carousel_page(self, event):
+        """
+        Отправляет пользователю карусель из следующих `CAROUSEL_SIZE` кандидатов.
 
-        elif state == 'waiting_for_favorite':
+        Неоцененные кандидаты предыдущей карусели пропускаются до конца сеанса просмотра.
+        Если список кандидатов исчерпан, он заполняется заново из базы данных.
 
-            if request == BTN_NEXT.lower():
-                self._show_next_favorite(event, 1)
+        :param event: Объект события из VK API.
+        """
+        user_id = event.user_id
+        pending = self.carousel_pending.setdefault(user_id, {})
+        skipped = self.carousel_skipped.setdefault(user_id, set())
+        skipped.update(pending)
+        pending.clear()
+        candidates = self.user_candidate_data.get(user_id)
+
+        if not candidates:
+            self._filling_user_candidate_data_dict(self.user_data, user_id)
+            candidates = [candidate for candidate in self.user_candidate_data[user_id] or []
+                          if candidate.id not in skipped]
+            self.user_candidate_data[user_id] = candidates
+
+        if not candidates:
+            self.send_message(user_id, self._no_candidates_text(
+                'Кандидаты закончились. Попробуйте изменить параметры поиска'),
+                              keyboard=self.create_keyboard(buttons_start)
+                              )
+            self.carousel_pending.pop(user_id, None)
+            self.carousel_skipped.pop(user_id, None)
+            self.vk_bot.set_user_state(user_id, None)
+            return
 
-            elif request == BTN_BACK.lower():
-                self._show_next_favorite(event, -1)
+        page = candidates[:CAROUSEL_SIZE]
+        del candidates[:CAROUSEL_SIZE]
+        pending.update((candidate.id, candidate) for candidate in page)
 
-            elif request == BTN_REMOVE_FAVORITES.lower():
-                index = self.user_candidate_data[event.user_id]['index']
-                candidate_id = self.user_candidate_data[event.user_id]['favorites'][index]['id']
-                print(candidate_id)
-                self.util_db.candidate_status_update(candidate_id, event.user_id, False)
-                del self.user_candidate_data[event.user_id]['favorites'][index]
-                self._show_next_favorite(event, 0)
+        elements = [self.utils_auxiliary.creating_carousel_element(candidate) for candidate in page]
+        self.send_message(user_id, 'Оцените кандидатов:',
+                          keyboard=self.create_keyboard(buttons_carousel),
+                          template=self.vk_bot.create_carousel(elements)
+                          )
+        self.vk_bot.set_user_state(user_id, STATE_WAITING_FOR_CAROUSEL)
 
-            elif request == BTN_MAIN_MENU.lower():
-                self.send_message(event.user_id, BTN_MAIN_MENU,
-                                  keyboard=self.create_keyboard(buttons_start)
-                                  )
-                self.vk_bot.set_user_state(user_id, None)
+    @staticmethod
+    def _parse_payload(event) -> dict | None:
+        """
+        Извлекает полезную нагрузку кнопки из события.
 
-            else:
-                self.send_message(event.user_id, 'Не ожиданий ответ, перенаправляю в главное меню',
-                                  keyboard=self.create_keyboard(buttons_start)
-                                  )
-                self.vk_bot.set_user_state(user_id, None)
+        :param event: Объект события из VK API.
+        :return: dict Полезная нагрузка или None, если ее нет или она некорректна.
+        """
+        payload = getattr(event, 'payload', None)
+        if not payload:
+            return None
+        try:
+            payload = json.loads(payload) if isinstance(payload, str) else payload
+        except ValueError:
+            return None
+        return payload if isinstance(payload, dict) else None
 
     def _filling_user_candidate_data_dict(self, user_data: dict, user_vk_id: int):
         """
@@ -276,8 +537,7 @@ class Handler:
                      пользователя.
         :param user_name: Имя пользователя, которому будет отображаться сообщение.
         """
-        request = 'show'
-        self.message_handler(event, user_name, request)
+        self.message_handler(event, user_name, CMD_SHOW)
 
     def _show_next_favorite(self, event, step: int):
         """
@@ -287,30 +547,28 @@ class Handler:
         и отправляет сообщение пользователю с клавиатурой для взаимодействия (например,
         кнопки для просмотра следующего кандидата, возврата к предыдущему или удаления
         из избранного). После отправки данных функция обновляет состояние пользователя в системе.
+            Избранные загружаются постранично (см. `FavoritesPager`), поэтому переход
+        не требует загрузки всего списка.
 
         :param event: объект события VK API, содержащий информацию о текущем взаимодействии
                     пользователя с ботом.
+        :param step: int Направление перехода: 1 - следующий, -1 - предыдущий, 0 - текущий.
 
         """
-        self.user_candidate_data[event.user_id]['index'] += step
-        index = self.user_candidate_data[event.user_id]['index']
-        favorites_list = self.user_candidate_data[event.user_id]['favorites']
+        favorites = self.user_candidate_data[event.user_id]['favorites']
+        with self.util_db.transaction():
+            candidate = favorites.move(step)
 
-        if index <= 0:
-            index = 0
-            keyboard = buttons_favorites_next
-            self.user_candidate_data[event.user_id]['index'] = index
-        elif index >= len(favorites_list):
-            index = len(favorites_list) - 1
-            self.user_candidate_data[event.user_id]['index'] = index
+        if favorites.has_prev and favorites.has_next:
+            keyboard = buttons_favorites
+        elif favorites.has_prev:
             keyboard = buttons_favorites_back
         else:
-            keyboard = buttons_favorites
+            keyboard = buttons_favorites_next
 
-        candidate = favorites_list[index]
         massage, photo_id_list = self.utils_auxiliary.creating_kadiat_message(candidate)
         self.send_message(event.user_id, massage,
                           keyboard=self.create_keyboard(keyboard),
                           photo_id_list=photo_id_list
                           )
-        self.vk_bot.set_user_state(event.user_id, "waiting_for_favorite")
+        self.vk_bot.set_user_state(event.user_id, STATE_WAITING_FOR_FAVORITE)
@@ -0,0 +1,263 @@
+"""
+Модуль metrics.py
+
+Этот модуль содержит сбор метрик времени выполнения этапов обработки событий бота
+и их публикацию в текстовом формате Prometheus.
+
+Каждый этап (получение события long poll, `get_user_name`, диспетчеризация обработчика,
+методы `Database` и `VKAPI`, `messages.send`) записывает длительность в гистограмму
+с именем этапа. По гистограмме рассчитываются квантили p50/p95/p99.
+
+Пример использования:
+    from metrics import registry, timed
+
+    @timed('db.select_data')
+    def select_data(...):
+        ...
+
+    with registry.timer('vk.messages.send'):
+        ...
+
+    start_metrics_server(9108)  # http://127.0.0.1:9108/metrics
+"""
+import inspect
+import logging
+import threading
+
+from collections import deque
+from contextvars import ContextVar
+from functools import wraps
+from time import perf_counter
+
+logger = logging.getLogger(__name__)
+
+QUANTILES = (0.5, 0.95, 0.99)
+
+# Имя обработчика, в рамках которого выполняется текущий код (для трассировки запросов)
+current_origin = ContextVar('current_origin', default=None)
+
+
+class StageHistogram:
+    """
+        Гистограмма длительностей одного этапа.
+
+        Хранит общее количество и сумму наблюдений, а для расчета квантилей - последние
+    `window` значений, поэтому объем памяти не зависит от времени работы бота.
+    """
+
+    def __init__(self, window: int = 2048):
+        """
+        :param window: int Количество последних наблюдений для расчета квантилей.
+        """
+        self.count = 0
+        self.total = 0.0
+        self._samples = deque(maxlen=window)
+
+    def observe(self, seconds: float):
+        """
+        Добавляет наблюдение.
+
+        :param seconds: float Длительность этапа в секундах.
+        """
+        self.count += 1
+        self.total += seconds
+        self._samples.append(seconds)
+
+    def quantiles(self, quantiles: tuple = QUANTILES) -> dict[float, float]:
+        """
+        Рассчитывает квантили по последним наблюдениям.
+
+        :param quantiles: tuple Квантили в диапазоне (0, 1).
+        :return: dict {квантиль: значение в секундах}.
+        """
+        samples = sorted(self._samples)
+        if not samples:
+            return {q: 0.0 for q in quantiles}
+        last = len(samples) - 1
+        return {q: samples[min(last, int(q * len(samples)))] for q in quantiles}
+
+
+class MetricsRegistry:
+    """
+    Потокобезопасный реестр гистограмм этапов.
+    """
+
+    def __init__(self, window: int = 2048):
+        """
+        :param window: int Размер окна наблюдений каждой гистограммы.
+        """
+        self.window = window
+        self._stages = {}
+        self._collectors = []
+        self._lock = threading.Lock()
+
+    def observe(self, stage: str, seconds: float):
+        """
+        Записывает длительность этапа.
+
+        :param stage: str Имя этапа, например 'db.select_data'.
+        :param seconds: float Длительность в секундах.
+        """
+        with self._lock:
+            histogram = self._stages.get(stage)
+            if histogram is None:
+                histogram = self._stages[stage] = StageHistogram(self.window)
+            histogram.observe(seconds)
+
+    def timer(self, stage: str):
+        """
+        Возвращает контекстный менеджер, замеряющий длительность блока кода.
+
+        :param stage: str Имя этапа.
+        """
+        return _StageTimer(self, stage)
+
+    def add_collector(self, collector):
+        """
+        Добавляет источник дополнительных метрик для `render`.
+
+        :param collector: Функция без аргументов, возвращающая список строк в формате Prometheus.
+        """
+        with self._lock:
+            if collector not in self._collectors:
+                self._collectors.append(collector)
+
+    def snapshot(self) -> dict[str, dict]:
+        """
+        Возвращает текущие значения всех гистограмм.
+
+        :return: dict {этап: {'count', 'sum', 'p50', 'p95', 'p99'}}.
+        """
+        with self._lock:
+            result = {}
+            for stage, histogram in self._stages.items():
+                quantiles = histogram.quantiles()
+                result[stage] = {
+                    'count': histogram.count,
+                    'sum': histogram.total,
+                    **{f'p{int(q * 100)}': value for q, value in quantiles.items()},
+                }
+            return result
+
+    def render(self) -> str:
+        """
+        Формирует текст метрик в формате Prometheus (тип summary).
+
+        :return: str Текст для ответа на запрос /metrics.
+        """
+        name = 'vkbot_stage_duration_seconds'
+        lines = [f'# HELP {name} Длительность этапов обработки событий бота.',
+                 f'# TYPE {name} summary']
+        with self._lock:
+            for stage in sorted(self._stages):
+                histogram = self._stages[stage]
+                for q, value in histogram.quantiles().items():
+                    lines.append(f'{name}{{stage="{stage}",quantile="{q}"}} {value:.6f}')
+                lines.append(f'{name}_sum{{stage="{stage}"}} {histogram.total:.6f}')
+                lines.append(f'{name}_count{{stage="{stage}"}} {histogram.count}')
+            collectors = list(self._collectors)
+        for collector in collectors:
+            lines.extend(collector())
+        return '\n'.join(lines) + '\n'
+
+    def reset(self):
+        """Удаляет все накопленные гистограммы."""
+        with self._lock:
+            self._stages.clear()
+
+
+class _StageTimer:
+    """Контекстный менеджер замера длительности этапа."""
+
+    __slots__ = ('_registry', '_stage', '_start')
+
+    def __init__(self, registry: MetricsRegistry, stage: str):
+        self._registry = registry
+        self._stage = stage
+        self._start = 0.0
+
+    def __enter__(self):
+        self._start = perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self._registry.observe(self._stage, perf_counter() - self._start)
+        return False
+
+
+# Общий реестр метрик процесса
+registry = MetricsRegistry()
+
+
+def timed(stage: str):
+    """
+    Декоратор, записывающий длительность вызова функции в общий реестр.
+
+    Для асинхронных функций замеряется время до завершения корутины.
+
+    :param stage: str Имя этапа.
+    """
+    def decorator(func):
+        if inspect.iscoroutinefunction(func):
+            @wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                with registry.timer(stage):
+                    return await func(*args, **kwargs)
+            return async_wrapper
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with registry.timer(stage):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def _make_request_handler(metrics_registry: MetricsRegistry):
+    """
+    Создает класс обработчика HTTP-запросов к /metrics.
+
+    http.server импортируется здесь, а не при импорте модуля, чтобы не замедлять запуск бота,
+    когда сервер метрик не используется.
+
+    :param metrics_registry: MetricsRegistry Реестр, публикуемый сервером.
+    """
+    from http.server import BaseHTTPRequestHandler
+
+    class MetricsRequestHandler(BaseHTTPRequestHandler):
+        """Обработчик HTTP-запросов к /metrics."""
+
+        def do_GET(self):
+            if self.path.split('?')[0] != '/metrics':
+                self.send_error(404)
+                return
+            body = metrics_registry.render().encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            logger.debug("metrics: " + format, *args)
+
+    return MetricsRequestHandler
+
+
+def start_metrics_server(port: int, host: str = '127.0.0.1',
+                         metrics_registry: MetricsRegistry = registry):
+    """
+    Запускает HTTP-сервер метрик в фоновом потоке.
+
+    :param port: int Порт сервера.
+    :param host: str Адрес, на котором слушает сервер (по умолчанию только локальный).
+    :param metrics_registry: MetricsRegistry Реестр, публикуемый сервером.
+    :return: ThreadingHTTPServer Запущенный сервер.
+    """
+    from http.server import ThreadingHTTPServer
+
+    server = ThreadingHTTPServer((host, port), _make_request_handler(metrics_registry))
+    thread = threading.Thread(target=server.serve_forever, name='metrics', daemon=True)
+    thread.start()
+    logger.info(f"Метрики доступны на http://{host}:{server.server_port}/metrics")
+    return server
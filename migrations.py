@@ -0,0 +1,845 @@
+"""
+Модуль migrations.py
+
+Версионные миграции схемы базы данных.
+
+Каждая миграция имеет номер версии и функцию, которая получает объект `Database` и выполняет
+изменения схемы. Примененные версии хранятся в таблице `schema_migrations`; при запуске
+`Migrator.migrate` применяет по порядку только недостающие миграции. Миграции выполняются
+под advisory lock PostgreSQL, поэтому при одновременном запуске нескольких экземпляров бота
+миграции применяет только один из них, а остальные дожидаются окончания.
+
+Для изменений схемы работающей базы без простоя:
+- миграции с `transactional=False` выполняются в режиме autocommit - это нужно для
+  `CREATE INDEX CONCURRENTLY` (см. `create_index_concurrently`);
+- большие обновления данных выполняются пакетами с фиксацией каждого пакета
+  (см. `backfill`), чтобы не держать долгие блокировки строк.
+
+Новая миграция добавляется в конец списка `MIGRATIONS` со следующим номером версии;
+примененные миграции не изменяются.
+
+Пример запуска из корня репозитория:
+    python migrations.py           # применить недостающие миграции
+    python migrations.py --status  # показать примененные и ожидающие версии
+"""
+import argparse
+import logging
+
+from contextlib import contextmanager
+from time import sleep
+from typing import Callable, NamedTuple
+from psycopg2 import errors, sql
+from config import USER_CANDIDATE_PARTITIONS
+
+logger = logging.getLogger(__name__)
+
+# Ключ advisory lock миграций (произвольная константа, общая для всех экземпляров бота)
+MIGRATIONS_LOCK_KEY = 7_402_114_031
+
+
+class Migration(NamedTuple):
+    """
+    Описание миграции схемы.
+
+    Атрибуты:
+    - version: Номер версии (возрастает на 1 с каждой миграцией).
+    - name: Краткое описание.
+    - apply: Функция, получающая объект `Database` и выполняющая миграцию.
+    - transactional: False для миграций, которые нельзя выполнять в транзакции
+      (например, `CREATE INDEX CONCURRENTLY`).
+    """
+    version: int
+    name: str
+    apply: Callable
+    transactional: bool = True
+
+
+def create_index_concurrently(db, name: str, table: str, columns: str, where: str = None):
+    """
+    Создает индекс без блокировки записи в таблицу.
+
+    Если предыдущая попытка создания индекса была прервана, PostgreSQL оставляет
+    недействительный (INVALID) индекс; он удаляется и создается заново.
+    Вызывается только из миграций с `transactional=False`.
+
+    :param db: Database Объект базы данных в режиме autocommit.
+    :param name: str Имя индекса.
+    :param table: str Имя таблицы.
+    :param columns: str Список столбцов индекса, например 'user_id, candidate_id'.
+    :param where: str Условие частичного индекса, например 'NOT preference'.
+    """
+    db._execute("""
+        SELECT NOT i.indisvalid
+        FROM pg_index i
+        JOIN pg_class c ON c.oid = i.indexrelid
+        WHERE c.relname = %s
+    """, (name,))
+    row = db.cur.fetchone()
+    if row and row[0]:
+        logger.warning(f"Индекс {name} недействителен после прерванной миграции, пересоздаем")
+        db._execute(sql.SQL("DROP INDEX CONCURRENTLY IF EXISTS {}").format(sql.Identifier(name)))
+    db._execute(sql.SQL("CREATE INDEX CONCURRENTLY IF NOT EXISTS {} ON {} ({}){}").format(
+        sql.Identifier(name), sql.Identifier(table), sql.SQL(columns),
+        sql.SQL(f" WHERE {where}" if where else "")))
+
+
+def create_partitioned_index(db, name: str, table: str, columns: str, where: str = None):
+    """
+    Создает индекс без блокировки записи в таблицу, которая может быть секционирована.
+
+        Для секционированной таблицы CONCURRENTLY недоступен: индекс создается только
+    на родительской таблице (ON ONLY), индексы секций строятся `create_index_concurrently`
+    и присоединяются к нему. Обычная таблица индексируется `create_index_concurrently`.
+    Вызывается только из миграций с `transactional=False`.
+
+    :param db: Database Объект базы данных в режиме autocommit.
+    :param name: str Имя индекса.
+    :param table: str Имя таблицы.
+    :param columns: str Список столбцов индекса.
+    :param where: str Условие частичного индекса.
+    """
+    db._execute("""
+        SELECT c.relname FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        JOIN pg_class p ON p.oid = i.inhparent
+        WHERE p.relname = %s AND p.relkind = 'p'
+        ORDER BY c.relname
+    """, (table,))
+    partitions = [row[0] for row in db.cur.fetchall()]
+    if not partitions:
+        create_index_concurrently(db, name, table, columns, where)
+        return
+
+    db._execute(sql.SQL("CREATE INDEX IF NOT EXISTS {} ON ONLY {} ({}){}").format(
+        sql.Identifier(name), sql.Identifier(table), sql.SQL(columns),
+        sql.SQL(f" WHERE {where}" if where else "")))
+    for partition in partitions:
+        partition_index = f'{partition}_{name}'
+        create_index_concurrently(db, partition_index, partition, columns, where)
+        db._execute(sql.SQL("ALTER INDEX {} ATTACH PARTITION {}").format(
+            sql.Identifier(name), sql.Identifier(partition_index)))
+
+
+def backfill(db, table: str, assignment: str, condition: str, batch_size: int = 1000,
+             params: tuple = ()) -> int:
+    """
+    Обновляет строки таблицы пакетами, фиксируя транзакцию после каждого пакета.
+
+    Условие `condition` должно перестать выполняться для обновленных строк, иначе
+    обновление не завершится (например, 'city_id IS NULL' при заполнении city_id).
+    Вызывается только из миграций с `transactional=False`.
+
+    :param db: Database Объект базы данных в режиме autocommit.
+    :param table: str Имя таблицы.
+    :param assignment: str Выражение SET, например 'city_id = 1'.
+    :param condition: str Условие WHERE для строк, которые еще нужно обновить.
+    :param batch_size: int Количество строк в пакете.
+    :param params: tuple Параметры запроса (для `assignment` и `condition`).
+    :return: int Общее количество обновленных строк.
+    """
+    query = sql.SQL("""
+        UPDATE {table} SET {assignment}
+        WHERE id IN (SELECT id FROM {table} WHERE {condition} LIMIT %s)
+    """).format(table=sql.Identifier(table), assignment=sql.SQL(assignment),
+                condition=sql.SQL(condition))
+    total = 0
+    while True:
+        db._execute(query, (*params, batch_size))
+        updated = db.cur.rowcount
+        total += updated
+        if updated < batch_size:
+            break
+    logger.info(f"Пакетное обновление {table}: {total} строк")
+    return total
+
+
+@contextmanager
+def transaction(db):
+    """
+    Выполняет блок миграции с `transactional=False` в одной транзакции.
+
+    :param db: Database Объект базы данных в режиме autocommit.
+    """
+    db.conn.autocommit = False
+    try:
+        yield
+        db.conn.commit()
+    except Exception:
+        db.conn.rollback()
+        raise
+    finally:
+        db.conn.autocommit = True
+
+
+def locked_transaction(db, apply: Callable, lock_timeout: str = '5s', attempts: int = 10,
+                       pause: float = 1.0, sleep=sleep):
+    """
+    Выполняет `apply(db)` в одной транзакции с ограничением ожидания блокировок.
+
+        Изменения, которым нужна сильная блокировка таблицы (замена таблиц, пересоздание
+    триггера), ждут ее не дольше `lock_timeout`: иначе запрос в очереди блокировки
+    остановил бы все запросы бота к таблице на время долгих транзакций перед ним. При
+    превышении транзакция откатывается и повторяется после паузы.
+    Вызывается только из миграций с `transactional=False`.
+
+    :param db: Database Объект базы данных в режиме autocommit.
+    :param apply: Функция, получающая объект `Database` и выполняющая запросы транзакции.
+    :param lock_timeout: str Предельное ожидание блокировки, например '5s'.
+    :param attempts: int Количество попыток.
+    :param pause: float Пауза между попытками в секундах.
+    :param sleep: Функция ожидания (для тестов).
+    """
+    for attempt in range(1, attempts + 1):
+        try:
+            with transaction(db):
+                db._execute("SET LOCAL lock_timeout = %s", (lock_timeout,))
+                apply(db)
+            return
+        except errors.LockNotAvailable:
+            if attempt == attempts:
+                raise
+            logger.warning(f"Блокировка не получена за {lock_timeout} "
+                           f"(попытка {attempt} из {attempts}), повтор")
+            sleep(pause)
+
+
+def copy_in_batches(db, source: str, target: str, columns: str, batch_size: int = 5000) -> int:
+    """
+    Копирует строки таблицы пакетами по возрастанию id, фиксируя каждый пакет.
+
+    Строки пакета блокируются FOR SHARE до окончания копирования, поэтому параллельное
+    изменение строки дожидается копирования и не теряется, если таблица-источник зеркалирует
+    изменения в таблицу-приемник триггером. Уже скопированные строки пропускаются
+    (ON CONFLICT DO NOTHING), поэтому прерванное копирование можно запустить повторно.
+    Вызывается только из миграций с `transactional=False`.
+
+    :param db: Database Объект базы данных в режиме autocommit.
+    :param source: str Таблица-источник.
+    :param target: str Таблица-приемник.
+    :param columns: str Список копируемых столбцов, включая id.
+    :param batch_size: int Количество строк в пакете.
+    :return: int Количество прочитанных строк источника.
+    """
+    query = sql.SQL("""
+        WITH batch AS (
+            SELECT {columns} FROM {source} WHERE id > %s ORDER BY id LIMIT %s FOR SHARE
+        ), copied AS (
+            INSERT INTO {target} ({columns})
+            SELECT {columns} FROM batch WHERE user_id IS NOT NULL
+            ON CONFLICT DO NOTHING
+        )
+        SELECT max(id), count(*) FROM batch
+    """).format(columns=sql.SQL(columns), source=sql.Identifier(source),
+                target=sql.Identifier(target))
+    last_id, total = 0, 0
+    while True:
+        db._execute(query, (last_id, batch_size))
+        max_id, count = db.cur.fetchone()
+        total += count
+        if count < batch_size:
+            break
+        last_id = max_id
+    logger.info(f"Скопировано {total} строк из {source} в {target}")
+    return total
+
+
+def _initial_schema(db):
+    """Таблицы пользователей, кандидатов и их оценок (схема до введения миграций)."""
+    person_columns = """
+        id SERIAL PRIMARY KEY,
+        vk_id BIGINT UNIQUE NOT NULL,
+        name VARCHAR(255) NOT NULL,
+        city VARCHAR(255),
+        birthday DATE,
+        gender SMALLINT CHECK (gender IN (1, 2)),
+        photo_ids TEXT[]
+    """
+    db._execute(f"CREATE TABLE IF NOT EXISTS users ({person_columns})")
+    db._execute(f"CREATE TABLE IF NOT EXISTS candidate ({person_columns})")
+    db._execute("""
+        CREATE TABLE IF NOT EXISTS user_candidate (
+            id SERIAL PRIMARY KEY,
+            user_id BIGINT REFERENCES users(id) ON DELETE CASCADE,
+            candidate_id BIGINT REFERENCES candidate(id) ON DELETE CASCADE,
+            preference BOOLEAN NOT NULL
+        )
+    """)
+
+
+def _user_candidate_user_index(db):
+    """Индекс для выборки оценок пользователя и исключения уже оцененных кандидатов."""
+    create_index_concurrently(db, 'user_candidate_user_id_candidate_id_idx',
+                              'user_candidate', 'user_id, candidate_id')
+
+
+def _candidate_search_index(db):
+    """Индекс для поиска кандидатов по полу, городу и дате рождения."""
+    create_index_concurrently(db, 'candidate_gender_city_birthday_idx',
+                              'candidate', 'gender, city, birthday')
+
+
+def _partition_user_candidate(db, partitions: int = USER_CANDIDATE_PARTITIONS):
+    """
+        Перевод user_candidate на секционирование по хешу user_id без остановки бота.
+
+        1. Создается секционированная таблица user_candidate_partitioned с `partitions`
+    секциями и индексом (user_id, candidate_id).
+        2. Триггер на user_candidate зеркалирует в нее все новые изменения (функция и
+    триггер создаются в одной транзакции, поэтому изменения не теряются между ними).
+        3. Существующие строки копируются пакетами (`copy_in_batches`).
+        4. В одной короткой транзакции таблицы меняются именами (блокировка ожидается не
+    дольше lock_timeout, см. `locked_transaction`); прежняя таблица остается
+    как user_candidate_unpartitioned и удаляется вручную после проверки.
+
+    При USER_CANDIDATE_PARTITIONS = 0 схема не изменяется.
+    """
+    if not partitions:
+        logger.info("Секционирование user_candidate отключено (USER_CANDIDATE_PARTITIONS=0)")
+        return
+    db._execute("SELECT relkind FROM pg_class WHERE relname = 'user_candidate'")
+    row = db.cur.fetchone()
+    if row and row[0] == 'p':
+        logger.info("Таблица user_candidate уже секционирована")
+        return
+
+    db._execute("""
+        CREATE TABLE IF NOT EXISTS user_candidate_partitioned (
+            id BIGINT NOT NULL DEFAULT nextval('user_candidate_id_seq'),
+            user_id BIGINT NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+            candidate_id BIGINT REFERENCES candidate(id) ON DELETE CASCADE,
+            preference BOOLEAN NOT NULL,
+            PRIMARY KEY (user_id, id)
+        ) PARTITION BY HASH (user_id)
+    """)
+    for remainder in range(partitions):
+        db._execute(sql.SQL("""
+            CREATE TABLE IF NOT EXISTS {} PARTITION OF user_candidate_partitioned
+            FOR VALUES WITH (MODULUS {}, REMAINDER {})
+        """).format(sql.Identifier(f'user_candidate_p{remainder}'),
+                    sql.Literal(partitions), sql.Literal(remainder)))
+    db._execute("""
+        CREATE INDEX IF NOT EXISTS user_candidate_partitioned_user_id_candidate_id_idx
+        ON user_candidate_partitioned (user_id, candidate_id)
+    """)
+
+    locked_transaction(db, _create_user_candidate_mirror)
+
+    copy_in_batches(db, 'user_candidate', 'user_candidate_partitioned',
+                    'id, user_id, candidate_id, preference')
+
+    locked_transaction(db, _swap_user_candidate)
+    logger.info("Таблица user_candidate секционирована; прежняя таблица сохранена "
+                "как user_candidate_unpartitioned")
+
+
+def _create_user_candidate_mirror(db):
+    """Функция и триггер зеркалирования user_candidate (пересоздаются в одной транзакции)."""
+    db._execute("""
+        CREATE OR REPLACE FUNCTION user_candidate_mirror() RETURNS trigger AS $$
+        BEGIN
+            IF TG_OP IN ('UPDATE', 'DELETE') THEN
+                DELETE FROM user_candidate_partitioned
+                WHERE user_id = OLD.user_id AND id = OLD.id;
+            END IF;
+            IF TG_OP IN ('INSERT', 'UPDATE') AND NEW.user_id IS NOT NULL THEN
+                INSERT INTO user_candidate_partitioned (id, user_id, candidate_id, preference)
+                VALUES (NEW.id, NEW.user_id, NEW.candidate_id, NEW.preference)
+                ON CONFLICT DO NOTHING;
+            END IF;
+            RETURN NULL;
+        END
+        $$ LANGUAGE plpgsql
+    """)
+    db._execute("DROP TRIGGER IF EXISTS user_candidate_mirror ON user_candidate")
+    db._execute("""
+        CREATE TRIGGER user_candidate_mirror
+        AFTER INSERT OR UPDATE OR DELETE ON user_candidate
+        FOR EACH ROW EXECUTE FUNCTION user_candidate_mirror()
+    """)
+
+
+def _swap_user_candidate(db):
+    """Замена user_candidate секционированной таблицей."""
+    db._execute("LOCK TABLE user_candidate IN ACCESS EXCLUSIVE MODE")
+    db._execute("DROP TRIGGER user_candidate_mirror ON user_candidate")
+    db._execute("ALTER TABLE user_candidate RENAME TO user_candidate_unpartitioned")
+    db._execute("ALTER TABLE user_candidate_partitioned RENAME TO user_candidate")
+    db._execute("ALTER SEQUENCE user_candidate_id_seq OWNED BY user_candidate.id")
+    db._execute("DROP FUNCTION user_candidate_mirror()")
+
+
+def _create_candidate_search_trigger(db):
+    """Функция и триггер корзин поиска (пересоздаются в одной транзакции)."""
+    db._execute("""
+        CREATE OR REPLACE FUNCTION candidate_search_refresh() RETURNS trigger AS $$
+        BEGIN
+            IF NEW.city IS NULL OR NEW.gender IS NULL OR NEW.birthday IS NULL THEN
+                DELETE FROM candidate_search WHERE candidate_id = NEW.id;
+            ELSE
+                INSERT INTO candidate_search (candidate_id, city_key, gender, birth_year)
+                VALUES (NEW.id, lower(trim(NEW.city)), NEW.gender,
+                        EXTRACT(YEAR FROM NEW.birthday))
+                ON CONFLICT (candidate_id) DO UPDATE
+                SET city_key = EXCLUDED.city_key, gender = EXCLUDED.gender,
+                    birth_year = EXCLUDED.birth_year;
+            END IF;
+            RETURN NULL;
+        END
+        $$ LANGUAGE plpgsql
+    """)
+    db._execute("DROP TRIGGER IF EXISTS candidate_search_refresh ON candidate")
+    db._execute("""
+        CREATE TRIGGER candidate_search_refresh
+        AFTER INSERT OR UPDATE OF city, gender, birthday ON candidate
+        FOR EACH ROW EXECUTE FUNCTION candidate_search_refresh()
+    """)
+
+
+def _candidate_search_buckets(db, batch_size: int = 5000):
+    """
+        Таблица candidate_search: кандидаты, разложенные по корзинам поиска
+    (нормализованный город, пол, год рождения).
+
+        Таблица поддерживается триггером на candidate при каждой вставке и изменении города,
+    пола или даты рождения, поэтому обновляется по мере поступления кандидатов без полного
+    пересчета. Кандидаты без города, пола или даты рождения в корзины не попадают (поиск
+    их и раньше не находил). Существующие кандидаты добавляются пакетами по возрастанию id.
+        Функция и триггер создаются в одной транзакции до начала заполнения, поэтому
+    изменения кандидатов во время миграции не пропускаются.
+    """
+    db._execute("""
+        CREATE TABLE IF NOT EXISTS candidate_search (
+            candidate_id BIGINT PRIMARY KEY REFERENCES candidate(id) ON DELETE CASCADE,
+            city_key VARCHAR(255) NOT NULL,
+            gender SMALLINT NOT NULL,
+            birth_year SMALLINT NOT NULL
+        )
+    """)
+    db._execute("""
+        CREATE INDEX IF NOT EXISTS candidate_search_bucket_idx
+        ON candidate_search (city_key, gender, birth_year, candidate_id)
+    """)
+
+    locked_transaction(db, _create_candidate_search_trigger)
+
+    query = """
+        WITH batch AS (
+            SELECT id, city, gender, birthday FROM candidate
+            WHERE id > %s ORDER BY id LIMIT %s
+        ), filled AS (
+            INSERT INTO candidate_search (candidate_id, city_key, gender, birth_year)
+            SELECT id, lower(trim(city)), gender, EXTRACT(YEAR FROM birthday) FROM batch
+            WHERE city IS NOT NULL AND gender IS NOT NULL AND birthday IS NOT NULL
+            ON CONFLICT (candidate_id) DO NOTHING
+        )
+        SELECT max(id), count(*) FROM batch
+    """
+    last_id, total = 0, 0
+    while True:
+        db._execute(query, (last_id, batch_size))
+        max_id, count = db.cur.fetchone()
+        total += count
+        if count < batch_size:
+            break
+        last_id = max_id
+    logger.info(f"Корзины поиска заполнены для {total} кандидатов")
+
+
+def _city_ids(db):
+    """
+        Идентификаторы городов VK вместо сравнения названий.
+
+        В users, candidate и корзины поиска candidate_search добавляется city_id; триггер
+    корзин переносит его из candidate. Таблица city_alias хранит соответствие введенных
+    пользователями названий и id городов VK, чтобы название разрешалось через VK один раз.
+    Кандидаты, сохраненные до миграции, остаются без city_id и находятся по названию.
+        Столбцы добавляются и триггер пересоздается в коротких транзакциях, ожидающих
+    блокировку не дольше lock_timeout (см. `locked_transaction`).
+    """
+    for table in ('users', 'candidate', 'candidate_search'):
+        locked_transaction(db, lambda db, table=table: db._execute(
+            sql.SQL("ALTER TABLE {} ADD COLUMN IF NOT EXISTS city_id INTEGER")
+            .format(sql.Identifier(table))))
+    db._execute("""
+        CREATE TABLE IF NOT EXISTS city_alias (
+            name_key VARCHAR(255) PRIMARY KEY,
+            city_id INTEGER NOT NULL
+        )
+    """)
+
+    locked_transaction(db, _create_city_id_search_trigger)
+
+    create_index_concurrently(db, 'candidate_search_city_id_idx', 'candidate_search',
+                              'city_id, gender, birth_year, candidate_id')
+
+
+def _create_city_id_search_trigger(db):
+    """Функция и триггер корзин поиска с переносом city_id (пересоздаются в одной транзакции)."""
+    db._execute("""
+        CREATE OR REPLACE FUNCTION candidate_search_refresh() RETURNS trigger AS $$
+        BEGIN
+            IF NEW.city IS NULL OR NEW.gender IS NULL OR NEW.birthday IS NULL THEN
+                DELETE FROM candidate_search WHERE candidate_id = NEW.id;
+            ELSE
+                INSERT INTO candidate_search (candidate_id, city_key, city_id, gender, birth_year)
+                VALUES (NEW.id, lower(trim(NEW.city)), NEW.city_id, NEW.gender,
+                        EXTRACT(YEAR FROM NEW.birthday))
+                ON CONFLICT (candidate_id) DO UPDATE
+                SET city_key = EXCLUDED.city_key, city_id = EXCLUDED.city_id,
+                    gender = EXCLUDED.gender, birth_year = EXCLUDED.birth_year;
+            END IF;
+            RETURN NULL;
+        END
+        $$ LANGUAGE plpgsql
+    """)
+    db._execute("DROP TRIGGER IF EXISTS candidate_search_refresh ON candidate")
+    db._execute("""
+        CREATE TRIGGER candidate_search_refresh
+        AFTER INSERT OR UPDATE OF city, city_id, gender, birthday ON candidate
+        FOR EACH ROW EXECUTE FUNCTION candidate_search_refresh()
+    """)
+
+
+def _decision_retention(db):
+    """
+        Архив холодных оценок (см. модуль retention).
+
+        В user_candidate добавляется время оценки decided_at, в users - время последнего
+    обращения к боту last_active_at; строкам, существовавшим до миграции, проставляется
+    время миграции. Таблица user_candidate_archive хранит перенесенные оценки с индексом
+    (user_id, candidate_id) для исключения оцененных кандидатов из поиска. Частичный индекс
+    по decided_at дизлайков и индекс по last_active_at позволяют находить холодные строки
+    без просмотра таблиц.
+        Столбцы добавляются и архив создается в коротких транзакциях, ожидающих блокировку
+    не дольше lock_timeout (см. `locked_transaction`).
+    """
+    locked_transaction(db, lambda db: db._execute(
+        "ALTER TABLE user_candidate "
+        "ADD COLUMN IF NOT EXISTS decided_at TIMESTAMPTZ NOT NULL DEFAULT now()"))
+    locked_transaction(db, lambda db: db._execute(
+        "ALTER TABLE users "
+        "ADD COLUMN IF NOT EXISTS last_active_at TIMESTAMPTZ NOT NULL DEFAULT now()"))
+    locked_transaction(db, _create_decision_archive)
+
+    create_index_concurrently(db, 'users_last_active_at_idx', 'users', 'last_active_at')
+    create_partitioned_index(db, 'user_candidate_dislike_decided_at_idx', 'user_candidate',
+                             'decided_at', where='NOT preference')
+
+
+def _create_decision_archive(db):
+    """Таблица архива оценок с индексом (внешние ключи блокируют users и candidate)."""
+    db._execute("""
+        CREATE TABLE IF NOT EXISTS user_candidate_archive (
+            id BIGINT PRIMARY KEY,
+            user_id BIGINT NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+            candidate_id BIGINT REFERENCES candidate(id) ON DELETE CASCADE,
+            preference BOOLEAN NOT NULL,
+            decided_at TIMESTAMPTZ NOT NULL,
+            archived_at TIMESTAMPTZ NOT NULL DEFAULT now()
+        )
+    """)
+    db._execute("""
+        CREATE INDEX IF NOT EXISTS user_candidate_archive_user_id_candidate_id_idx
+        ON user_candidate_archive (user_id, candidate_id)
+    """)
+
+
+def _create_decision_counters(db):
+    """Таблицы счетчиков оценок (внешние ключи блокируют users и candidate)."""
+    db._execute("""
+        CREATE TABLE IF NOT EXISTS candidate_stats (
+            candidate_id BIGINT PRIMARY KEY REFERENCES candidate(id) ON DELETE CASCADE,
+            likes INTEGER NOT NULL DEFAULT 0,
+            dislikes INTEGER NOT NULL DEFAULT 0
+        )
+    """)
+    db._execute("""
+        CREATE TABLE IF NOT EXISTS user_stats (
+            user_id BIGINT PRIMARY KEY REFERENCES users(id) ON DELETE CASCADE,
+            favorites INTEGER NOT NULL DEFAULT 0
+        )
+    """)
+    db._execute("""
+        CREATE TABLE IF NOT EXISTS user_daily_decisions (
+            user_id BIGINT NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+            day DATE NOT NULL,
+            decisions INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (user_id, day)
+        )
+    """)
+
+
+# Поправки счетчиков: (таблица счетчика, ключ, значения, родительская таблица, столбец ссылки)
+COUNTER_BACKFILLS = (
+    ('candidate_stats', 'candidate_id', ('likes', 'dislikes'), 'candidate', 'candidate_id'),
+    ('user_stats', 'user_id', ('favorites',), 'users', 'user_id'),
+    ('user_daily_decisions', 'user_id, day', ('decisions',), 'users', 'user_id'),
+)
+
+
+def _collect_counter_backfills(db):
+    """
+    Поправки счетчиков по одному снимку данных (REPEATABLE READ).
+
+    Поправка - разность между подсчетом оценок и значением счетчика в снимке, поэтому
+    прибавки бота, зафиксированные до снимка, не учитываются дважды, а после снимка -
+    не теряются. Поправки сохраняются в таблицы {счетчик}_backfill.
+    """
+    db._execute("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ")
+    decisions = """(
+        SELECT user_id, candidate_id, preference, decided_at FROM user_candidate
+        UNION ALL
+        SELECT user_id, candidate_id, preference, decided_at FROM user_candidate_archive
+    ) d"""
+    db._execute(f"""
+        CREATE TABLE candidate_stats_backfill AS
+        SELECT candidate_id, sum(likes)::int AS likes, sum(dislikes)::int AS dislikes FROM (
+            SELECT candidate_id, count(*) FILTER (WHERE preference) AS likes,
+                   count(*) FILTER (WHERE NOT preference) AS dislikes
+            FROM {decisions}
+            WHERE candidate_id IS NOT NULL
+            GROUP BY candidate_id
+            UNION ALL
+            SELECT candidate_id, -likes, -dislikes FROM candidate_stats
+        ) c
+        GROUP BY candidate_id
+        HAVING sum(likes) <> 0 OR sum(dislikes) <> 0
+    """)
+    db._execute(f"""
+        CREATE TABLE user_stats_backfill AS
+        SELECT user_id, sum(favorites)::int AS favorites FROM (
+            SELECT user_id, count(*) FILTER (WHERE preference) AS favorites FROM {decisions}
+            WHERE user_id IS NOT NULL
+            GROUP BY user_id
+            UNION ALL
+            SELECT user_id, -favorites FROM user_stats
+        ) c
+        GROUP BY user_id
+        HAVING sum(favorites) <> 0
+    """)
+    db._execute(f"""
+        CREATE TABLE user_daily_decisions_backfill AS
+        SELECT user_id, day, sum(decisions)::int AS decisions FROM (
+            SELECT user_id, decided_at::date AS day, count(*) AS decisions FROM {decisions}
+            WHERE user_id IS NOT NULL
+              AND decided_at > COALESCE(
+                  (SELECT applied_at FROM schema_migrations WHERE version = 7), '-infinity')
+            GROUP BY user_id, decided_at::date
+            UNION ALL
+            SELECT user_id, day, -decisions FROM user_daily_decisions
+        ) c
+        GROUP BY user_id, day
+        HAVING sum(decisions) <> 0
+    """)
+
+
+def _apply_counter_backfill(db, table: str, key: str, values: tuple, parent: str,
+                            parent_key: str, batch_size: int) -> int:
+    """
+    Прибавляет поправки из {table}_backfill к счетчикам пакетами.
+
+    Каждый пакет удаляется из таблицы поправок и прибавляется к счетчикам одним запросом,
+    поэтому прерванное применение можно продолжить. Таблица поправок остается пустой
+    до конца миграции. Прибавление коммутирует с прибавками
+    бота и блокирует только строки пакета.
+
+    :return: int Количество примененных поправок.
+    """
+    staging = sql.Identifier(f'{table}_backfill')
+    columns = sql.SQL(', ').join(sql.Identifier(column.strip())
+                                 for column in (*key.split(','), *values))
+    increments = sql.SQL(', ').join(
+        sql.SQL("{value} = {table}.{value} + EXCLUDED.{value}").format(
+            value=sql.Identifier(value), table=sql.Identifier(table))
+        for value in values)
+    query = sql.SQL("""
+        WITH batch AS (
+            DELETE FROM {staging} WHERE ctid IN (SELECT ctid FROM {staging} LIMIT %s)
+            RETURNING {columns}
+        ), applied AS (
+            INSERT INTO {table} ({columns})
+            SELECT {columns} FROM batch
+            WHERE EXISTS (SELECT 1 FROM {parent} p WHERE p.id = batch.{parent_key})
+            ON CONFLICT ({key}) DO UPDATE SET {increments}
+        )
+        SELECT count(*) FROM batch
+    """).format(staging=staging, columns=columns, table=sql.Identifier(table),
+                parent=sql.Identifier(parent), parent_key=sql.Identifier(parent_key),
+                key=sql.SQL(key), increments=increments)
+    total = 0
+    while True:
+        db._execute(query, (batch_size,))
+        count = db.cur.fetchone()[0]
+        total += count
+        if count < batch_size:
+            break
+    logger.info(f"Счетчики {table}: применено {total} поправок")
+    return total
+
+
+def _decision_counters(db, batch_size: int = 5000):
+    """
+        Счетчики оценок, обновляемые вместе с оценками (см. `ADD_DECISION_QUERY` в utils.py).
+
+        candidate_stats - лайки и дизлайки кандидата, user_stats - количество избранных
+    пользователя, user_daily_decisions - оценки пользователя по дням. Заполнение не
+    блокирует запись оценок:
+        1. Таблицы счетчиков создаются в короткой транзакции (`locked_transaction`); с этого
+    момента бот прибавляет к ним каждую новую оценку.
+        2. По одному снимку данных вычисляются поправки - разность между подсчетом текущих
+    и архивных оценок и счетчиками в том же снимке (`_collect_counter_backfills`).
+        3. Поправки прибавляются к счетчикам пакетами (`_apply_counter_backfill`).
+    Если применение было прервано, при повторном запуске продолжается применение
+    сохраненных поправок.
+        Оценки, сохраненные до миграции 7, не имеют настоящего времени: decided_at у них
+    равно времени той миграции. Чтобы они не попали в один день, по дням учитываются только
+    оценки после записи миграции 7 в schema_migrations (оценки, сохраненные во время ее
+    выполнения, тоже не учитываются); в candidate_stats и user_stats входят все оценки.
+    """
+    locked_transaction(db, _create_decision_counters)
+
+    db._execute("SELECT to_regclass('candidate_stats_backfill') IS NULL")
+    if db.cur.fetchone()[0]:
+        with transaction(db):
+            _collect_counter_backfills(db)
+
+    for table, key, values, parent, parent_key in COUNTER_BACKFILLS:
+        _apply_counter_backfill(db, table, key, values, parent, parent_key, batch_size)
+    db._execute("DROP TABLE candidate_stats_backfill, user_stats_backfill, "
+                "user_daily_decisions_backfill")
+
+
+MIGRATIONS = [
+    Migration(1, 'initial schema', _initial_schema),
+    Migration(2, 'user_candidate (user_id, candidate_id) index', _user_candidate_user_index,
+              transactional=False),
+    Migration(3, 'candidate search index', _candidate_search_index, transactional=False),
+    Migration(4, 'hash-partition user_candidate by user_id', _partition_user_candidate,
+              transactional=False),
+    Migration(5, 'candidate search buckets', _candidate_search_buckets, transactional=False),
+    Migration(6, 'VK city ids', _city_ids, transactional=False),
+    Migration(7, 'user_candidate archive', _decision_retention, transactional=False),
+    Migration(8, 'decision counters', _decision_counters, transactional=False),
+]
+
+LATEST_VERSION = MIGRATIONS[-1].version
+
+
+class Migrator:
+    """
+    Применяет миграции схемы к базе данных.
+
+    Атрибуты:
+    - db: Объект `Database`, через соединение которого выполняются миграции.
+    - migrations: Упорядоченный список миграций.
+    """
+
+    def __init__(self, db, migrations: list[Migration] = None):
+        """
+        :param db: Database Объект базы данных.
+        :param migrations: list[Migration] Миграции (по умолчанию `MIGRATIONS`).
+        """
+        self.db = db
+        self.migrations = sorted(MIGRATIONS if migrations is None else migrations,
+                                 key=lambda migration: migration.version)
+
+    def applied_versions(self) -> set[int]:
+        """
+        Возвращает номера примененных миграций, создавая таблицу версий при необходимости.
+
+        :return: set[int] Примененные версии.
+        """
+        self.db._execute("""
+            CREATE TABLE IF NOT EXISTS schema_migrations (
+                version INTEGER PRIMARY KEY,
+                name TEXT NOT NULL,
+                applied_at TIMESTAMPTZ NOT NULL DEFAULT now()
+            )
+        """)
+        self.db._execute("SELECT version FROM schema_migrations")
+        versions = {row[0] for row in self.db.cur.fetchall()}
+        self.db.conn.commit()
+        return versions
+
+    def pending(self) -> list[Migration]:
+        """Возвращает миграции, которые еще не применены."""
+        applied = self.applied_versions()
+        return [migration for migration in self.migrations if migration.version not in applied]
+
+    def migrate(self) -> list[int]:
+        """
+        Применяет недостающие миграции по порядку под advisory lock.
+
+        При ошибке миграции выполнение останавливается; следующие миграции не применяются,
+        а исключение передается вызывающему коду.
+
+        :return: list[int] Версии примененных миграций.
+        """
+        conn = self.db.conn
+        self.db._execute("SELECT pg_advisory_lock(%s)", (MIGRATIONS_LOCK_KEY,))
+        conn.commit()
+        applied = []
+        try:
+            for migration in self.pending():
+                self._apply(migration)
+                applied.append(migration.version)
+        finally:
+            self.db._execute("SELECT pg_advisory_unlock(%s)", (MIGRATIONS_LOCK_KEY,))
+            conn.commit()
+        if applied:
+            logger.info(f"Применены миграции схемы: {applied}")
+        return applied
+
+    def _apply(self, migration: Migration):
+        """
+        Применяет одну миграцию и записывает ее версию.
+
+        :param migration: Migration Миграция.
+        """
+        conn = self.db.conn
+        logger.info(f"Миграция {migration.version}: {migration.name}")
+        if migration.transactional:
+            try:
+                migration.apply(self.db)
+                self._record(migration)
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+            return
+
+        conn.autocommit = True
+        try:
+            migration.apply(self.db)
+            self._record(migration)
+        finally:
+            conn.autocommit = False
+
+    def _record(self, migration: Migration):
+        self.db._execute("INSERT INTO schema_migrations (version, name) VALUES (%s, %s)",
+                         (migration.version, migration.name))
+
+
+def main(argv=None) -> int:
+    from config import config_logging
+    from database import Database
+
+    parser = argparse.ArgumentParser(description='Миграции схемы базы данных VK бота.')
+    parser.add_argument('--status', action='store_true',
+                        help='Показать примененные и ожидающие миграции без их применения.')
+    args = parser.parse_args(argv)
+
+    config_logging()
+    migrator = Migrator(Database())
+    if args.status:
+        pending = {migration.version for migration in migrator.pending()}
+        for migration in migrator.migrations:
+            mark = 'ожидает' if migration.version in pending else 'применена'
+            print(f"{migration.version:>4}  {mark:10} {migration.name}")
+        return 0
+    migrator.migrate()
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -0,0 +1,242 @@
+"""
+Модуль profiling.py
+
+Этот модуль позволяет включать профилирование работающего бота без перезапуска.
+
+Поддерживаются два режима:
+- 'cprofile': детерминированный профайлер cProfile для основного потока, результат
+  сохраняется в формате pstats (открывается `python -m pstats` или snakeviz);
+- 'sampling': семплирующий профайлер, который периодически снимает стек основного потока
+  и сохраняет свернутые стеки (collapsed stacks) для построения flame graph.
+
+Одновременно включается tracemalloc, и при остановке сохраняется список мест с наибольшим
+объемом выделенной памяти.
+
+Управление:
+- сигнал SIGUSR1 включает/выключает профилирование (`install_signal_handler`); само
+  переключение выполняет основной поток между событиями (`Profiler.run_pending`);
+- команды администратора в чате: "/profile start", "/profile start sampling",
+  "/profile stop", "/profile memory" (см. Handler).
+"""
+import cProfile
+import logging
+import os
+import signal
+import sys
+import threading
+import tracemalloc
+
+from collections import Counter
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+
+class SamplingProfiler:
+    """
+    Семплирующий профайлер стека одного потока.
+    """
+
+    def __init__(self, thread_id: int, interval: float = 0.005):
+        """
+        :param thread_id: int Идентификатор профилируемого потока.
+        :param interval: float Интервал снятия стека в секундах.
+        """
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        """Запускает фоновый поток снятия стеков."""
+        self._thread = threading.Thread(target=self._run, name='sampling-profiler', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Останавливает снятие стеков."""
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                frame = frame.f_back
+            if stack:
+                self.stacks[';'.join(reversed(stack))] += 1
+
+    def dump(self, path: str):
+        """
+        Сохраняет свернутые стеки в файл (формат flamegraph.pl / speedscope).
+
+        :param path: str Путь к файлу.
+        """
+        with open(path, 'w', encoding='utf-8') as file:
+            for stack, count in self.stacks.most_common():
+                file.write(f"{stack} {count}\n")
+
+
+class Profiler:
+    """
+    Управляет профилированием процесса бота.
+
+    Атрибуты:
+    - output_dir: Каталог для сохранения результатов профилирования.
+    - mode: Текущий режим ('cprofile', 'sampling') или None, если профилирование выключено.
+    """
+
+    def __init__(self, output_dir: str = 'profiles', top_allocations: int = 25):
+        """
+        :param output_dir: str Каталог для сохранения результатов.
+        :param top_allocations: int Количество мест выделения памяти в отчете tracemalloc.
+        """
+        self.output_dir = output_dir
+        self.top_allocations = top_allocations
+        self.mode = None
+        self._profiler = None
+        self._started_tracemalloc = False
+        self._toggle_requested = False
+        self._lock = threading.Lock()
+
+    @property
+    def active(self) -> bool:
+        """True, если профилирование включено."""
+        return self.mode is not None
+
+    def start(self, mode: str = 'cprofile') -> str:
+        """
+        Включает профилирование основного потока.
+
+        :param mode: str 'cprofile' или 'sampling'.
+        :return: str Сообщение о результате.
+        """
+        with self._lock:
+            if self.active:
+                return f"Профилирование уже запущено ({self.mode})"
+            if mode not in ('cprofile', 'sampling'):
+                return f"Неизвестный режим профилирования: {mode}"
+
+            if mode == 'cprofile':
+                self._profiler = cProfile.Profile()
+                self._profiler.enable()
+            else:
+                self._profiler = SamplingProfiler(threading.main_thread().ident)
+                self._profiler.start()
+
+            if not tracemalloc.is_tracing():
+                tracemalloc.start(25)
+                self._started_tracemalloc = True
+            self.mode = mode
+
+        logger.info(f"Профилирование запущено ({mode})")
+        return f"Профилирование запущено ({mode})"
+
+    def stop(self) -> str:
+        """
+        Выключает профилирование и сохраняет результаты.
+
+        :return: str Сообщение с путями к сохраненным файлам.
+        """
+        with self._lock:
+            if not self.active:
+                return "Профилирование не запущено"
+
+            os.makedirs(self.output_dir, exist_ok=True)
+            stamp = datetime.now().strftime('%Y%m%d-%H%M%S')
+            if self.mode == 'cprofile':
+                self._profiler.disable()
+                profile_path = os.path.join(self.output_dir, f'profile-{stamp}.pstats')
+                self._profiler.dump_stats(profile_path)
+            else:
+                self._profiler.stop()
+                profile_path = os.path.join(self.output_dir, f'profile-{stamp}.collapsed')
+                self._profiler.dump(profile_path)
+
+            memory_path = self._dump_memory(stamp)
+            if self._started_tracemalloc:
+                tracemalloc.stop()
+                self._started_tracemalloc = False
+            self._profiler = None
+            self.mode = None
+
+        logger.info(f"Профилирование остановлено: {profile_path}, {memory_path}")
+        return f"Профилирование остановлено. Файлы: {profile_path}, {memory_path}"
+
+    def toggle(self) -> str:
+        """Включает профилирование, если оно выключено, иначе выключает."""
+        return self.stop() if self.active else self.start()
+
+    def request_toggle(self):
+        """
+        Запрашивает переключение профилирования.
+
+        Только устанавливает флаг, поэтому безопасен в обработчике сигнала: включение
+        cProfile, снимки tracemalloc и запись файлов выполняет `run_pending` вне него.
+        """
+        self._toggle_requested = True
+
+    def run_pending(self) -> str | None:
+        """
+        Выполняет запрошенное переключение профилирования.
+
+        Вызывается основным потоком (cProfile профилирует поток, в котором включен).
+
+        :return: str | None Сообщение о результате или None, если переключение не запрошено.
+        """
+        if not self._toggle_requested:
+            return None
+        self._toggle_requested = False
+        return self.toggle()
+
+    def memory_snapshot(self) -> str:
+        """
+        Сохраняет текущий отчет tracemalloc, не останавливая профилирование.
+
+        :return: str Сообщение с путем к файлу.
+        """
+        if not tracemalloc.is_tracing():
+            return "tracemalloc не запущен, сначала выполните /profile start"
+        path = self._dump_memory(datetime.now().strftime('%Y%m%d-%H%M%S'))
+        return f"Снимок памяти сохранен: {path}"
+
+    def _dump_memory(self, stamp: str) -> str | None:
+        """
+        Сохраняет места с наибольшим объемом выделенной памяти.
+
+        :param stamp: str Метка времени для имени файла.
+        :return: str | None Путь к файлу или None, если tracemalloc не запущен.
+        """
+        if not tracemalloc.is_tracing():
+            return None
+        os.makedirs(self.output_dir, exist_ok=True)
+        path = os.path.join(self.output_dir, f'memory-{stamp}.txt')
+        statistics = tracemalloc.take_snapshot().statistics('lineno')
+        current, peak = tracemalloc.get_traced_memory()
+        with open(path, 'w', encoding='utf-8') as file:
+            file.write(f"current={current} peak={peak}\n")
+            for stat in statistics[:self.top_allocations]:
+                file.write(f"{stat}\n")
+        return path
+
+
+def install_signal_handler(profiler: Profiler, signum: int = getattr(signal, 'SIGUSR1', None)):
+    """
+    Устанавливает обработчик сигнала, включающий/выключающий профилирование.
+
+    Обработчик только запрашивает переключение (`Profiler.request_toggle`), а выполняет
+    его основной поток перед обработкой следующего события (`Profiler.run_pending`).
+
+    Пример: `kill -USR1 <pid>`.
+
+    :param profiler: Profiler Профайлер процесса.
+    :param signum: int Номер сигнала (по умолчанию SIGUSR1; на Windows недоступен).
+    """
+    if signum is None:
+        logger.warning("Сигнал для профилирования недоступен на этой платформе")
+        return
+    signal.signal(signum, lambda *_: profiler.request_toggle())
@@ -0,0 +1,114 @@
+"""
+Модуль registration.py
+
+Этот модуль содержит фоновый конвейер регистрации пользователей.
+
+Регистрация требует нескольких запросов к VK API (`users.get`, `photos.get`) и вставки в
+таблицу `users`. Чтобы медленный ответ VK не блокировал обработку сообщений, задача
+регистрации выполняется в отдельном потоке, а пользователь получает ответ сразу.
+По завершении задачи вызывается функция обратного вызова с итоговым сообщением.
+
+Пример использования:
+    pipeline = RegistrationPipeline(on_complete)
+    pipeline.submit(user_vk_id, user_name)
+"""
+import logging
+import threading
+
+from concurrent.futures import ThreadPoolExecutor
+from utils import AuxiliaryUtils
+
+logger = logging.getLogger(__name__)
+
+
+class RegistrationPipeline:
+    """
+        Фоновый конвейер регистрации пользователей.
+
+        Каждый рабочий поток создает собственный экземпляр `AuxiliaryUtils` (и, соответственно,
+    собственное соединение с базой данных), поэтому соединение обработчика сообщений не
+    используется из нескольких потоков. Повторная постановка задачи для пользователя, чья
+    регистрация еще выполняется, игнорируется.
+
+    Атрибуты:
+    - on_complete: Функция (user_vk_id, user_name, info_message), вызываемая по завершении задачи.
+    """
+
+    def __init__(self, on_complete, utils_factory=AuxiliaryUtils, max_workers: int = 1):
+        """
+        :param on_complete: Функция обратного вызова для сообщения о результате регистрации.
+        :param utils_factory: Фабрика объектов с методом `prepare_user_candidate_data`.
+        :param max_workers: int Количество рабочих потоков.
+        """
+        self.on_complete = on_complete
+        self._utils_factory = utils_factory
+        self._executor = ThreadPoolExecutor(max_workers=max_workers,
+                                            thread_name_prefix='registration')
+        self._local = threading.local()
+        self._pending = set()
+        self._lock = threading.Lock()
+
+    def submit(self, user_vk_id: int, user_name: str) -> bool:
+        """
+        Ставит задачу регистрации пользователя в очередь.
+
+        :param user_vk_id: int VK ID пользователя.
+        :param user_name: str Имя пользователя для итогового сообщения.
+        :return: True, если задача поставлена, False, если регистрация уже выполняется.
+        """
+        with self._lock:
+            if user_vk_id in self._pending:
+                return False
+            self._pending.add(user_vk_id)
+
+        self._executor.submit(self._run, user_vk_id, user_name)
+        return True
+
+    def is_pending(self, user_vk_id: int) -> bool:
+        """
+        Проверяет, выполняется ли регистрация пользователя.
+
+        :param user_vk_id: int VK ID пользователя.
+        :return: True, если задача регистрации еще не завершена.
+        """
+        with self._lock:
+            return user_vk_id in self._pending
+
+    def shutdown(self, wait: bool = True):
+        """
+        Останавливает рабочие потоки.
+
+        :param wait: bool Если True, дожидается завершения поставленных задач.
+        """
+        self._executor.shutdown(wait=wait)
+
+    def _get_utils(self):
+        """Возвращает экземпляр вспомогательных утилит текущего рабочего потока."""
+        utils = getattr(self._local, 'utils', None)
+        if utils is None:
+            utils = self._utils_factory()
+            self._local.utils = utils
+        return utils
+
+    def _run(self, user_vk_id: int, user_name: str):
+        """
+        Выполняет регистрацию пользователя и сообщает о результате.
+
+        :param user_vk_id: int VK ID пользователя.
+        :param user_name: str Имя пользователя.
+        """
+        try:
+            info_message = self._get_utils().prepare_user_candidate_data(user_vk_id)
+        except Exception as e:
+            logger.error(f'Ошибка фоновой регистрации пользователя {user_vk_id}: {e}',
+                         exc_info=True)
+            info_message = 'Регистрация провалена⛔'
+        finally:
+            with self._lock:
+                self._pending.discard(user_vk_id)
+
+        try:
+            self.on_complete(user_vk_id, user_name, info_message)
+        except Exception as e:
+            logger.error(f'Не удалось сообщить о регистрации пользователю {user_vk_id}: {e}',
+                         exc_info=True)
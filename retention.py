@@ -0,0 +1,156 @@
+"""
+Модуль retention.py
+
+Перенос холодной истории оценок из `user_candidate` в архив `user_candidate_archive`.
+
+Холодными считаются:
+- все оценки пользователей, которые не обращались к боту `RETENTION_INACTIVE_DAYS` дней
+  (по `users.last_active_at`);
+- дизлайки старше `RETENTION_DISLIKE_DAYS` дней (по `user_candidate.decided_at`).
+
+Строки переносятся пакетами по `RETENTION_BATCH_SIZE`: каждый пакет удаляется из
+`user_candidate` и вставляется в архив одним запросом и фиксируется отдельно, а между пакетами
+задание выжидает `RETENTION_PAUSE_SECONDS`, чтобы не мешать работе бота. Строки,
+заблокированные ботом, пропускаются (SKIP LOCKED) и переносятся при следующем запуске.
+
+Архивные оценки по-прежнему исключаются из поиска (см. `DatabaseUtils.search_for_candidates_db`),
+а лайки вернувшегося пользователя возвращаются в `user_candidate` при его обращении
+(см. `DatabaseUtils.touch_user`), поэтому избранное не теряется.
+
+Пример запуска из корня репозитория:
+    python retention.py          # перенести холодные строки и завершиться
+    python retention.py --loop   # повторять перенос каждые RETENTION_INTERVAL_SECONDS
+"""
+import argparse
+import logging
+
+from time import perf_counter, sleep
+from config import RETENTION_DISLIKE_DAYS, RETENTION_INACTIVE_DAYS, RETENTION_BATCH_SIZE, \
+    RETENTION_PAUSE_SECONDS, RETENTION_INTERVAL_SECONDS
+from metrics import registry
+
+logger = logging.getLogger(__name__)
+
+# Перенос пакета холодных строк: {condition} отбирает строки user_candidate uc.
+# Строка с id, уже бывшим в архиве (лайк, возвращенный `touch_user` и снова ставший холодным,
+# или строка прерванного запуска), заменяет архивную, поэтому удаленная строка не теряется.
+ARCHIVE_BATCH_QUERY = """
+    WITH cold AS (
+        SELECT uc.user_id, uc.id FROM user_candidate uc
+        WHERE {condition}
+        LIMIT %s
+        FOR UPDATE SKIP LOCKED
+    ), moved AS (
+        DELETE FROM user_candidate uc USING cold
+        WHERE uc.user_id = cold.user_id AND uc.id = cold.id
+        RETURNING uc.id, uc.user_id, uc.candidate_id, uc.preference, uc.decided_at
+    ), archived AS (
+        INSERT INTO user_candidate_archive (id, user_id, candidate_id, preference, decided_at)
+        SELECT id, user_id, candidate_id, preference, decided_at FROM moved
+        ON CONFLICT (id) DO UPDATE
+        SET preference = EXCLUDED.preference, decided_at = EXCLUDED.decided_at,
+            archived_at = now()
+    )
+    SELECT count(*) FROM moved
+"""
+
+INACTIVE_USERS_CONDITION = """
+    uc.user_id IN (
+        SELECT id FROM users WHERE last_active_at < now() - make_interval(days => %s)
+    )
+"""
+
+OLD_DISLIKES_CONDITION = """
+    NOT uc.preference AND uc.decided_at < now() - make_interval(days => %s)
+"""
+
+
+class RetentionJob:
+    """
+        Задание переноса холодных оценок в архив.
+
+    Атрибуты:
+    - db: Объект `Database`, через который выполняется перенос.
+    - dislike_days: Срок хранения дизлайков в `user_candidate`, дней.
+    - inactive_days: Срок неактивности пользователя, после которого переносятся все его оценки.
+    - batch_size: Количество строк в пакете.
+    - pause: Пауза между пакетами в секундах.
+    """
+
+    def __init__(self, db, dislike_days: int = RETENTION_DISLIKE_DAYS,
+                 inactive_days: int = RETENTION_INACTIVE_DAYS,
+                 batch_size: int = RETENTION_BATCH_SIZE, pause: float = RETENTION_PAUSE_SECONDS,
+                 sleep=sleep):
+        """
+        :param db: Database Объект базы данных.
+        :param dislike_days: int Срок хранения дизлайков, дней.
+        :param inactive_days: int Срок неактивности пользователя, дней.
+        :param batch_size: int Количество строк в пакете.
+        :param pause: float Пауза между пакетами в секундах.
+        :param sleep: Функция ожидания (для тестов).
+        """
+        self.db = db
+        self.dislike_days = dislike_days
+        self.inactive_days = inactive_days
+        self.batch_size = batch_size
+        self.pause = pause
+        self._sleep = sleep
+
+    def run(self) -> dict[str, int]:
+        """
+        Переносит в архив оценки неактивных пользователей и старые дизлайки.
+
+        :return: dict Количество перенесенных строк: {'inactive_users': ..., 'old_dislikes': ...}.
+        """
+        moved = {
+            'inactive_users': self._archive(INACTIVE_USERS_CONDITION, self.inactive_days),
+            'old_dislikes': self._archive(OLD_DISLIKES_CONDITION, self.dislike_days),
+        }
+        logger.info("Перенесено в архив: оценки неактивных пользователей %s, старые дизлайки %s",
+                    moved['inactive_users'], moved['old_dislikes'])
+        return moved
+
+    def _archive(self, condition: str, days: int) -> int:
+        """
+        Переносит пакетами строки, удовлетворяющие условию, пока они не закончатся.
+
+        :param condition: str Условие отбора строк `user_candidate uc` с параметром срока.
+        :param days: int Срок в днях для условия.
+        :return: int Количество перенесенных строк.
+        """
+        query = ARCHIVE_BATCH_QUERY.format(condition=condition)
+        total = 0
+        while True:
+            start = perf_counter()
+            rows = self.db.execute_query(query, (days, self.batch_size), fetch=True)
+            registry.observe('retention.batch', perf_counter() - start)
+            if not rows:
+                logger.error("Перенос в архив прерван из-за ошибки базы данных")
+                return total
+            moved = rows[0][0]
+            total += moved
+            if moved < self.batch_size:
+                return total
+            self._sleep(self.pause)
+
+
+def main(argv=None) -> int:
+    from config import config_logging
+    from database import Database
+
+    parser = argparse.ArgumentParser(description='Перенос холодных оценок в архив.')
+    parser.add_argument('--loop', action='store_true',
+                        help='Повторять перенос каждые RETENTION_INTERVAL_SECONDS секунд.')
+    args = parser.parse_args(argv)
+
+    config_logging()
+    job = RetentionJob(Database())
+    while True:
+        job.run()
+        if not args.loop:
+            return 0
+        sleep(RETENTION_INTERVAL_SECONDS)
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -0,0 +1,103 @@
+"""
+Модуль router.py
+
+Этот модуль содержит табличный маршрутизатор конечного автомата диалога бота.
+
+Маршрут задается парой (состояние, текст запроса). Тексты кнопок нормализуются один раз
+при регистрации маршрута, поэтому поиск обработчика сводится к обращению к словарю.
+Для состояний, в которых допустим произвольный ввод (например, возраст или город),
+регистрируется обработчик по умолчанию.
+
+Пример использования:
+    router = Router()
+    router.add(None, BTN_HELP, self._on_help)
+    router.set_default('waiting_for_age', self._on_age)
+    router.dispatch(state, request, event, user_id, user_name, request)
+"""
+import logging
+
+from time import perf_counter
+from metrics import registry, current_origin
+
+logger = logging.getLogger(__name__)
+
+
+def normalize_text(text: str) -> str:
+    """
+    Приводит текст кнопки или сообщения к виду, в котором он хранится в таблице маршрутов.
+
+    :param text: str Исходный текст.
+    :return: str Нормализованный текст.
+    """
+    return text.lower()
+
+
+class Router:
+    """
+    Таблица переходов конечного автомата диалога.
+
+    Длительность каждого перехода записывается в `metrics.registry` как этап
+    'transition.<состояние>.<имя обработчика>'.
+    """
+
+    def __init__(self):
+        self._routes = {}
+        self._defaults = {}
+
+    def add(self, state: str | None, text: str, handler):
+        """
+        Регистрирует обработчик для пары (состояние, текст запроса).
+
+        :param state: str | None Состояние пользователя, None - пользователь без состояния.
+        :param text: str Текст кнопки или команды. Нормализуется при регистрации.
+        :param handler: Вызываемый объект, обрабатывающий переход.
+        """
+        self._routes[(state, normalize_text(text))] = handler
+
+    def set_default(self, state: str | None, handler):
+        """
+        Регистрирует обработчик для любого запроса, не найденного в таблице для состояния.
+
+        :param state: str | None Состояние пользователя.
+        :param handler: Вызываемый объект, обрабатывающий переход.
+        """
+        self._defaults[state] = handler
+
+    def resolve(self, state: str | None, request: str):
+        """
+        Возвращает обработчик для пары (состояние, запрос).
+
+        :param state: str | None Состояние пользователя.
+        :param request: str Уже нормализованный текст запроса.
+        :return: Обработчик или None, если для состояния ничего не зарегистрировано.
+        """
+        handler = self._routes.get((state, request))
+        if handler is None:
+            handler = self._defaults.get(state)
+        return handler
+
+    def dispatch(self, state: str | None, request: str, *args):
+        """
+        Находит обработчик и вызывает его, замеряя время перехода.
+
+        :param state: str | None Состояние пользователя.
+        :param request: str Нормализованный текст запроса.
+        :param args: Аргументы, передаваемые обработчику.
+        :return: True, если обработчик найден и вызван, иначе False.
+        """
+        handler = self.resolve(state, request)
+        if handler is None:
+            logger.warning("Нет обработчика для состояния %s", state)
+            return False
+
+        name = getattr(handler, '__name__', repr(handler))
+        token = current_origin.set(name)
+        start = perf_counter()
+        try:
+            handler(*args)
+        finally:
+            elapsed = perf_counter() - start
+            current_origin.reset(token)
+            registry.observe(f'transition.{state}.{name}', elapsed)
+            logger.debug("Переход %s -> %s: %.2f мс", state, name, elapsed * 1000)
+        return True
@@ -0,0 +1,217 @@
+"""
+Модуль seen_set.py
+
+Множество кандидатов, которых пользователь уже оценил, в памяти процесса.
+
+Для каждого пользователя при первом обращении (начале сессии поиска) из `user_candidate`
+загружаются его оценки, и VK ID оцененных кандидатов добавляются в компактный фильтр Блума.
+Результаты поиска VK проходят через фильтр до проверки и сохранения кандидатов в базу:
+отрицательный ответ фильтра точен, поэтому такие кандидаты пропускаются без запросов,
+а положительные ответы (среди них возможны ложные) подтверждаются одним запросом к базе.
+Выборки из базы фильтр не проходят: оцененные кандидаты исключаются в самом запросе поиска.
+
+Оценки, перенесенные в архив `user_candidate_archive` (см. retention.py), загружаются и
+подтверждаются вместе с оценками из `user_candidate`.
+
+Фильтр только ускоряет отсев: исключение оцененных кандидатов в SQL-запросах сохраняется,
+поэтому устаревший или вытесненный фильтр не приводит к неверной выдаче.
+"""
+import hashlib
+import logging
+import math
+import threading
+
+from collections import OrderedDict
+from config import SEEN_SET_ERROR_RATE, SEEN_SET_MAX_USERS
+
+logger = logging.getLogger(__name__)
+
+# Все оценки: текущие и перенесенные в архив (условие по user_id применяется к обеим таблицам)
+DECISIONS = """(
+    SELECT user_id, candidate_id FROM user_candidate
+    UNION ALL
+    SELECT user_id, candidate_id FROM user_candidate_archive
+)"""
+
+
+class BloomFilter:
+    """
+        Фильтр Блума на битовом массиве.
+
+    Атрибуты:
+    - capacity: Количество элементов, на которое рассчитан фильтр.
+    - size: Количество битов.
+    - hash_count: Количество хеш-функций.
+    """
+
+    def __init__(self, capacity: int, error_rate: float = SEEN_SET_ERROR_RATE):
+        """
+        :param capacity: int Ожидаемое количество элементов.
+        :param error_rate: float Допустимая доля ложноположительных ответов при `capacity`
+                           элементах.
+        """
+        self.capacity = capacity
+        self.size = max(8, math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hash_count = max(1, round(self.size / capacity * math.log(2)))
+        self._bits = bytearray((self.size + 7) // 8)
+        self._count = 0
+
+    def _positions(self, key):
+        """Возвращает номера битов ключа (двойное хеширование одного дайджеста)."""
+        digest = hashlib.blake2b(repr(key).encode('utf-8'), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        return ((h1 + i * h2) % self.size for i in range(self.hash_count))
+
+    def add(self, key):
+        """
+        Добавляет ключ в фильтр.
+
+        :param key: Хешируемый ключ.
+        """
+        for position in self._positions(key):
+            self._bits[position >> 3] |= 1 << (position & 7)
+        self._count += 1
+
+    def __contains__(self, key) -> bool:
+        return all(self._bits[position >> 3] & (1 << (position & 7))
+                   for position in self._positions(key))
+
+    def __len__(self) -> int:
+        return self._count
+
+
+class SeenCandidates:
+    """
+        Фильтры оцененных кандидатов по пользователям.
+
+    Атрибуты:
+    - db_utils: DatabaseUtils для загрузки оценок и подтверждения положительных ответов.
+    - error_rate: Доля ложноположительных ответов фильтров.
+    - max_users: Количество пользователей, фильтры которых хранятся в памяти; при
+      переполнении вытесняются давно не использовавшиеся.
+    - min_capacity: Минимальная емкость фильтра (запас на оценки текущей сессии).
+    """
+
+    def __init__(self, db_utils, error_rate: float = SEEN_SET_ERROR_RATE,
+                 max_users: int = SEEN_SET_MAX_USERS, min_capacity: int = 1024):
+        """
+        :param db_utils: DatabaseUtils Объект работы с базой данных.
+        :param error_rate: float Доля ложноположительных ответов.
+        :param max_users: int Максимальное количество фильтров в памяти.
+        :param min_capacity: int Минимальная емкость фильтра.
+        """
+        self.db_utils = db_utils
+        self.error_rate = error_rate
+        self.max_users = max_users
+        self.min_capacity = min_capacity
+        self._filters = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _load(self, user_vk_id: int) -> BloomFilter | None:
+        """
+        Загружает оценки пользователя из базы данных в новый фильтр.
+
+        Ключ фильтра - VK ID оцененного кандидата; емкость фильтра берется
+        с двукратным запасом, чтобы новые оценки сессии не повышали долю ложных ответов.
+
+        :param user_vk_id: int VK ID пользователя.
+        :return: BloomFilter | None Фильтр или None, если пользователь не найден или
+                 запрос не выполнен.
+        """
+        user_id = self.db_utils.get_user_id(user_vk_id)
+        if user_id is None:
+            return None
+        rows = self.db_utils.select_query(f"""
+            SELECT c.vk_id
+            FROM {DECISIONS} uc JOIN candidate c ON c.id = uc.candidate_id
+            WHERE uc.user_id = %s
+        """, (user_id,), use_replica=True, user_key=user_vk_id)
+        if rows is None:
+            return None
+        rows = list(rows)
+
+        seen = BloomFilter(max(self.min_capacity, 2 * len(rows)), self.error_rate)
+        for vk_id, in rows:
+            seen.add(vk_id)
+        logger.debug("Загружено %s оценок пользователя %s", len(rows), user_vk_id)
+        return seen
+
+    def _filter(self, user_vk_id: int) -> BloomFilter | None:
+        """Возвращает фильтр пользователя, загружая его при первом обращении."""
+        with self._lock:
+            seen = self._filters.get(user_vk_id)
+            if seen is not None:
+                self._filters.move_to_end(user_vk_id)
+                return seen
+
+        seen = self._load(user_vk_id)
+        if seen is not None:
+            with self._lock:
+                self._filters[user_vk_id] = seen
+                if len(self._filters) > self.max_users:
+                    self._filters.popitem(last=False)
+        return seen
+
+    def add(self, user_vk_id: int, vk_id: int):
+        """
+        Отмечает кандидата как оцененного пользователем.
+
+        Если фильтр пользователя не загружен, ничего не делает: оценка уже записана в базу
+        и попадет в фильтр при загрузке. Переполненный фильтр сбрасывается и загружается
+        заново при следующем обращении.
+
+        :param user_vk_id: int VK ID пользователя.
+        :param vk_id: int VK ID кандидата.
+        """
+        with self._lock:
+            seen = self._filters.get(user_vk_id)
+            if seen is None:
+                return
+            seen.add(vk_id)
+            if len(seen) > seen.capacity:
+                del self._filters[user_vk_id]
+
+    def exclude_vk_ids(self, user_vk_id: int, vk_ids: list[int]) -> list[int]:
+        """
+        Убирает из результатов поиска VK кандидатов, которых пользователь уже оценил.
+
+        :param user_vk_id: int VK ID пользователя.
+        :param vk_ids: list[int] VK ID найденных кандидатов.
+        :return: list[int] VK ID кандидатов без оценок пользователя, в исходном порядке.
+        """
+        seen = self._confirmed(user_vk_id, vk_ids)
+        return [vk_id for vk_id in vk_ids if vk_id not in seen]
+
+    def _confirmed(self, user_vk_id: int, vk_ids: list[int]) -> set:
+        """
+        Возвращает VK ID кандидатов, которых пользователь действительно оценил.
+
+            VK ID, отсутствующие в фильтре, отбрасываются без запросов. Положительные ответы
+        фильтра проверяются одним запросом. Если фильтр или запрос недоступен, возвращается
+        пустое множество: отсев тогда выполняют SQL-запросы поиска.
+
+        :param user_vk_id: int VK ID пользователя.
+        :param vk_ids: list[int] Проверяемые VK ID.
+        :return: set Подтвержденные VK ID.
+        """
+        if not vk_ids:
+            return set()
+        seen = self._filter(user_vk_id)
+        if seen is None:
+            return set()
+        positives = [vk_id for vk_id in vk_ids if vk_id in seen]
+        if not positives:
+            return set()
+
+        rows = self.db_utils.select_query(f"""
+            SELECT c.vk_id
+            FROM {DECISIONS} uc JOIN candidate c ON c.id = uc.candidate_id
+            WHERE uc.user_id = %s AND c.vk_id = ANY(%s)
+        """, (self.db_utils.get_user_id(user_vk_id), positives),
+            use_replica=True, user_key=user_vk_id)
+        confirmed = {row[0] for row in rows or []}
+        if len(confirmed) < len(positives):
+            logger.debug("Ложные срабатывания фильтра пользователя %s: %s",
+                         user_vk_id, len(positives) - len(confirmed))
+        return confirmed
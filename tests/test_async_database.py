@@ -0,0 +1,120 @@
+"""
+Тесты асинхронного слоя доступа к базе данных.
+
+Пул asyncpg заменяется моком с асинхронными методами fetch/fetchval/execute, поэтому тесты
+не требуют ни сервера PostgreSQL, ни установленного asyncpg. Корутины запускаются
+через asyncio.run.
+"""
+
+import asyncio
+import pytest
+
+from unittest import mock
+from async_database import AsyncDatabase, numbered
+from utils import DatabaseUtils
+
+
+@pytest.fixture
+def pool():
+    """Фикстура: мок пула соединений asyncpg."""
+    pool = mock.MagicMock()
+    pool.fetch = mock.AsyncMock(return_value=[])
+    pool.fetchval = mock.AsyncMock(return_value=None)
+    pool.execute = mock.AsyncMock(return_value='OK')
+    pool.close = mock.AsyncMock()
+    return pool
+
+
+@pytest.fixture(autouse=True)
+def clear_caches():
+    DatabaseUtils.registration_cache.clear()
+    DatabaseUtils.user_id_cache.clear()
+    yield
+    DatabaseUtils.registration_cache.clear()
+    DatabaseUtils.user_id_cache.clear()
+
+
+def test_numbered_placeholders():
+    assert numbered("a = %s AND b IN (%s, %s)") == "a = $1 AND b IN ($2, $3)"
+
+
+def test_insert_data(pool):
+    pool.fetchval.return_value = 7
+    db = AsyncDatabase(pool=pool)
+
+    inserted_id = asyncio.run(db.insert_data('users', {'vk_id': 1, 'name': 'x'},
+                                             conflict_target='vk_id'))
+
+    assert inserted_id == 7
+    pool.fetchval.assert_awaited_once_with(
+        'INSERT INTO users (vk_id, name) VALUES ($1, $2)'
+        ' ON CONFLICT (vk_id) DO UPDATE SET name = EXCLUDED.name RETURNING id', 1, 'x')
+
+
+def test_select_and_update(pool):
+    pool.fetch.return_value = [(1, 'x')]
+    db = AsyncDatabase(pool=pool)
+
+    rows = asyncio.run(db.select_data('users', ['id', 'name'], 'vk_id = %s', (1,)))
+    asyncio.run(db.update_data('users', {'name': 'y'}, 'id = %s', (1,)))
+
+    assert rows == [(1, 'x')]
+    pool.fetch.assert_awaited_once_with('SELECT id, name FROM users WHERE vk_id = $1', 1)
+    pool.execute.assert_awaited_once_with('UPDATE users SET name = $1 WHERE id = $2', 'y', 1)
+
+
+def test_get_user_id_shares_cache(pool):
+    pool.fetchval.return_value = 5
+    db = AsyncDatabase(pool=pool)
+
+    assert asyncio.run(db.get_user_id(42)) == 5
+    assert asyncio.run(db.get_user_id(42)) == 5
+
+    pool.fetchval.assert_awaited_once()
+    assert DatabaseUtils.user_id_cache.get(42) == 5
+
+
+def test_find_missing_candidates_single_statement(pool):
+    pool.fetch.return_value = [(3,)]
+    db = AsyncDatabase(pool=pool)
+
+    missing = asyncio.run(db.find_missing_candidates([1, 2, 3]))
+
+    assert missing == [3]
+    query, ids = pool.fetch.await_args.args
+    assert 'unnest($1::bigint[])' in query
+    assert ids == [1, 2, 3]
+
+
+def test_search_for_candidates_db(pool):
+    pool.fetchval.return_value = 5
+    db = AsyncDatabase(pool=pool)
+
+    asyncio.run(db.search_for_candidates_db(['25', '30'], 1, 'москва', 42, limit=20))
+
+    query, *params = pool.fetch.await_args.args
+    assert 's.city_key = lower(trim($3))' in query and 'uc.user_id = $9' in query
+    assert 'a.user_id = $10' in query
+    assert params == [None, None, 'москва', 1, 30, 25, 25, 30, 5, 5, 20]
+
+
+def test_connect_without_asyncpg():
+    with mock.patch('async_database.asyncpg', None):
+        with pytest.raises(RuntimeError):
+            asyncio.run(AsyncDatabase().connect())
+
+
+def test_adding_candidate_status_updates_counters(pool):
+    pool.fetchval.return_value = 5
+    pool.fetchrow = mock.AsyncMock(return_value=(77, 103))
+    seen = mock.MagicMock()
+    db = AsyncDatabase(pool=pool, seen=seen)
+
+    with mock.patch('utils.recent_writes') as recent_writes:
+        assert asyncio.run(db.adding_candidate_status(3, 42, True)) == 77
+
+    query, *params = pool.fetchrow.await_args.args
+    assert 'INSERT INTO user_candidate' in query and 'candidate_stats' in query
+    assert params == [5, 3, True]
+    recent_writes.mark.assert_called_once_with(42)
+    seen.add.assert_called_once_with(42, 103)
@@ -83,3 +83,37 @@ def test_user_state():
 
     # Проверка состояния, если оно не установлено
     assert bot.get_user_state(999) is None
+
+
+# Тестируем ленивый запуск: конструктор не создает long poll и собирает сводку времени запуска
+@patch('bot.VkLongPoll')
+def test_lazy_startup(mock_longpoll):
+    bot = VKBot(VK_GROUP_TOKEN)
+
+    mock_longpoll.assert_not_called()
+    assert bot.longpoll is mock_longpoll.return_value
+    mock_longpoll.assert_called_once()
+    assert {'imports', 'vk_session', 'handler', 'longpoll'} <= set(bot.startup_timings)
+    assert bot.startup_report().startswith('Запуск за')
+
+
+# Тестируем продолжение работы после ошибки базы данных в обработчике события
+@patch('bot.VkLongPoll')
+def test_run_reports_database_error(mock_longpoll):
+    import psycopg2
+    from vk_api.longpoll import VkEventType
+
+    bot = VKBot(VK_GROUP_TOKEN)
+    bot.handler = MagicMock()
+    bot.handler.message_handler.side_effect = psycopg2.OperationalError('connection lost')
+    bot.get_user_name = MagicMock(return_value='Иван Иванов')
+    bot.send_message = MagicMock()
+    event = MagicMock(type=VkEventType.MESSAGE_NEW, to_me=True, text='начать', user_id=123)
+    mock_longpoll.return_value.listen.side_effect = [iter([event, event]), KeyboardInterrupt]
+
+    with pytest.raises(KeyboardInterrupt):
+        bot.run()
+
+    assert bot.handler.message_handler.call_count == 2
+    assert bot.send_message.call_count == 2
+    assert bot.send_message.call_args.args[0] == 123
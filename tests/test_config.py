@@ -11,6 +11,7 @@
 import os
 import pytest
 import logging
+from unittest import mock
 from dotenv import load_dotenv
 
 from config import DB_NAME, DB_USER, DB_PASSWORD, DB_HOST, DB_PORT, VK_API_TOKEN, VK_GROUP_TOKEN, VK_API_VERSION, config_logging
@@ -40,3 +41,40 @@ def test_config_logging(caplog):
         logging.info("Test logging message")
     
     assert "Test logging message" in caplog.text
+
+
+# Тестирование ограничения частоты повторяющихся записей
+def test_rate_limit_filter():
+    from config import RateLimitFilter
+
+    rate_filter = RateLimitFilter(burst=2, interval=60)
+    record = logging.LogRecord('bot', logging.INFO, 'bot.py', 10, 'Сообщение %s', (1,), None)
+
+    assert rate_filter.filter(record) is True
+    assert rate_filter.filter(record) is True
+    assert rate_filter.filter(record) is False
+
+
+# Тестирование счетчика подавленных записей в сообщении с аргументами и символом '%'
+def test_rate_limit_filter_reports_suppressed():
+    from config import RateLimitFilter
+
+    rate_filter = RateLimitFilter(burst=1, interval=1)
+    record = logging.LogRecord('bot', logging.INFO, 'bot.py', 10, 'Загрузка %s%%', (50,), None)
+
+    with mock.patch('config.monotonic', side_effect=[0.0, 0.5, 2.0]):
+        assert rate_filter.filter(record) is True
+        assert rate_filter.filter(record) is False
+        assert rate_filter.filter(record) is True
+
+    assert record.getMessage() == 'Загрузка 50% (подавлено повторов: 1)'
+
+
+# Записи уровня ERROR и выше не ограничиваются
+def test_rate_limit_filter_passes_errors():
+    from config import RateLimitFilter
+
+    rate_filter = RateLimitFilter(burst=1, interval=60)
+    record = logging.LogRecord('bot', logging.ERROR, 'bot.py', 10, 'Ошибка', None, None)
+
+    assert all(rate_filter.filter(record) for _ in range(5))
@@ -105,6 +105,24 @@ def test_insert_data(mock_db_connection):
     assert inserted_id == 1
 
 
+def test_insert_data_on_conflict(mock_db_connection):
+    """Тест идемпотентной вставки с ON CONFLICT."""
+    mock_conn, mock_cursor = mock_db_connection
+    db = Database()
+
+    mock_cursor.fetchone.return_value = [7]
+
+    data = {'vk_id': 123, 'name': 'test_name'}
+    inserted_id = db.insert_data('users', data, conflict_target='vk_id')
+
+    expected_query = sql.SQL(
+        'INSERT INTO users (vk_id, name) VALUES (%s, %s)'
+        ' ON CONFLICT (vk_id) DO UPDATE SET name = EXCLUDED.name RETURNING id'
+    )
+    mock_cursor.execute.assert_called_once_with(expected_query, [123, 'test_name'])
+    assert inserted_id == 7
+
+
 def test_select_data(mock_db_connection):
     """Тест успешного выполнения SELECT-запроса."""
     mock_conn, mock_cursor = mock_db_connection
@@ -175,3 +193,317 @@ def test_execute_query_without_fetch(mock_db_connection):
     mock_cursor.execute.assert_called_with(query, ('new_name', 1))
     mock_conn.commit.assert_called_once()
     mock_cursor.fetchall.assert_not_called()
+
+
+def test_fingerprint():
+    """Тест нормализации текста запроса в отпечаток."""
+    from database import fingerprint
+
+    query = "SELECT missing.vk_id FROM (VALUES (%s), (%s), (%s)) AS m WHERE name = 'x' AND id = 5"
+
+    assert fingerprint(query) == "SELECT missing.vk_id FROM (VALUES ?+) AS m WHERE name = ? AND id = ?"
+
+
+def test_query_observer_records_queries(mock_db_connection):
+    """Тест учета запросов наблюдателем в рамках события."""
+    from database import query_observer
+
+    mock_conn, mock_cursor = mock_db_connection
+    mock_cursor.rowcount = 1
+    db = Database()
+
+    query_observer.begin_event()
+    db.execute_query('SELECT * FROM test_table WHERE id = %s', (1,), fetch=True)
+    db.execute_query('SELECT * FROM test_table WHERE id = %s', (2,), fetch=True)
+    queries = query_observer.end_event()
+
+    assert queries == {'SELECT * FROM test_table WHERE id = ?': 2}
+    assert query_observer.stats['SELECT * FROM test_table WHERE id = ?']['rows'] >= 2
+
+
+def test_query_observer_total_and_reset(mock_db_connection):
+    """Тест общего счетчика запросов наблюдателя и его сброса."""
+    from database import query_observer
+
+    db = Database()
+    query_observer.reset()
+    db.execute_query('SELECT 1', fetch=True)
+    db.execute_query('SELECT 2', fetch=True)
+
+    assert query_observer.total() == 2
+    query_observer.reset()
+    assert query_observer.total() == 0
+
+
+def test_explain_skips_statements_without_plan(mock_db_connection):
+    """Тест: для LOCK TABLE и т.п. EXPLAIN не выполняется."""
+    conn = mock.MagicMock(autocommit=False)
+    db = Database()
+
+    assert 'недоступен' in db._explain('LOCK TABLE user_candidate IN ACCESS EXCLUSIVE MODE',
+                                       None, conn)
+    conn.cursor.assert_not_called()
+
+
+def test_explain_error_rolls_back_to_savepoint(mock_db_connection):
+    """Тест: ошибка EXPLAIN в транзакции откатывается до точки сохранения."""
+    import psycopg2
+
+    def execute(query, params=None):
+        if query.startswith('EXPLAIN'):
+            raise psycopg2.ProgrammingError('no plan')
+
+    conn = mock.MagicMock(autocommit=False)
+    cursor = conn.cursor.return_value.__enter__.return_value
+    cursor.execute.side_effect = execute
+    db = Database()
+
+    assert 'недоступен' in db._explain('SELECT * FROM users', None, conn)
+    executed = [call.args[0] for call in cursor.execute.call_args_list]
+    assert executed == ['SAVEPOINT query_observer_explain', 'EXPLAIN SELECT * FROM users',
+                        'ROLLBACK TO SAVEPOINT query_observer_explain']
+
+
+# Тестирование ленивого подключения
+def test_lazy_connection():
+    with mock.patch('psycopg2.connect') as mock_connect:
+        db = Database()
+        mock_connect.assert_not_called()
+
+        db.select_data('users')
+        mock_connect.assert_called_once()
+
+
+@pytest.fixture
+def replica_connections():
+    """Фикстура: psycopg2.connect возвращает отдельный мок для основного сервера и каждой реплики."""
+    connections = {}
+
+    def connect(dsn=None, **kwargs):
+        key = dsn or 'primary'
+        connections[key] = mock.MagicMock(closed=False)
+        connections[key].cursor.return_value.__enter__.return_value.fetchall.return_value = [(key,)]
+        connections[key].cursor.return_value.fetchall.return_value = [(key,)]
+        return connections[key]
+
+    with mock.patch('psycopg2.connect', side_effect=connect):
+        yield connections
+
+
+def test_replica_round_robin(replica_connections):
+    """Тест распределения чтений по репликам по кругу."""
+    db = Database(replicas=['replica-1', 'replica-2'])
+
+    results = [db.select_data('users', use_replica=True) for _ in range(3)]
+
+    assert results == [[('replica-1',)], [('replica-2',)], [('replica-1',)]]
+    assert db.select_data('users') == [('primary',)]
+
+
+def test_replica_read_your_writes(replica_connections):
+    """Тест чтения с основного сервера сразу после записи пользователя."""
+    db = Database(replicas=['replica-1'])
+
+    db.note_write(42)
+
+    assert db.select_data('users', use_replica=True, user_key=42) == [('primary',)]
+    assert db.select_data('users', use_replica=True, user_key=7) == [('replica-1',)]
+
+
+def test_replica_fallback_to_primary(replica_connections):
+    """Тест переключения на основной сервер при ошибке реплики."""
+    import psycopg2
+
+    db = Database(replicas=['replica-1'])
+    assert db.select_data('users', use_replica=True) == [('replica-1',)]
+    cursor = replica_connections['replica-1'].cursor.return_value.__enter__.return_value
+    cursor.execute.side_effect = psycopg2.OperationalError('replica is gone')
+
+    assert db.select_data('users', use_replica=True) == [('primary',)]
+    assert db.replicas.acquire() is None
+
+
+# Тестирование потокового чтения с серверного курсора
+def test_select_data_stream(mock_db_connection):
+    mock_conn, _ = mock_db_connection
+    named_cursor = mock.MagicMock()
+    named_cursor.__enter__.return_value = named_cursor
+    named_cursor.fetchmany.side_effect = [[(1,), (2,)], [(3,), (4,)], [(5,)], []]
+    mock_conn.cursor.side_effect = lambda name=None, **kwargs: named_cursor
+    db = Database()
+
+    rows = db.select_data('candidate', 'id', stream=True, batch_size=2)
+    first_page = [next(rows) for _ in range(3)]
+    rows.close()
+
+    assert first_page == [(1,), (2,), (3,)]
+    assert named_cursor.fetchmany.call_count == 2
+    assert mock_conn.cursor.call_args.kwargs['name'].startswith('stream_')
+    named_cursor.__exit__.assert_called_once()
+
+
+def named_cursor_mock(*batches):
+    """Именованный курсор, возвращающий пакеты строк (исключение в пакетах выбрасывается)."""
+    cursor = mock.MagicMock()
+    cursor.__enter__.return_value = cursor
+    cursor.fetchmany.side_effect = list(batches)
+    return cursor
+
+
+def test_select_data_stream_error_mid_stream(mock_db_connection):
+    """Тест передачи ошибки чтения посреди потока и отката основного соединения."""
+    import psycopg2
+
+    mock_conn, _ = mock_db_connection
+    named_cursor = named_cursor_mock([(1,), (2,)], psycopg2.OperationalError('connection lost'))
+    mock_conn.cursor.side_effect = lambda name=None, **kwargs: named_cursor
+    db = Database()
+
+    rows = db.select_data('candidate', 'id', stream=True, batch_size=2)
+    assert [next(rows), next(rows)] == [(1,), (2,)]
+    with pytest.raises(psycopg2.OperationalError):
+        next(rows)
+
+    mock_conn.rollback.assert_called_once()
+    named_cursor.__exit__.assert_called_once()
+
+
+def test_stream_replica_failure_mid_stream(replica_connections):
+    """Тест ошибки реплики после переданных строк: реплика исключается, основной сервер не откатывается."""
+    import psycopg2
+
+    db = Database(replicas=['replica-1'])
+    db.replicas.acquire()
+    replica = replica_connections['replica-1']
+    replica.cursor.side_effect = lambda name=None, **kwargs: named_cursor_mock(
+        [(1,)], psycopg2.OperationalError('replica is gone'))
+
+    rows = db.select_data('candidate', 'id', use_replica=True, stream=True)
+    assert next(rows) == (1,)
+    with pytest.raises(psycopg2.OperationalError):
+        next(rows)
+
+    assert db.replicas.acquire() is None
+    db.conn.rollback.assert_not_called()
+
+
+def test_stream_replica_failure_before_rows_falls_back(replica_connections):
+    """Тест повтора потокового чтения на основном сервере, если реплика отказала до первой строки."""
+    import psycopg2
+
+    db = Database(replicas=['replica-1'])
+    db.replicas.acquire()
+    replica_connections['replica-1'].cursor.side_effect = lambda name=None, **kwargs: \
+        named_cursor_mock(psycopg2.OperationalError('replica is gone'))
+    db.conn.cursor.side_effect = lambda name=None, **kwargs: \
+        named_cursor_mock([(1,), (2,)], [])
+
+    rows = db.select_data('candidate', 'id', use_replica=True, stream=True)
+
+    assert list(rows) == [(1,), (2,)]
+    assert db.replicas.acquire() is None
+
+
+# Тестирование транзакции на несколько операций
+def test_transaction_commits_once(mock_db_connection):
+    mock_conn, mock_cursor = mock_db_connection
+    mock_cursor.fetchone.return_value = [1]
+    db = Database()
+
+    with db.transaction():
+        db.insert_data('user_candidate', {'user_id': 1, 'candidate_id': 2, 'preference': True})
+        db.update_data('users', {'name': 'new_name'}, 'id = %s', (1,))
+        mock_conn.commit.assert_not_called()
+
+    mock_conn.commit.assert_called_once()
+    mock_conn.rollback.assert_not_called()
+
+
+def test_transaction_rolls_back_on_error(mock_db_connection):
+    import psycopg2
+
+    mock_conn, mock_cursor = mock_db_connection
+    db = Database()
+
+    with pytest.raises(psycopg2.DatabaseError):
+        with db.transaction():
+            db.update_data('users', {'name': 'new_name'}, 'id = %s', (1,))
+            mock_cursor.execute.side_effect = psycopg2.DatabaseError('constraint')
+            db.delete_data('users', 'id = %s', (1,))
+
+    mock_conn.rollback.assert_called_once()
+    mock_conn.commit.assert_not_called()
+
+
+def test_transaction_failed_insert_stops_following_read(mock_db_connection):
+    """Тест: после ошибки записи в транзакции чтение не выполняется на прерванной транзакции."""
+    import psycopg2
+
+    mock_conn, mock_cursor = mock_db_connection
+    mock_cursor.execute.side_effect = psycopg2.errors.UniqueViolation('duplicate key')
+    mock_cursor.fetchall.return_value = [(1,)]
+    db = Database()
+
+    with pytest.raises(psycopg2.errors.UniqueViolation):
+        with db.transaction():
+            db.insert_data('user_candidate', {'user_id': 1, 'candidate_id': 2})
+            db.select_data('user_candidate')
+
+    assert mock_cursor.execute.call_count == 1
+    mock_conn.rollback.assert_called_once()
+    mock_conn.commit.assert_not_called()
+
+
+def test_select_error_outside_transaction_rolls_back(mock_db_connection):
+    import psycopg2
+
+    mock_conn, mock_cursor = mock_db_connection
+    mock_cursor.execute.side_effect = psycopg2.OperationalError('timeout')
+    db = Database()
+
+    assert db.select_data('users') == []
+    assert db.select_data('users', none_on_error=True) is None
+    assert mock_conn.rollback.call_count == 2
+
+
+def test_on_commit_runs_after_commit_only(mock_db_connection):
+    mock_conn, _ = mock_db_connection
+    db = Database()
+    calls = []
+
+    with db.transaction():
+        db.update_data('users', {'name': 'new_name'}, 'id = %s', (1,))
+        db.on_commit(lambda: calls.append('committed'))
+        assert calls == []
+    assert calls == ['committed']
+
+    with pytest.raises(RuntimeError):
+        with db.transaction():
+            db.update_data('users', {'name': 'new_name'}, 'id = %s', (1,))
+            db.on_commit(lambda: calls.append('rolled back'))
+            raise RuntimeError('ошибка')
+    assert calls == ['committed']
+
+    db.on_commit(lambda: calls.append('immediate'))
+    assert calls == ['committed', 'immediate']
+
+
+def test_transaction_without_queries(mock_db_connection):
+    mock_conn, _ = mock_db_connection
+    db = Database()
+
+    with db.transaction():
+        pass
+
+    mock_conn.commit.assert_not_called()
+
+
+def test_read_only_query_not_committed(mock_db_connection):
+    mock_conn, mock_cursor = mock_db_connection
+    db = Database()
+
+    db.execute_query('SELECT * FROM users WHERE id = %s', (1,), fetch=True)
+    mock_conn.commit.assert_not_called()
+
+    db.execute_query('SELECT * FROM users WHERE id = %s FOR UPDATE', (1,), fetch=True)
+    mock_conn.commit.assert_called_once()
@@ -5,16 +5,19 @@ test_message_handler_registration: Тестирует реакцию на ком
 test_state_handler_waiting_for_sex: Тестирует обработку состояния "ожидание выбора пола".
 test_state_handler_waiting_for_age: Тестирует обработку состояния "ожидание ввода возраста".
 test_state_handler_waiting_for_city: Тестирует обработку состояния "ожидание ввода города".
+test_carousel_skipped_not_shown_again: Проверяет, что пропущенные кандидаты не возвращаются до конца сеанса.
 """
 
 import pytest
 from unittest.mock import MagicMock
 from handler import Handler
+from registration import RegistrationPipeline
+from utils import Candidate
 from unittest.mock import patch
 from unittest.mock import patch, MagicMock
 
 from btn_text import buttons_regist, buttons_start, \
-    buttons_choice_sex, BTN_REGISTRATION, BTN_FIND_PAIR, BTN_SEX_MAN, WELCOME_MESSAGE
+    buttons_choice_sex, BTN_REGISTRATION, BTN_FIND_PAIR, BTN_SEX_MAN, WELCOME_MESSAGE, BTN_LIKE, BTN_NEXT
 
 # Пример фикстуры для мока объекта VKBot
 @pytest.fixture
@@ -76,6 +79,7 @@ def test_message_handler_start_registered_user(handler, mock_vk_bot, mock_db_uti
         keyboard='keyboard_mock'
     )
     mock_vk_bot.create_keyboard.assert_called_with(buttons_start)
+    mock_db_utils.touch_user.assert_called_once_with(123)
 
 # Тестируем метод message_handler с запросом на регистрацию
 def test_message_handler_registration(handler, mock_vk_bot):
@@ -86,11 +90,23 @@ def test_message_handler_registration(handler, mock_vk_bot):
     user_name = "Иван"
 
     handler.utils_auxiliary.prepare_user_candidate_data = MagicMock(return_value="тестовые данные")
+    handler.registration_pipeline = RegistrationPipeline(
+        handler._on_registration_complete, utils_factory=lambda: handler.utils_auxiliary
+    )
 
     # Вызов метода
     handler.message_handler(event, user_name, request)
 
+    # Пользователь сразу получает ответ о начале регистрации
+    mock_vk_bot.send_message.assert_any_call(
+        123, f"{user_name}, регистрация началась, это займет несколько секунд⏳"
+    )
+
+    # Дожидаемся завершения фоновой задачи
+    handler.registration_pipeline.shutdown(wait=True)
+
     # Проверяем, что бот отправляет сообщение с подготовленными данными
+    handler.utils_auxiliary.prepare_user_candidate_data.assert_called_once_with(123)
     mock_vk_bot.send_message.assert_called_with(
         123, f"{user_name} тестовые данные",
         keyboard='keyboard_mock'
@@ -170,4 +186,85 @@ def test_state_handler_waiting_for_city(mock_message_handler, mock_get_candidate
     handler.vk_bot.set_user_state.assert_called_with(user_id, None)
 
     # Проверяем, что message_handler был вызван с правильными аргументами
-    mock_message_handler.assert_called_once_with(event, user_name, 'show')
\ No newline at end of file
+    mock_message_handler.assert_called_once_with(event, user_name, 'show')
+
+# Тестируем фиксацию транзакции до обработчика, обращающегося к VK
+@pytest.mark.parametrize('state', [None, 'waiting_for_like_dislike'])
+def test_transaction_committed_before_dispatch(handler, state):
+    events = []
+    handler.util_db.transaction.return_value.__exit__.side_effect = \
+        lambda *args: events.append('commit')
+    handler.router.dispatch = MagicMock(side_effect=lambda *args: events.append('dispatch'))
+    event = MagicMock()
+    event.user_id = 123
+
+    if state is None:
+        handler.message_handler(event, "Иван", 'show')
+    else:
+        handler.state_handler(state, event, 123, "Иван", 'show')
+
+    assert events == ['commit', 'dispatch']
+
+# Тестируем сообщение о лимите поиска, когда в базе нет кандидатов
+def test_show_reports_search_quota(handler, mock_vk_bot):
+    handler.utils_auxiliary.search_quota_reached = MagicMock(return_value=True)
+    event = MagicMock()
+    event.user_id = 123
+    handler.user_candidate_data[123] = []
+
+    handler.message_handler(event, "Иван", 'show')
+
+    mock_vk_bot.send_message.assert_called_once()
+    assert 'Лимит поиска' in mock_vk_bot.send_message.call_args.args[1]
+
+# Тестируем просмотр кандидатов каруселью
+def test_carousel_browsing(handler, mock_vk_bot):
+    handler.browsing_mode = 'carousel'
+    handler.utils_auxiliary.adding_candidate_status = MagicMock()
+    event = MagicMock()
+    event.user_id = 123
+    candidates = [
+        Candidate(1, 11, 'Анна', 'москва', 25, 1, ['photo11_1']),
+        Candidate(2, 22, 'Мария', 'москва', 27, 1, ['photo22_2']),
+    ]
+    handler.user_candidate_data[123] = list(candidates)
+
+    handler.message_handler(event, "Иван", 'show')
+
+    # Оба кандидата отправлены одной каруселью
+    assert mock_vk_bot.send_message.call_count == 1
+    assert 'template' in mock_vk_bot.send_message.call_args.kwargs
+    assert set(handler.carousel_pending[123]) == {1, 2}
+    mock_vk_bot.set_user_state.assert_called_with(123, "waiting_for_carousel")
+
+    # Оценка из кнопки карусели сохраняется по ID кандидата из полезной нагрузки
+    event.payload = '{"cmd": "like", "candidate_id": 2}'
+    handler.state_handler("waiting_for_carousel", event, 123, "Иван", BTN_LIKE.lower())
+
+    handler.utils_auxiliary.adding_candidate_status.assert_called_once_with(2, 123, True)
+    assert set(handler.carousel_pending[123]) == {1}
+
+
+def test_carousel_skipped_not_shown_again(handler, mock_vk_bot):
+    handler.browsing_mode = 'carousel'
+    event = MagicMock()
+    event.user_id = 123
+    candidates = [
+        Candidate(1, 11, 'Анна', 'москва', 25, 1, ['photo11_1']),
+        Candidate(2, 22, 'Мария', 'москва', 27, 1, ['photo22_2']),
+    ]
+    handler.user_candidate_data[123] = candidates[:1]
+    handler._filling_user_candidate_data_dict = MagicMock(
+        side_effect=lambda user_data, user_id: handler.user_candidate_data.update({user_id: list(candidates)}))
+
+    handler.message_handler(event, "Иван", 'show')
+    assert set(handler.carousel_pending[123]) == {1}
+
+    # Кандидат 1 пропущен: после повторного заполнения списка показывается только кандидат 2
+    handler.state_handler("waiting_for_carousel", event, 123, "Иван", BTN_NEXT.lower())
+    assert set(handler.carousel_pending[123]) == {2}
+
+    # Оба кандидата пропущены: сеанс просмотра завершается
+    handler.state_handler("waiting_for_carousel", event, 123, "Иван", BTN_NEXT.lower())
+    assert 'Кандидаты закончились' in mock_vk_bot.send_message.call_args.args[1]
+    assert 123 not in handler.carousel_skipped
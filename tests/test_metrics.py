@@ -0,0 +1,52 @@
+"""
+test_registry_quantiles: Проверяет расчет количества, суммы и квантилей по наблюдениям этапа.
+test_render_prometheus: Проверяет формат вывода метрик Prometheus.
+test_timed_decorator: Проверяет запись длительности вызова функции декоратором timed.
+test_timed_coroutine: Проверяет, что timed для корутины замеряет время до ее завершения.
+"""
+import asyncio
+
+from metrics import MetricsRegistry, registry, timed
+
+
+def test_registry_quantiles():
+    metrics = MetricsRegistry()
+    for ms in range(1, 101):
+        metrics.observe('db.select_data', ms / 1000)
+
+    stage = metrics.snapshot()['db.select_data']
+
+    assert stage['count'] == 100
+    assert round(stage['sum'], 3) == 5.05
+    assert stage['p50'] == 0.051
+    assert stage['p99'] == 0.1
+
+
+def test_render_prometheus():
+    metrics = MetricsRegistry()
+    metrics.observe('vk.messages.send', 0.25)
+
+    text = metrics.render()
+
+    assert '# TYPE vkbot_stage_duration_seconds summary' in text
+    assert 'vkbot_stage_duration_seconds{stage="vk.messages.send",quantile="0.95"} 0.250000' in text
+    assert 'vkbot_stage_duration_seconds_count{stage="vk.messages.send"} 1' in text
+
+
+def test_timed_decorator():
+    @timed('test.stage')
+    def work():
+        return 42
+
+    assert work() == 42
+    assert registry.snapshot()['test.stage']['count'] >= 1
+
+
+def test_timed_coroutine():
+    @timed('test.async_stage')
+    async def work():
+        await asyncio.sleep(0.01)
+        return 42
+
+    assert asyncio.run(work()) == 42
+    assert registry.snapshot()['test.async_stage']['p50'] >= 0.01
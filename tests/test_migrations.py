@@ -0,0 +1,309 @@
+"""
+test_migrate_applies_pending_in_order: Проверяет применение только недостающих миграций по порядку
+под advisory lock.
+test_non_transactional_migration_uses_autocommit: Проверяет выполнение миграции вне транзакции.
+test_failed_migration_stops: Проверяет откат и остановку при ошибке миграции.
+test_backfill_batches: Проверяет пакетное обновление до исчерпания строк.
+test_create_index_concurrently_rebuilds_invalid: Проверяет пересоздание недействительного индекса.
+test_migration_versions_are_sequential: Проверяет последовательную нумерацию миграций.
+test_copy_in_batches: Проверяет пакетное копирование строк по возрастанию id.
+test_partition_user_candidate_skips: Проверяет пропуск секционирования, если оно отключено
+или уже выполнено.
+test_partition_user_candidate_swaps_tables: Проверяет создание секций и замену таблиц.
+test_partition_user_candidate_mirror_in_transaction: Проверяет создание триггера зеркалирования
+и замену таблиц в транзакциях с lock_timeout.
+test_locked_transaction_retries: Проверяет повтор транзакции при превышении lock_timeout.
+test_locked_transaction_gives_up: Проверяет ошибку после исчерпания попыток.
+test_candidate_search_buckets: Проверяет создание корзин поиска, триггера и пакетное заполнение.
+test_candidate_search_trigger_in_transaction: Проверяет создание триггера корзин в одной
+транзакции до начала заполнения.
+test_city_ids: Проверяет добавление city_id и пересоздание триггера в транзакциях с lock_timeout
+и индекс корзин по id города.
+test_decision_retention: Проверяет добавление столбцов и создание архива в транзакциях
+с lock_timeout.
+test_create_partitioned_index: Проверяет построение индексов секций и их присоединение.
+test_decision_counters: Проверяет создание счетчиков оценок в короткой транзакции, вычисление
+поправок по одному снимку и их пакетное применение без блокировки записи.
+test_decision_counters_resumes: Проверяет продолжение применения сохраненных поправок.
+"""
+import pytest
+
+from unittest.mock import MagicMock
+from psycopg2 import errors
+
+from migrations import MIGRATIONS, MIGRATIONS_LOCK_KEY, Migration, Migrator, backfill, \
+    copy_in_batches, create_index_concurrently, _partition_user_candidate, \
+    _candidate_search_buckets, _city_ids, create_partitioned_index, _decision_counters, \
+    _decision_retention, locked_transaction
+
+
+@pytest.fixture
+def db():
+    """Объект базы данных с замоканными соединением и курсором."""
+    database = MagicMock()
+    database.conn.autocommit = False
+    return database
+
+
+def executed(db) -> list:
+    return [call.args for call in db._execute.call_args_list]
+
+
+def test_migrate_applies_pending_in_order(db):
+    db.cur.fetchall.return_value = [(1,)]
+    calls = []
+    migrations = [Migration(3, 'third', lambda _: calls.append(3)),
+                  Migration(1, 'first', lambda _: calls.append(1)),
+                  Migration(2, 'second', lambda _: calls.append(2))]
+
+    assert Migrator(db, migrations).migrate() == [2, 3]
+
+    assert calls == [2, 3]
+    queries = executed(db)
+    assert queries[0] == ("SELECT pg_advisory_lock(%s)", (MIGRATIONS_LOCK_KEY,))
+    assert queries[-1] == ("SELECT pg_advisory_unlock(%s)", (MIGRATIONS_LOCK_KEY,))
+    assert ("INSERT INTO schema_migrations (version, name) VALUES (%s, %s)", (2, 'second')) \
+        in queries
+
+
+def test_non_transactional_migration_uses_autocommit(db):
+    db.cur.fetchall.return_value = []
+    modes = []
+    migration = Migration(1, 'index', lambda database: modes.append(database.conn.autocommit),
+                          transactional=False)
+
+    Migrator(db, [migration]).migrate()
+
+    assert modes == [True]
+    assert db.conn.autocommit is False
+
+
+def test_failed_migration_stops(db):
+    db.cur.fetchall.return_value = []
+    applied = []
+
+    def broken(_):
+        raise RuntimeError('boom')
+
+    migrations = [Migration(1, 'broken', broken), Migration(2, 'next', applied.append)]
+
+    with pytest.raises(RuntimeError):
+        Migrator(db, migrations).migrate()
+
+    db.conn.rollback.assert_called_once()
+    assert applied == []
+    assert executed(db)[-1] == ("SELECT pg_advisory_unlock(%s)", (MIGRATIONS_LOCK_KEY,))
+
+
+def test_backfill_batches(db):
+    rowcounts = iter([100, 100, 30])
+    db._execute.side_effect = lambda *args: setattr(db.cur, 'rowcount', next(rowcounts))
+
+    total = backfill(db, 'users', 'city_id = 1', 'city_id IS NULL', batch_size=100)
+
+    assert total == 230
+    assert db._execute.call_count == 3
+    assert db._execute.call_args.args[1] == (100,)
+
+
+def test_create_index_concurrently_rebuilds_invalid(db):
+    db.cur.fetchone.return_value = (True,)
+
+    create_index_concurrently(db, 'candidate_idx', 'candidate', 'gender')
+
+    assert db._execute.call_count == 3
+
+
+def test_migration_versions_are_sequential():
+    assert [migration.version for migration in MIGRATIONS] == \
+        list(range(1, len(MIGRATIONS) + 1))
+
+
+def test_copy_in_batches(db):
+    db.cur.fetchone.side_effect = [(100, 100), (200, 100), (250, 50)]
+
+    assert copy_in_batches(db, 'source', 'target', 'id, user_id', batch_size=100) == 250
+    assert [call.args[1] for call in db._execute.call_args_list] == \
+        [(0, 100), (100, 100), (200, 100)]
+
+
+def test_partition_user_candidate_skips(db):
+    _partition_user_candidate(db, partitions=0)
+    db._execute.assert_not_called()
+
+    db.cur.fetchone.return_value = ('p',)
+    _partition_user_candidate(db, partitions=4)
+    assert db._execute.call_count == 1
+
+
+def test_partition_user_candidate_swaps_tables(db):
+    db.cur.fetchone.side_effect = [('r',), (None, 0)]
+
+    _partition_user_candidate(db, partitions=4)
+
+    queries = [str(call.args[0]) for call in db._execute.call_args_list]
+    assert sum('PARTITION OF user_candidate_partitioned' in query for query in queries) == 4
+    assert "ALTER TABLE user_candidate_partitioned RENAME TO user_candidate" in queries
+    assert db.conn.commit.call_count == 2
+    assert db.conn.autocommit is True
+
+
+def test_candidate_search_buckets(db):
+    db.cur.fetchone.side_effect = [(2, 2), (3, 1)]
+
+    _candidate_search_buckets(db, batch_size=2)
+
+    queries = [call[0] for call in executed(db)]
+    assert any('CREATE TABLE IF NOT EXISTS candidate_search' in query for query in queries)
+    assert any('AFTER INSERT OR UPDATE OF city, gender, birthday ON candidate' in query
+               for query in queries)
+    assert [call[1] for call in executed(db)[-2:]] == [(0, 2), (2, 2)]
+
+
+def test_candidate_search_trigger_in_transaction(db):
+    db.cur.fetchone.side_effect = [(None, 0)]
+    db.conn.autocommit = True
+    calls = record_autocommit(db)
+
+    _candidate_search_buckets(db)
+
+    in_transaction = [query for query, autocommit in calls if autocommit is False]
+    assert in_transaction[0] == 'SET LOCAL lock_timeout = %s'
+    assert 'CREATE OR REPLACE FUNCTION candidate_search_refresh' in in_transaction[1]
+    assert in_transaction[2].startswith('DROP TRIGGER IF EXISTS candidate_search_refresh')
+    assert 'CREATE TRIGGER candidate_search_refresh' in in_transaction[3]
+    backfill = next(i for i, (query, _) in enumerate(calls) if 'WITH batch' in query)
+    trigger = next(i for i, (query, _) in enumerate(calls) if 'CREATE TRIGGER' in query)
+    assert trigger < backfill and calls[backfill][1] is True
+
+
+def test_city_ids(db):
+    db.cur.fetchone.return_value = None
+    db.conn.autocommit = True
+    calls = record_autocommit(db)
+
+    _city_ids(db)
+
+    in_transaction = [query for query, autocommit in calls if autocommit is False]
+    alters = [i for i, query in enumerate(in_transaction)
+              if 'ADD COLUMN IF NOT EXISTS city_id' in query]
+    assert len(alters) == 3
+    assert all(in_transaction[i - 1] == 'SET LOCAL lock_timeout = %s' for i in alters)
+    assert 'CREATE TRIGGER candidate_search_refresh' in in_transaction[-1]
+    assert in_transaction[-4] == 'SET LOCAL lock_timeout = %s'
+    assert any('candidate_search_city_id_idx' in query for query, _ in calls)
+    assert db.conn.autocommit is True
+
+
+def test_decision_retention(db):
+    db.cur.fetchone.return_value = None
+    db.cur.fetchall.return_value = []
+    db.conn.autocommit = True
+    calls = record_autocommit(db)
+
+    _decision_retention(db)
+
+    in_transaction = [query for query, autocommit in calls if autocommit is False]
+    assert in_transaction[0] == 'SET LOCAL lock_timeout = %s'
+    assert 'ADD COLUMN IF NOT EXISTS decided_at' in in_transaction[1]
+    assert in_transaction[2] == 'SET LOCAL lock_timeout = %s'
+    assert 'ADD COLUMN IF NOT EXISTS last_active_at' in in_transaction[3]
+    assert in_transaction[4] == 'SET LOCAL lock_timeout = %s'
+    assert 'CREATE TABLE IF NOT EXISTS user_candidate_archive' in in_transaction[5]
+    assert any('users_last_active_at_idx' in query for query, autocommit in calls if autocommit)
+
+
+def test_create_partitioned_index(db):
+    db.cur.fetchall.return_value = [('user_candidate_p0',), ('user_candidate_p1',)]
+    db.cur.fetchone.return_value = None
+
+    create_partitioned_index(db, 'dislike_idx', 'user_candidate', 'decided_at',
+                             where='NOT preference')
+
+    queries = [str(call[0]) for call in executed(db)]
+    assert sum('ON ONLY' in query for query in queries) == 1
+    assert sum('CONCURRENTLY' in query for query in queries) == 2
+    assert sum('ATTACH PARTITION' in query for query in queries) == 2
+
+
+def test_decision_counters(db):
+    db.cur.fetchone.side_effect = [(True,), (0,), (0,), (0,)]
+    db.conn.autocommit = True
+    calls = record_autocommit(db)
+
+    _decision_counters(db)
+
+    assert not any(query.startswith('LOCK TABLE') for query, _ in calls)
+    in_transaction = [query for query, autocommit in calls if autocommit is False]
+    assert in_transaction[0] == 'SET LOCAL lock_timeout = %s'
+    assert all('CREATE TABLE IF NOT EXISTS' in query for query in in_transaction[1:4])
+    assert in_transaction[4] == 'SET TRANSACTION ISOLATION LEVEL REPEATABLE READ'
+    collected = in_transaction[5:]
+    assert len(collected) == 3 and all('_backfill AS' in query for query in collected)
+    assert 'WHERE version = 7' in collected[-1]
+    applied = [query for query, autocommit in calls if autocommit and 'DELETE FROM' in query]
+    assert len(applied) == 3
+    assert calls[-1][0].startswith('DROP TABLE candidate_stats_backfill')
+
+
+def test_decision_counters_resumes(db):
+    db.cur.fetchone.side_effect = [(False,), (0,), (0,), (0,)]
+
+    _decision_counters(db)
+
+    queries = [call[0] for call in executed(db)]
+    assert not any('REPEATABLE READ' in str(query) for query in queries)
+    assert sum('DELETE FROM' in str(query) for query in queries) == 3
+
+
+def record_autocommit(db) -> list:
+    """Записывает (запрос, режим autocommit) для каждого выполненного запроса."""
+    calls = []
+    db._execute.side_effect = lambda query, params=None: calls.append(
+        (str(query), db.conn.autocommit))
+    return calls
+
+
+def test_partition_user_candidate_mirror_in_transaction(db):
+    db.cur.fetchone.side_effect = [('r',), (None, 0)]
+    db.conn.autocommit = True
+    calls = record_autocommit(db)
+
+    _partition_user_candidate(db, partitions=2)
+
+    in_transaction = [query for query, autocommit in calls if autocommit is False]
+    assert in_transaction[0] == 'SET LOCAL lock_timeout = %s'
+    assert 'CREATE OR REPLACE FUNCTION user_candidate_mirror' in in_transaction[1]
+    assert in_transaction[2].startswith('DROP TRIGGER IF EXISTS user_candidate_mirror')
+    assert 'CREATE TRIGGER user_candidate_mirror' in in_transaction[3]
+    assert in_transaction[4] == 'SET LOCAL lock_timeout = %s'
+    assert in_transaction[5].startswith('LOCK TABLE user_candidate')
+    assert all(autocommit for query, autocommit in calls if 'WITH batch' in query)
+
+
+def test_locked_transaction_retries(db):
+    attempts = []
+
+    def apply(database):
+        attempts.append(database.conn.autocommit)
+        if len(attempts) == 1:
+            raise errors.LockNotAvailable()
+
+    sleep = MagicMock()
+    locked_transaction(db, apply, lock_timeout='2s', pause=0.5, sleep=sleep)
+
+    assert attempts == [False, False]
+    db.conn.rollback.assert_called_once()
+    db.conn.commit.assert_called_once()
+    sleep.assert_called_once_with(0.5)
+    assert db._execute.call_args.args == ("SET LOCAL lock_timeout = %s", ('2s',))
+
+
+def test_locked_transaction_gives_up(db):
+    def apply(database):
+        raise errors.LockNotAvailable()
+
+    with pytest.raises(errors.LockNotAvailable):
+        locked_transaction(db, apply, attempts=2, sleep=MagicMock())
+    assert db.conn.rollback.call_count == 2
+    assert db.conn.autocommit is True
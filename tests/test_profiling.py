@@ -0,0 +1,55 @@
+"""
+test_cprofile_start_stop: Проверяет сохранение pstats и отчета tracemalloc при остановке cProfile.
+test_sampling_start_stop: Проверяет сохранение свернутых стеков семплирующего профайлера.
+test_signal_handler_defers_toggle: Проверяет, что обработчик сигнала только запрашивает переключение.
+"""
+
+import os
+import signal
+import time
+
+from profiling import Profiler, install_signal_handler
+
+
+def test_cprofile_start_stop(tmp_path):
+    profiler = Profiler(str(tmp_path))
+
+    assert profiler.start('cprofile') == "Профилирование запущено (cprofile)"
+    assert profiler.active
+    sum(range(10000))
+    profiler.stop()
+
+    assert not profiler.active
+    files = sorted(os.listdir(tmp_path))
+    assert any(name.endswith('.pstats') for name in files)
+    assert any(name.startswith('memory-') for name in files)
+
+
+def test_sampling_start_stop(tmp_path):
+    profiler = Profiler(str(tmp_path))
+
+    profiler.start('sampling')
+    deadline = time.perf_counter() + 0.1
+    while time.perf_counter() < deadline:
+        sum(range(1000))
+    profiler.stop()
+
+    collapsed = [name for name in os.listdir(tmp_path) if name.endswith('.collapsed')]
+    assert collapsed
+    with open(tmp_path / collapsed[0], encoding='utf-8') as file:
+        assert 'test_sampling_start_stop' in file.read()
+
+
+def test_signal_handler_defers_toggle(tmp_path, monkeypatch):
+    handlers = {}
+    monkeypatch.setattr(signal, 'signal', lambda signum, handler: handlers.setdefault(signum, handler))
+    profiler = Profiler(str(tmp_path))
+    install_signal_handler(profiler, signal.SIGUSR1)
+
+    handlers[signal.SIGUSR1](signal.SIGUSR1, None)
+    assert not profiler.active
+
+    assert profiler.run_pending() == "Профилирование запущено (cprofile)"
+    assert profiler.active
+    assert profiler.run_pending() is None
+    profiler.stop()
@@ -0,0 +1,43 @@
+"""
+test_run_archives_in_batches: Проверяет перенос пакетами с паузой между полными пакетами.
+test_run_stops_on_database_error: Проверяет остановку переноса при ошибке базы данных.
+test_archive_replaces_conflicting_id: Проверяет замену архивной строки с тем же id.
+"""
+from unittest.mock import MagicMock
+
+from retention import RetentionJob
+
+
+def test_run_archives_in_batches():
+    db = MagicMock()
+    db.execute_query.side_effect = [[(2,)], [(1,)], [(0,)]]
+    sleep = MagicMock()
+    job = RetentionJob(db, dislike_days=30, inactive_days=90, batch_size=2, pause=0.5,
+                       sleep=sleep)
+
+    assert job.run() == {'inactive_users': 3, 'old_dislikes': 0}
+
+    queries = [call.args for call in db.execute_query.call_args_list]
+    assert queries[0][1] == (90, 2) and 'last_active_at' in queries[0][0]
+    assert queries[2][1] == (30, 2) and 'NOT uc.preference' in queries[2][0]
+    assert all('INSERT INTO user_candidate_archive' in query for query, _ in queries)
+    sleep.assert_called_once_with(0.5)
+
+
+def test_run_stops_on_database_error():
+    db = MagicMock()
+    db.execute_query.return_value = None
+
+    assert RetentionJob(db, sleep=MagicMock()).run() == {'inactive_users': 0, 'old_dislikes': 0}
+
+
+def test_archive_replaces_conflicting_id():
+    db = MagicMock()
+    db.execute_query.return_value = [(1,)]
+
+    RetentionJob(db, batch_size=2, sleep=MagicMock()).run()
+
+    query = db.execute_query.call_args.args[0]
+    assert 'ON CONFLICT (id) DO UPDATE' in query and 'DO NOTHING' not in query
+    assert 'preference = EXCLUDED.preference' in query
+    assert 'decided_at = EXCLUDED.decided_at' in query
@@ -0,0 +1,38 @@
+"""
+test_dispatch_by_state_and_text: Проверяет выбор обработчика по паре (состояние, текст кнопки).
+test_dispatch_default: Проверяет вызов обработчика по умолчанию для произвольного ввода.
+test_dispatch_unknown_state: Проверяет, что для незарегистрированного состояния ничего не вызывается.
+"""
+
+from unittest.mock import MagicMock
+
+from btn_text import BTN_HELP
+from metrics import registry
+from router import Router
+
+
+def test_dispatch_by_state_and_text():
+    router = Router()
+    on_help = MagicMock(__name__='on_help')
+    router.add(None, BTN_HELP, on_help)
+    before = registry.snapshot().get('transition.None.on_help', {}).get('count', 0)
+
+    assert router.dispatch(None, BTN_HELP.lower(), 'event') is True
+    on_help.assert_called_once_with('event')
+    assert registry.snapshot()['transition.None.on_help']['count'] == before + 1
+
+
+def test_dispatch_default():
+    router = Router()
+    on_age = MagicMock(__name__='on_age')
+    router.set_default('waiting_for_age', on_age)
+
+    router.dispatch('waiting_for_age', '25,30', 'event')
+
+    on_age.assert_called_once_with('event')
+
+
+def test_dispatch_unknown_state():
+    router = Router()
+
+    assert router.dispatch('unknown_state', 'text') is False
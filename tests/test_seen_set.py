@@ -0,0 +1,63 @@
+"""
+test_bloom_filter: Проверяет отсутствие ложноотрицательных ответов и долю ложноположительных.
+test_exclude_vk_ids_confirms_positives: Проверяет, что положительные ответы фильтра
+    подтверждаются одним запросом к базе, а отрицательные не требуют запросов.
+test_exclude_vk_ids_after_rating: Проверяет отсев кандидата, оцененного в текущей сессии.
+test_unknown_user_is_not_filtered: Проверяет, что без фильтра кандидаты не отсеиваются.
+"""
+
+from unittest.mock import MagicMock
+
+from seen_set import BloomFilter, SeenCandidates
+
+
+def make_db_utils(rows):
+    db_utils = MagicMock()
+    db_utils.get_user_id.return_value = 7
+    db_utils.select_query.return_value = rows
+    return db_utils
+
+
+def test_bloom_filter():
+    seen = BloomFilter(1000, 0.01)
+    for key in range(1000):
+        seen.add(key)
+
+    assert all(key in seen for key in range(1000))
+    false_positives = sum(key in seen for key in range(1000, 11000))
+    assert false_positives < 300
+    assert len(seen) == 1000
+
+
+def test_exclude_vk_ids_confirms_positives():
+    db_utils = make_db_utils([(101,), (102,)])
+    seen = SeenCandidates(db_utils)
+
+    assert seen.exclude_vk_ids(5, [201, 202]) == [201, 202]
+    assert db_utils.select_query.call_count == 1  # только загрузка фильтра
+
+    db_utils.select_query.return_value = [(101,)]
+    assert seen.exclude_vk_ids(5, [101, 201]) == [201]
+    query, params = db_utils.select_query.call_args.args
+    assert 'ANY(%s)' in query
+    assert params == (7, [101])
+
+
+def test_exclude_vk_ids_after_rating():
+    db_utils = make_db_utils([])
+    seen = SeenCandidates(db_utils)
+
+    assert seen.exclude_vk_ids(5, [103, 104]) == [103, 104]
+
+    seen.add(5, 103)
+    db_utils.select_query.return_value = [(103,)]
+    assert seen.exclude_vk_ids(5, [103, 104]) == [104]
+
+
+def test_unknown_user_is_not_filtered():
+    db_utils = make_db_utils([])
+    db_utils.get_user_id.return_value = None
+    seen = SeenCandidates(db_utils)
+
+    assert seen.exclude_vk_ids(5, [101]) == [101]
+    db_utils.select_query.assert_not_called()
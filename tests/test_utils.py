@@ -3,10 +3,24 @@
 Проверяются ключевые сценарии, такие как успешное сохранение данных, извлечение фотографий и взаимодействие с базой данных.
 """
 
+import threading
+
 import pytest
-from unittest.mock import MagicMock
+from unittest.mock import MagicMock, patch
+
+from utils import AuxiliaryUtils, DatabaseUtils, LRUCache
 
-from utils import AuxiliaryUtils, DatabaseUtils
+
+@pytest.fixture(autouse=True)
+def clear_registration_cache():
+    """Очищает общие кэши регистрации, id пользователей, городов и активности между тестами."""
+    caches = (DatabaseUtils.registration_cache, DatabaseUtils.user_id_cache,
+              DatabaseUtils.city_id_cache, DatabaseUtils.activity_cache)
+    for cache in caches:
+        cache.clear()
+    yield
+    for cache in caches:
+        cache.clear()
 
 # Тестирование метода prepare_user_candidate_data
 def test_prepare_user_candidate_data():
@@ -34,6 +48,7 @@ def test_prepare_user_candidate_data():
     utils.vk_service.get_users_info.assert_called_once_with(123)
     utils.vk_service.get_top_photos.assert_called_once_with(123)
     utils.db_utils.insert_data.assert_called_once()
+    assert utils.db_utils.check_user_existence_db(123) == [(123,)]
 
 # Тестирование метода _extract_photo_attachment
 def test_extract_photo_attachment():
@@ -71,4 +86,288 @@ def test_save_user_candidate():
     
     # Проверка результата
     assert result == 1
-    db_utils.insert_data.assert_called_once_with(table_name='users', data=data)
\ No newline at end of file
+    db_utils.insert_data.assert_called_once_with(table_name='users', data=data)
+
+# Тестирование кэша статуса регистрации
+def test_check_user_existence_db_cached():
+    db_utils = DatabaseUtils()
+    db_utils.select_data = MagicMock(return_value=[])
+
+    # Отрицательный результат кэшируется
+    assert db_utils.check_user_existence_db(321) is None
+    assert db_utils.check_user_existence_db(321) is None
+    db_utils.select_data.assert_called_once()
+
+    # Регистрация заменяет отрицательную запись
+    db_utils.mark_user_registered(321)
+    assert db_utils.check_user_existence_db(321) == [(321,)]
+    db_utils.select_data.assert_called_once()
+
+
+# Ошибка запроса не кэшируется как отсутствие регистрации
+def test_check_user_existence_db_error_not_cached():
+    db_utils = DatabaseUtils()
+    db_utils.select_data = MagicMock(side_effect=[None, [(321,)]])
+
+    assert db_utils.check_user_existence_db(321) is None
+    assert db_utils.check_user_existence_db(321) == [(321,)]
+    assert db_utils.select_data.call_count == 2
+
+
+def test_lru_cache_negative_ttl_and_eviction():
+    with patch('utils.monotonic', side_effect=[0, 5, 11]):
+        cache = LRUCache(max_size=2, negative_ttl=10)
+        cache.set('missing', None)
+        assert cache.get('missing') is None
+        assert cache.get('missing') is LRUCache._MISSING
+
+    cache.set(1, 'a')
+    cache.set(2, 'b')
+    cache.get(1)
+    cache.set(3, 'c')
+    assert cache.get(2) is LRUCache._MISSING
+    assert cache.get(1) == 'a' and cache.get(3) == 'c'
+
+
+def test_lru_cache_threads():
+    cache = LRUCache(max_size=50)
+
+    def worker(offset):
+        for key in range(offset, offset + 2000):
+            cache.set(key % 100, key)
+            cache.get((key + 1) % 100)
+
+    threads = [threading.Thread(target=worker, args=(offset,)) for offset in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(cache._entries) == 50
+
+
+def test_get_candidate_db_backs_off_near_quota(monkeypatch):
+    utils = AuxiliaryUtils()
+    utils.db_utils = MagicMock()
+    utils.db_utils.search_for_candidates_db.return_value = [
+        (1, 101, 'Анна Иванова', 'москва', 25, 1, ['photo1_1'])
+    ]
+    utils.get_candidate_vk_api = MagicMock()
+    near_quota = MagicMock(return_value=True)
+    monkeypatch.setattr('utils.vk_accounting.near_quota', near_quota)
+
+    candidates = utils.get_candidate_db({1: {'age': [25], 'sex': 1, 'city': 'москва'}}, 1)
+
+    assert [candidate.vk_id for candidate in candidates] == [101]
+    utils.get_candidate_vk_api.assert_not_called()
+    # Квота VK действует на токен, поэтому проверяются только вызовы токена поиска
+    near_quota.assert_called_once_with('users.search', utils.vk_service.token)
+
+
+def test_add_table_runs_once_per_schema(tmp_path, monkeypatch):
+    stamp_file = str(tmp_path / 'schema_stamp')
+    migrator = MagicMock()
+    monkeypatch.setattr('utils.Migrator', migrator)
+    db = DatabaseUtils()
+
+    db.add_table(stamp_file=stamp_file)
+    db.add_table(stamp_file=stamp_file)
+    migrator.return_value.migrate.assert_called_once()
+
+    db.add_table(force=True, stamp_file=stamp_file)
+    assert migrator.return_value.migrate.call_count == 2
+
+
+def test_partition_aware_user_candidate_queries():
+    db_utils = DatabaseUtils()
+    db_utils.select_data = MagicMock(side_effect=[[(7,)], []])
+
+    db_utils.search_favorites(123)
+    db_utils.get_user_id(123)
+
+    # id пользователя запрашивается один раз и подставляется в запрос напрямую
+    assert db_utils.select_data.call_count == 2
+    favorites_call = db_utils.select_data.call_args_list[1]
+    assert favorites_call.args[3] == (7,)
+    assert 'uc.user_id = %s' in favorites_call.args[2]
+
+
+def test_search_for_candidates_db_reads_first_page():
+    db_utils = DatabaseUtils()
+    db_utils.get_user_id = MagicMock(return_value=7)
+    rows = iter([(i,) for i in range(100)])
+    db_utils.select_data = MagicMock(return_value=rows)
+
+    candidates = db_utils.search_for_candidates_db([25, 30], 1, 'москва', 123, limit=10)
+
+    assert candidates == [(i,) for i in range(10)]
+    assert db_utils.select_data.call_args.kwargs['stream'] is True
+    assert next(rows) == (10,)
+
+
+def fake_favorites_page(ids):
+    """Имитация DatabaseUtils.favorites_page над списком id избранных."""
+    def favorites_page(user_vk_id, after_id=None, before_id=None, limit=5):
+        if before_id is not None:
+            page = [i for i in ids if i < before_id][-limit:]
+        else:
+            page = [i for i in ids if after_id is None or i > after_id][:limit]
+        return [(i, 100 + i, f'Кандидат {i}', 'москва', 25, 1, None) for i in page]
+    return MagicMock(side_effect=favorites_page)
+
+
+def test_favorites_pager_keyset_navigation():
+    from utils import FavoritesPager
+
+    db_utils = MagicMock()
+    db_utils.favorites_page = fake_favorites_page(list(range(1, 8)))
+    pager = FavoritesPager(db_utils, 123, page_size=3)
+
+    visited = [pager.current.id] + [pager.move(1).id for _ in range(7)]
+    assert visited == [1, 2, 3, 4, 5, 6, 7, 7]
+    assert not pager.has_next and pager.has_prev
+    assert len(pager.window) <= 3
+
+    assert [pager.move(-1).id for _ in range(6)] == [6, 5, 4, 3, 2, 1]
+    assert not pager.has_prev
+    # Границы страниц запрашиваются по ключу, а не смещением
+    assert db_utils.favorites_page.call_args.kwargs == {'before_id': 4, 'limit': 4}
+
+
+def test_favorites_pager_remove_last_on_page():
+    from utils import FavoritesPager
+
+    ids = [1, 2, 3]
+    db_utils = MagicMock()
+    db_utils.favorites_page = fake_favorites_page(ids)
+    pager = FavoritesPager(db_utils, 123, page_size=1)
+
+    ids.remove(1)
+    assert pager.remove_current().id == 2
+    assert not pager.has_prev and pager.has_next
+    ids.remove(2)
+    ids.remove(3)
+    assert pager.remove_current() is None
+
+
+def test_favorites_page_query():
+    db_utils = DatabaseUtils()
+    db_utils.get_user_id = MagicMock(return_value=7)
+    db_utils.select_query = MagicMock(return_value=[(5,), (4,)])
+
+    rows = db_utils.favorites_page(123, before_id=6, limit=2)
+
+    query, values = db_utils.select_query.call_args.args
+    assert rows == [(4,), (5,)]
+    assert values == (7, 6, 2)
+    assert 'uc.candidate_id < %s' in query and 'DESC' in query
+
+
+def test_search_for_candidates_db_uses_buckets():
+    db_utils = DatabaseUtils()
+    db_utils.get_user_id = MagicMock(return_value=7)
+    db_utils.select_data = MagicMock(return_value=[])
+
+    db_utils.search_for_candidates_db([25, 30], 1, 'Москва', 123)
+
+    table_name, _, condition, values = db_utils.select_data.call_args.args
+    assert table_name.startswith('candidate_search s JOIN candidate c')
+    assert 's.city_key = lower(trim(%s))' in condition
+    assert 'user_candidate_archive' in condition
+    assert values == ('Москва', 1, 30, 25, 25, 30, 7, 7)
+
+
+def test_resolve_city_id_once():
+    utils = AuxiliaryUtils()
+    utils.db_utils.select_data = MagicMock(return_value=[])
+    utils.db_utils.execute_query = MagicMock()
+    utils.vk_service._get_city_id = MagicMock(return_value=2)
+
+    assert utils.resolve_city_id('Санкт-Петербург ') == 2
+    assert utils.resolve_city_id('санкт-петербург') == 2
+
+    utils.vk_service._get_city_id.assert_called_once()
+    utils.db_utils.select_data.assert_called_once()
+    assert utils.db_utils.execute_query.call_args.args[1] == ('санкт-петербург', 2)
+
+
+def test_search_for_candidates_db_by_city_id():
+    db_utils = DatabaseUtils()
+    db_utils.get_user_id = MagicMock(return_value=7)
+    db_utils.select_data = MagicMock(return_value=[])
+
+    db_utils.search_for_candidates_db([25], 1, 'питер', 123, city_id=2)
+
+    _, _, condition, values = db_utils.select_data.call_args.args
+    assert 's.city_id = %s' in condition and 'ILIKE' not in condition
+    assert values[:2] == (2, 'питер')
+
+
+def test_touch_user_restores_likes_once():
+    db_utils = DatabaseUtils()
+    db_utils.execute_query = MagicMock(return_value=[])
+
+    db_utils.touch_user(123)
+    db_utils.touch_user(123)
+
+    db_utils.execute_query.assert_called_once()
+    query, params = db_utils.execute_query.call_args.args
+    assert 'last_active_at = now()' in query
+    assert 'DELETE FROM user_candidate_archive' in query and 'a.preference' in query
+    assert params == (123,)
+
+
+def test_adding_candidate_status_updates_counters():
+    utils = AuxiliaryUtils()
+    utils.db_utils.get_user_id = MagicMock(return_value=7)
+    utils.db_utils.execute_query = MagicMock(return_value=[(11, 103)])
+    utils.seen.add = MagicMock()
+
+    utils.adding_candidate_status(3, 123, True)
+
+    utils.seen.add.assert_called_once_with(123, 103)
+
+    query, values = utils.db_utils.execute_query.call_args.args
+    assert 'INSERT INTO user_candidate' in query
+    assert all(table in query for table in ('candidate_stats', 'user_stats',
+                                             'user_daily_decisions'))
+    assert values == (7, 3, True)
+
+
+def test_candidate_status_update_counts_only_changes():
+    db_utils = DatabaseUtils()
+    db_utils.get_user_id = MagicMock(return_value=7)
+    db_utils.execute_query = MagicMock(return_value=[(1,)])
+
+    db_utils.candidate_status_update(3, 123, False)
+
+    query, values = db_utils.execute_query.call_args.args
+    assert 'preference <> %s' in query and 'candidate_stats' in query
+    assert '0 AS new_decision' in query and 'sum(new_decision)' in query
+    assert values == (7, 3, False)
+
+
+def test_candidate_likes():
+    db_utils = DatabaseUtils()
+    db_utils.select_data = MagicMock(return_value=[(3, 10), (4, 2)])
+
+    assert db_utils.candidate_likes([3, 4, 5]) == {3: 10, 4: 2}
+    assert db_utils.candidate_likes([]) == {}
+    db_utils.select_data.assert_called_once()
+
+
+def test_touch_user_not_cached_after_rollback():
+    db_utils = DatabaseUtils()
+    db_utils.execute_query = MagicMock(return_value=[])
+    db_utils._conn = MagicMock()
+
+    with pytest.raises(RuntimeError):
+        with db_utils.transaction():
+            db_utils.touch_user(123)
+            raise RuntimeError('ошибка обработчика')
+    db_utils._conn.rollback.assert_called_once()
+
+    with db_utils.transaction():
+        db_utils.touch_user(123)
+    db_utils.touch_user(123)
+
+    assert db_utils.execute_query.call_count == 2
@@ -0,0 +1,69 @@
+"""
+test_record_aggregates_calls: Проверяет поминутные и суточные счетчики вызовов по токенам.
+test_record_response_extracts_error_code: Проверяет извлечение HTTP-статуса и кода ошибки VK.
+test_near_quota: Проверяет раннее предупреждение о приближении к суточному лимиту.
+test_collect_hides_token: Проверяет метрики Prometheus без раскрытия токена.
+test_vkapi_records_calls: Проверяет учет вызовов, выполненных через VKAPI.
+"""
+from unittest.mock import MagicMock, patch
+
+from metrics import MetricsRegistry
+from vk_accounting import VKCallAccounting, token_label, vk_accounting
+from vk_api_service import VKAPI
+
+
+def test_record_aggregates_calls():
+    accounting = VKCallAccounting(daily_quotas={})
+    accounting.record('users.search', 0.1, 200, token='token-a')
+    accounting.record('users.search', 0.2, 200, token='token-a')
+    accounting.record('users.search', 0.1, 200, token='token-b')
+
+    assert accounting.calls_last_minute('users.search') == 3
+    assert accounting.calls_today('users.search', 'token-a') == 2
+    assert accounting.calls_today('users.search', 'token-b') == 1
+    assert accounting.totals[('users.search', 200, None)] == 3
+
+
+def test_record_response_extracts_error_code():
+    accounting = VKCallAccounting(daily_quotas={})
+    response = MagicMock(status_code=200)
+    response.json.return_value = {'error': {'error_code': 29, 'error_msg': 'Rate limit reached'}}
+
+    accounting.record_response('users.search', 0.05, response, 'token')
+
+    assert accounting.totals[('users.search', 200, 29)] == 1
+
+
+def test_near_quota():
+    accounting = VKCallAccounting(daily_quotas={'users.search': 10}, warning_ratio=0.8)
+    for _ in range(7):
+        accounting.record('users.search', 0.01, 200, token='token')
+    assert not accounting.near_quota('users.search')
+
+    accounting.record('users.search', 0.01, 200, token='token')
+    assert accounting.near_quota('users.search')
+    assert not accounting.near_quota('users.get')
+
+
+def test_collect_hides_token():
+    accounting = VKCallAccounting(daily_quotas={'users.search': 1000})
+    accounting.record('users.search', 0.5, 200, token='secret-token')
+    metrics = MetricsRegistry()
+    metrics.add_collector(accounting.collect)
+
+    text = metrics.render()
+
+    assert 'secret-token' not in text
+    assert (f'vkbot_vk_calls_today{{method="users.search",token="{token_label("secret-token")}"}} 1'
+            in text)
+    assert 'vkbot_vk_daily_quota{method="users.search"} 1000' in text
+
+
+@patch('requests.get')
+def test_vkapi_records_calls(mock_get):
+    mock_get.return_value.status_code = 200
+    mock_get.return_value.json.return_value = {'response': {'items': [{'id': 42}]}}
+    before = vk_accounting.totals[('database.getCities', 200, None)]
+
+    assert VKAPI()._get_city_id('Москва') == 42
+    assert vk_accounting.totals[('database.getCities', 200, None)] == before + 1
@@ -147,3 +147,19 @@ def test_search_users_error(mock_get, vkapi_instance):
     result = vkapi_instance.search_users(age=[25], gender=1, city_name='Moscow')
     
     assert result is None
+
+
+@patch('requests.get')
+def test_search_users_with_known_city_id(mock_get, vkapi_instance):
+    """Тест поиска по известному id города без запроса database.getCities"""
+    mock_response = Mock()
+    mock_response.json.return_value = {'response': {'items': [{'id': 1}]}}
+    mock_response.status_code = 200
+    mock_get.return_value = mock_response
+    vkapi_instance._get_city_id = Mock()
+
+    result = vkapi_instance.search_users(age=[25], gender=1, city_name='Питер', city_id=2)
+
+    assert result == [1]
+    vkapi_instance._get_city_id.assert_not_called()
+    assert mock_get.call_args.kwargs['params']['city'] == 2
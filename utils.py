@@ -1,16 +1,248 @@
 """
 Будет содержать вспомогательные функции
 """
+import hashlib
+import json
 import logging
+import os
 import re
-
-from datetime import datetime
-from database import Database
+import threading
+
+from collections import OrderedDict
+from itertools import islice
+from time import monotonic
+from typing import NamedTuple
+from btn_text import BTN_LIKE, BTN_DISLIKE
+from config import SCHEMA_STAMP_FILE, CANDIDATE_PAGE_SIZE, FAVORITES_PAGE_SIZE, \
+    USER_ACTIVITY_TOUCH_SECONDS, REGISTRATION_NEGATIVE_TTL_SECONDS
+from database import Database, recent_writes
+from migrations import LATEST_VERSION, Migrator
+from seen_set import SeenCandidates
 from vk_api_service import VKAPI
+from vk_accounting import vk_accounting
 
 logger = logging.getLogger(__name__)
 
 
+class Candidate(NamedTuple):
+    """
+        Неизменяемая запись о кандидате.
+
+        Используется вместо словаря на каждую строку выборки: запись занимает заметно меньше
+    памяти и создается из строки курсора одним вызовом `Candidate._make`. Порядок полей
+    совпадает с порядком столбцов `CANDIDATE_COLUMNS`.
+    """
+    id: int
+    vk_id: int
+    name: str
+    city: str
+    age: int | None
+    gender: int
+    photo_ids: list[str] | None
+
+
+# Столбцы выборки кандидатов в порядке полей Candidate; возраст вычисляется в БД
+CANDIDATE_COLUMNS = ("c.id, c.vk_id, c.name, c.city, "
+                     "DATE_PART('year', AGE(CURRENT_DATE, c.birthday))::int AS age, "
+                     "c.gender, c.photo_ids")
+
+# Обновление счетчиков по изменениям оценок `changes` (user_id, candidate_id, likes, dislikes,
+# new_decision): лайки и дизлайки кандидата, избранное пользователя (его лайки) и количество
+# новых оценок за день (смена лайка на дизлайк и обратно новой оценкой не считается)
+DECISION_COUNTERS = """
+    candidate_counts AS (
+        INSERT INTO candidate_stats AS s (candidate_id, likes, dislikes)
+        SELECT candidate_id, sum(likes), sum(dislikes) FROM changes GROUP BY candidate_id
+        ON CONFLICT (candidate_id) DO UPDATE
+        SET likes = s.likes + EXCLUDED.likes, dislikes = s.dislikes + EXCLUDED.dislikes
+    ), user_counts AS (
+        INSERT INTO user_stats AS s (user_id, favorites)
+        SELECT user_id, sum(likes) FROM changes GROUP BY user_id
+        ON CONFLICT (user_id) DO UPDATE SET favorites = s.favorites + EXCLUDED.favorites
+    ), daily_counts AS (
+        INSERT INTO user_daily_decisions AS s (user_id, day, decisions)
+        SELECT user_id, CURRENT_DATE, sum(new_decision) FROM changes GROUP BY user_id
+        HAVING sum(new_decision) > 0
+        ON CONFLICT (user_id, day) DO UPDATE SET decisions = s.decisions + EXCLUDED.decisions
+    )
+"""
+
+# Новая оценка кандидата вместе со счетчиками; параметры: user_id, candidate_id, preference.
+# Возвращает id оценки и VK ID кандидата.
+ADD_DECISION_QUERY = f"""
+    WITH decision AS (
+        INSERT INTO user_candidate (user_id, candidate_id, preference) VALUES (%s, %s, %s)
+        RETURNING id, user_id, candidate_id, preference
+    ), changes AS (
+        SELECT user_id, candidate_id, preference::int AS likes, (NOT preference)::int AS dislikes,
+               1 AS new_decision
+        FROM decision
+    ), {DECISION_COUNTERS}
+    SELECT d.id, c.vk_id FROM decision d JOIN candidate c ON c.id = d.candidate_id
+"""
+
+# Изменение оценки вместе со счетчиками; параметры: user_id, candidate_id, preference.
+# Строки с той же оценкой не изменяются и не учитываются.
+UPDATE_DECISION_QUERY = f"""
+    WITH previous AS (
+        SELECT user_id, id FROM user_candidate
+        WHERE user_id = %s AND candidate_id = %s AND preference <> %s
+        FOR UPDATE
+    ), decision AS (
+        UPDATE user_candidate uc SET preference = NOT uc.preference FROM previous
+        WHERE uc.user_id = previous.user_id AND uc.id = previous.id
+        RETURNING uc.user_id, uc.candidate_id, uc.preference
+    ), changes AS (
+        SELECT user_id, candidate_id,
+               CASE WHEN preference THEN 1 ELSE -1 END AS likes,
+               CASE WHEN preference THEN -1 ELSE 1 END AS dislikes,
+               0 AS new_decision
+        FROM decision
+    ), {DECISION_COUNTERS}
+    SELECT count(*) FROM decision
+"""
+
+
+def normalize_city(city_name: str) -> str:
+    """
+    Приводит название города к ключу сравнения: нижний регистр, 'ё' -> 'е', одиночные пробелы.
+
+    :param city_name: str Название города.
+    :return: str Ключ названия.
+    """
+    return ' '.join(city_name.lower().replace('ё', 'е').split())
+
+
+def to_candidates(rows) -> list[Candidate]:
+    """
+    Преобразует строки выборки с `CANDIDATE_COLUMNS` в список записей `Candidate`.
+
+    :param rows: Итерируемый объект строк курсора.
+    :return: list[Candidate] Список кандидатов.
+    """
+    return list(map(Candidate._make, rows))
+
+
+class FavoritesPager:
+    """
+        Постраничный просмотр избранных кандидатов пользователя.
+
+        В памяти хранится только окно из `page_size` кандидатов. При выходе за границы окна
+    следующая или предыдущая страница загружается запросом по ключу (keyset pagination):
+    кандидаты после последнего или до первого id окна. Поэтому память и стоимость запроса
+    на шаг не зависят от количества избранных. Каждая страница запрашивается с одним лишним
+    кандидатом, чтобы знать, есть ли кандидаты за границей окна.
+
+    Атрибуты:
+    - db_utils: DatabaseUtils для запроса страниц (`favorites_page`).
+    - user_vk_id: VK ID пользователя.
+    - page_size: Размер окна.
+    - window: Список записей Candidate текущего окна (по возрастанию id).
+    - index: Позиция текущего кандидата в окне.
+    """
+
+    def __init__(self, db_utils: 'DatabaseUtils', user_vk_id: int,
+                 page_size: int = FAVORITES_PAGE_SIZE):
+        """
+        :param db_utils: DatabaseUtils Объект работы с базой данных.
+        :param user_vk_id: int VK ID пользователя.
+        :param page_size: int Количество кандидатов, загружаемых за один запрос.
+        """
+        self.db_utils = db_utils
+        self.user_vk_id = user_vk_id
+        self.page_size = page_size
+        self.window = []
+        self.index = 0
+        self._more_before = False
+        self._more_after = False
+        self._load_after(None)
+
+    def _load_after(self, after_id: int | None) -> bool:
+        """Загружает окно кандидатов с id больше `after_id` (None - с начала)."""
+        rows = to_candidates(self.db_utils.favorites_page(self.user_vk_id, after_id=after_id,
+                                                          limit=self.page_size + 1))
+        if not rows:
+            return False
+        self._more_after = len(rows) > self.page_size
+        self._more_before = after_id is not None
+        self.window = rows[:self.page_size]
+        self.index = 0
+        return True
+
+    def _load_before(self, before_id: int) -> bool:
+        """Загружает окно кандидатов с id меньше `before_id`."""
+        rows = to_candidates(self.db_utils.favorites_page(self.user_vk_id, before_id=before_id,
+                                                          limit=self.page_size + 1))
+        if not rows:
+            return False
+        self._more_before = len(rows) > self.page_size
+        self._more_after = True
+        self.window = rows[-self.page_size:]
+        self.index = len(self.window) - 1
+        return True
+
+    @property
+    def current(self) -> 'Candidate | None':
+        """Текущий кандидат или None, если избранных нет."""
+        return self.window[self.index] if self.window else None
+
+    @property
+    def has_next(self) -> bool:
+        """Есть ли кандидат после текущего."""
+        return self.index < len(self.window) - 1 or self._more_after
+
+    @property
+    def has_prev(self) -> bool:
+        """Есть ли кандидат перед текущим."""
+        return self.index > 0 or self._more_before
+
+    def move(self, step: int) -> 'Candidate | None':
+        """
+        Переходит к следующему (step > 0) или предыдущему (step < 0) кандидату.
+
+        На границе списка избранных позиция не меняется.
+
+        :param step: int Направление перехода (1, -1 или 0).
+        :return: Candidate | None Текущий кандидат после перехода.
+        """
+        if step > 0 and self.has_next:
+            if self.index < len(self.window) - 1:
+                self.index += 1
+            elif not self._load_after(self.window[-1].id):
+                self._more_after = False
+        elif step < 0 and self.has_prev:
+            if self.index > 0:
+                self.index -= 1
+            elif not self._load_before(self.window[0].id):
+                self._more_before = False
+        return self.current
+
+    def remove_current(self) -> 'Candidate | None':
+        """
+        Убирает текущего кандидата из окна (после снятия отметки в базе данных).
+
+        Если окно опустело, загружается соседняя страница.
+
+        :return: Candidate | None Кандидат, ставший текущим.
+        """
+        if not self.window:
+            return None
+        removed = self.window.pop(self.index)
+        if self.window:
+            self.index = min(self.index, len(self.window) - 1)
+            return self.current
+
+        more_before = self._more_before
+        if self._more_after and self._load_after(removed.id):
+            self._more_before = more_before
+        elif more_before and self._load_before(removed.id):
+            self._more_after = False
+        else:
+            self.index = 0
+            self._more_before = self._more_after = False
+        return self.current
+
+
 class AuxiliaryUtils:
     """
         Класс вспомогательных утилит для работы с данными пользователя и кандидата.
@@ -19,11 +251,26 @@ class AuxiliaryUtils:
     о пользователях и кандидатах, а также работы с базой данных для сохранения полученных данных.
     Использует сервис `VKAPI` для работы с API ВКонтакте и `DatabaseUtils` для взаимодействия с
     базой данных.
+        Уже оцененные пользователем кандидаты отсеиваются фильтром `seen` (см. seen_set.py)
+    до сохранения и показа.
     """
 
-    def __init__(self):
+    def __init__(self, db_utils: 'DatabaseUtils' = None):
+        """
+        :param db_utils: DatabaseUtils Общий объект работы с базой данных; если не указан,
+                         создается собственный.
+        """
         self.vk_service = VKAPI()
-        self.db_utils = DatabaseUtils()
+        self.seen = SeenCandidates(db_utils or DatabaseUtils())
+
+    @property
+    def db_utils(self) -> 'DatabaseUtils':
+        """Объект работы с базой данных (общий с фильтром оцененных кандидатов `seen`)."""
+        return self.seen.db_utils
+
+    @db_utils.setter
+    def db_utils(self, value: 'DatabaseUtils'):
+        self.seen.db_utils = value
 
     def prepare_user_candidate_data(self, user_vk_id: int, table_name: str = 'users'):
         """
@@ -49,11 +296,17 @@ class AuxiliaryUtils:
                 'vk_id': common_data['id'],
                 'name': name,
                 'city': common_data['city'],
+                'city_id': common_data.get('city_id'),
                 'birthday': common_data['bdate'],
                 'gender': common_data['sex'],
                 'photo_ids': photo_id,
             }
-            result = self.db_utils.insert_data(table_name, data)
+            if table_name == 'users':
+                result = self.db_utils.insert_data(table_name, data, conflict_target='vk_id')
+            else:
+                result = self.db_utils.insert_data(table_name, data)
+            if table_name == 'users' and result is not None:
+                self.db_utils.mark_user_registered(data['vk_id'])
         else:
             result = None
 
@@ -105,7 +358,7 @@ class AuxiliaryUtils:
 
         return result
 
-    def get_candidate_db(self, user_data: dict, user_vk_id: int) -> list[dict]:
+    def get_candidate_db(self, user_data: dict, user_vk_id: int) -> list[Candidate]:
 
         """
         Получение списка кандидатов для пользователя из базы данных.
@@ -119,26 +372,29 @@ class AuxiliaryUtils:
                           а значение - словарь с возрастом, полом и городом.
         :param user_vk_id: VK ID пользователя, для которого необходимо найти кандидатов.
 
-        :return: Список словарей с данными кандидатов (не менее 10).
+        :return: Список записей Candidate (не менее 10).
+
+        Введенный пользователем город разрешается в id города VK один раз за поиск
+        (см. `resolve_city_id`), и кандидаты отбираются по этому id.
+        Поиск в базе фиксируется до обращения к VK (см. `Handler.message_handler`).
         """
-        candidate_list = []
-        candidate_db = self.db_utils.search_for_candidates_db(user_data[user_vk_id]['age'],
-                                                              user_data[user_vk_id]['sex'],
-                                                              user_data[user_vk_id]['city'],
-                                                              user_vk_id
-                                                              )
-        for candidate_data in candidate_db:
-            age = self._calculate_age(candidate_data[4])
-            data = {
-                'id': candidate_data[0],
-                'vk_id': candidate_data[1],
-                'name': candidate_data[2],
-                'city': candidate_data[3],
-                'age': age,
-                'gender': candidate_data[5],
-                'photo_ids': candidate_data[6],
-            }
-            candidate_list.append(data)
+        criteria = user_data[user_vk_id]
+        if 'city_id' not in criteria:
+            criteria['city_id'] = self.resolve_city_id(criteria['city'])
+
+        with self.db_utils.transaction():
+            candidate_list = to_candidates(
+                self.db_utils.search_for_candidates_db(criteria['age'],
+                                                       criteria['sex'],
+                                                       criteria['city'],
+                                                       user_vk_id,
+                                                       limit=CANDIDATE_PAGE_SIZE,
+                                                       city_id=criteria['city_id']
+                                                       )
+            )
+        if len(candidate_list) < 10 and self.search_quota_reached():
+            # Суточная квота поиска VK почти исчерпана: показываем то, что уже есть в базе
+            return candidate_list
         if len(candidate_list) < 10:
             result = self.get_candidate_vk_api(user_data, user_vk_id, 10 - len(candidate_list))
             if result:
@@ -148,15 +404,34 @@ class AuxiliaryUtils:
 
         return candidate_list
 
-    def _calculate_age(self, birthday):
+    def search_quota_reached(self) -> bool:
         """
-        Рассчитывает возраст на основе даты рождения.
+        Проверяет, почти ли исчерпана суточная квота поиска VK (`users.search`).
+
+        Квота VK действует на токен, поэтому учитываются только вызовы токена поиска.
 
-        :param birthday: Дата рождения (тип datetime.date).
-        :return: Возраст (количество полных лет).
+        :return: bool True, если новых кандидатов из VK сегодня запрашивать не следует.
         """
-        today = datetime.today().date()
-        return today.year - birthday.year - ((today.month, today.day) < (birthday.month, birthday.day))
+        return vk_accounting.near_quota('users.search', self.vk_service.token)
+
+    def resolve_city_id(self, city_name: str) -> int | None:
+        """
+        Возвращает id города VK по названию, введенному пользователем.
+
+            Соответствие названия и id ищется в кэше и таблице `city_alias`
+        (см. `DatabaseUtils.find_city_id`); при промахе название разрешается через VK
+        и сохраняется, поэтому запрос к VK выполняется один раз на название.
+
+        :param city_name: str Название города.
+        :return: int | None id города или None, если город не найден.
+        """
+        with self.db_utils.transaction():
+            city_id = self.db_utils.find_city_id(city_name)
+        if city_id is None:
+            city_id = self.vk_service._get_city_id(city_name)
+            if city_id is not None:
+                self.db_utils.save_city_id(city_name, city_id)
+        return city_id
 
     def get_candidate_vk_api(self, user_data: dict, user_vk_id: int,
                              number_records: int, offset: int = 0):
@@ -164,9 +439,9 @@ class AuxiliaryUtils:
             Запрос кандидатов через VK API и добавление их в базу данных.
 
             Функция делает запрос к VK API для поиска кандидатов по возрасту, полу и городу,
-        исключая тех, кто уже есть в базе данных. Если кандидатов меньше,
-        чем нужно (number_records), функция вызывает себя рекурсивно с увеличенным смещением
-        (offset) для получения оставшихся кандидатов.
+        исключая тех, кто уже есть в базе данных или уже оценен пользователем. Если кандидатов
+        меньше, чем нужно (number_records), функция вызывает себя рекурсивно с увеличенным
+        смещением (offset) для получения оставшихся кандидатов.
             После получения данных, кандидаты добавляются в базу данных.
 
         :param user_data: Словарь с данными пользователей, где ключ - vk_id пользователя,
@@ -181,10 +456,17 @@ class AuxiliaryUtils:
         candidates_id = self.vk_service.search_users(user_data[user_vk_id]['age'],
                                                      user_data[user_vk_id]['sex'],
                                                      user_data[user_vk_id]['city'],
-                                                     offset=offset
+                                                     offset=offset,
+                                                     city_id=user_data[user_vk_id].get('city_id')
                                                      )
         if candidates_id is not None:
-            candidates_missing_db = self.db_utils.find_missing_candidates(candidates_id)
+            with self.db_utils.transaction():
+                candidates_id = self.seen.exclude_vk_ids(user_vk_id, candidates_id)
+                candidates_missing_db = self.db_utils.find_missing_candidates(candidates_id,
+                                                                              user_vk_id)
+            if candidates_missing_db:
+                # Новые кандидаты должны сразу попасть в повторный поиск пользователя
+                self.db_utils.note_write(user_vk_id)
 
             if len(candidates_missing_db) < number_records:
 
@@ -203,7 +485,7 @@ class AuxiliaryUtils:
         else:
             return None
 
-    def creating_kadiat_message(self, candidate: dict) -> tuple[str, list]:
+    def creating_kadiat_message(self, candidate: Candidate) -> tuple[str, list]:
         """
             Создает сообщение и список фотографий для кандидата.
 
@@ -211,7 +493,7 @@ class AuxiliaryUtils:
         (имя, город, возраст и ссылка на профиль ВКонтакте), а также возвращает
         список идентификаторов фотографий кандидата.
 
-        :param candidate: dict Словарь с данными о кандидате, включая ключи:
+        :param candidate: Candidate Запись о кандидате, включая поля:
                          'name' (имя), 'city' (город), 'age' (возраст),
                          'vk_id' (ID кандидата ВКонтакте) и 'photo_ids' (список ID фотографий).
 
@@ -219,116 +501,190 @@ class AuxiliaryUtils:
                  - str: Сообщение с информацией о кандидате.
                  - list: Список идентификаторов фотографий кандидата.
         """
-        message = (f"Имя: {candidate['name']}\n"
-                   f"Город: {candidate['city']}\n"
-                   f"Возраст: {candidate['age']}\n"
-                   f"https://vk.com/id{candidate['vk_id']}"
+        message = (f"Имя: {candidate.name}\n"
+                   f"Город: {candidate.city}\n"
+                   f"Возраст: {candidate.age}\n"
+                   f"https://vk.com/id{candidate.vk_id}"
                    )
-        photo_id_list = candidate['photo_ids']
+        photo_id_list = candidate.photo_ids
         return message, photo_id_list
 
+    def creating_carousel_element(self, candidate: Candidate) -> dict:
+        """
+            Создает элемент карусели для кандидата.
+
+            Элемент содержит краткую информацию о кандидате, первую фотографию и кнопки
+        "Нравится"/"Не нравится", в полезной нагрузке которых передается ID кандидата.
+
+        :param candidate: Candidate Запись о кандидате (см. `creating_kadiat_message`).
+
+        :return: dict Элемент карусели для `VKBot.create_carousel`.
+        """
+        candidate_id = candidate.id
+        element = {
+            'title': candidate.name[:80],
+            'description': f"{candidate.city}, {candidate.age}"[:80],
+            'action': {'type': 'open_link', 'link': f"https://vk.com/id{candidate.vk_id}"},
+            'buttons': [
+                {'action': {'type': 'text', 'label': BTN_LIKE,
+                            'payload': json.dumps({'cmd': 'like', 'candidate_id': candidate_id})},
+                 'color': 'positive'},
+                {'action': {'type': 'text', 'label': BTN_DISLIKE,
+                            'payload': json.dumps({'cmd': 'dislike',
+                                                   'candidate_id': candidate_id})},
+                 'color': 'negative'},
+            ]
+        }
+        if candidate.photo_ids:
+            element['photo_id'] = candidate.photo_ids[0].removeprefix('photo')
+        return element
+
     def adding_candidate_status(self, candidate_id: int, user_vk_id: int, preference: bool):
         """
         Добавляет запись в таблицу user_candidate, чтобы сохранить статус кандидата
         (например, лайк или дизлайк) для конкретного пользователя.
+            Счетчики оценок (`candidate_stats`, `user_stats`, `user_daily_decisions`)
+        обновляются тем же запросом.
 
         :param candidate_id: Идентификатор кандидата.
         :param user_vk_id: VK ID пользователя, который оценил кандидата.
         :param preference: True для лайка, False для дизлайка.
         """
 
-        user_id = self.db_utils.select_data('users', 'id', "vk_id = %s", (user_vk_id,))
-        data = {
-            'user_id': user_id[0],
-            'candidate_id': candidate_id,
-            'preference': preference
-        }
-        self.db_utils.insert_data('user_candidate', data)
-
-    def get_favorites(self, user_vk_id: int) -> list[dict] | None:
-        """
-            Возвращает список избранных кандидатов для указанного пользователя.
-
-            Метод извлекает данные избранных кандидатов из базы данных, если они существуют,
-        и возвращает их в виде списка словарей с ключами 'id', 'vk_id', 'name', 'city',
-        'age', 'gender', 'photo_ids'.
-            Если избранных кандидатов не найдено, возвращает None.
-
-        :param user_vk_id: int VK ID пользователя, для которого необходимо получить
-                           список избранных.
-
-        :return: Список словарей с информацией об избранных или None, если данные отсутствуют.
-        """
-        list_favorites = []
-
-        favorites_db = self.db_utils.search_favorites(user_vk_id)
-        if favorites_db:
-            for favorite_data in favorites_db:
-                age = self._calculate_age(favorite_data[4])
-                data = {
-                    'id': favorite_data[0],
-                    'vk_id': favorite_data[1],
-                    'name': favorite_data[2],
-                    'city': favorite_data[3],
-                    'age': age,
-                    'gender': favorite_data[5],
-                    'photo_ids': favorite_data[6],
-                }
-                list_favorites.append(data)
-        else:
-            list_favorites = None
+        values = (self.db_utils.get_user_id(user_vk_id), candidate_id, preference)
+        rows = self.db_utils.execute_query(ADD_DECISION_QUERY, values, fetch=True)
+        self.db_utils.decision_saved(user_vk_id, rows[0][1] if rows else None, self.seen)
 
-        return list_favorites
+    def browse_favorites(self, user_vk_id: int) -> FavoritesPager | None:
+        """
+        Начинает постраничный просмотр избранных кандидатов пользователя.
 
+        :param user_vk_id: int VK ID пользователя.
+        :return: FavoritesPager | None Просмотр с первой страницей или None, если избранных нет.
+        """
+        pager = FavoritesPager(self.db_utils, user_vk_id)
+        return pager if pager.current is not None else None
 
-class DatabaseUtils(Database):
+
+class LRUCache:
     """
-    Класс для управления базой данных, наследующий методы и свойства из класса Database.
+        Потокобезопасный кэш с ограниченным размером.
+
+        При переполнении вытесняются давно не использовавшиеся записи. Записи со значением
+    None (отрицательные, например "пользователь не зарегистрирован") хранятся не дольше
+    `negative_ttl` секунд, чтобы изменения, сделанные другим процессом, стали видны.
+    Экземпляры используются как общие кэши класса `DatabaseUtils` из нескольких потоков
+    (обработчик сообщений и потоки `RegistrationPipeline`), поэтому обращения к записям
+    выполняются под блокировкой.
     """
 
-    def __init__(self):
-        super().__init__()
+    _MISSING = object()
+
+    def __init__(self, max_size: int = 100_000, negative_ttl: float = None):
+        """
+        :param max_size: int Максимальное количество записей в кэше.
+        :param negative_ttl: float Время жизни записей со значением None в секундах
+                             (None - без ограничения).
+        """
+        self.max_size = max_size
+        self.negative_ttl = negative_ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """
+        Возвращает закэшированное значение.
+
+        :param key: Ключ записи.
+        :return: Закэшированное значение или `LRUCache._MISSING`, если записи нет
+                 или отрицательная запись устарела.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return self._MISSING
+            value, expires_at = entry
+            if expires_at is not None and monotonic() >= expires_at:
+                del self._entries[key]
+                return self._MISSING
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        """
+        Сохраняет значение в кэш.
 
-    def add_table(self):
+        :param key: Ключ записи.
+        :param value: Значение (None - отрицательная запись).
         """
-        Создание таблиц в базе данных.
+        expires_at = None
+        if value is None and self.negative_ttl is not None:
+            expires_at = monotonic() + self.negative_ttl
+        with self._lock:
+            self._entries[key] = (value, expires_at)
+            self._entries.move_to_end(key)
+            if len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        """Очищает кэш."""
+        with self._lock:
+            self._entries.clear()
+
+
+class DatabaseUtils(Database):
+    """
+    Класс для управления базой данных, наследующий методы и свойства из класса Database.
 
-        Функция создает три таблицы:
-        1. Таблица пользователей (`users`) с информацией о пользователях, включая
-            ID, VK ID, имя, город, возраст, пол и массив ID фотографий.
+    Атрибуты:
+    - registration_cache: Общий для всех экземпляров кэш статуса регистрации пользователей.
+    - user_id_cache: Общий кэш соответствия VK ID пользователя и его id в таблице `users`.
+    - city_id_cache: Общий кэш соответствия названий городов (`normalize_city`) и id городов VK.
+    - activity_cache: Общий кэш времени (monotonic) последней отметки обращения пользователя.
 
-        2. Таблица кандидатов (`candidate`), с аналогичными полями как у пользователей.
+        Запросы к `user_candidate` фильтруются по `user_id = %s` с уже известным id
+    пользователя, поэтому при секционировании таблицы по хешу user_id (см. migrations.py)
+    PostgreSQL читает только одну секцию.
+    """
 
-        3. Таблица соответствий между пользователями и кандидатами (`user_candidate`),
-            которая связывает пользователя с кандидатом через внешние ключи на таблицы
-            пользователей и кандидатов, а также хранит предпочтения пользователя.
+    registration_cache = LRUCache(negative_ttl=REGISTRATION_NEGATIVE_TTL_SECONDS)
+    user_id_cache = LRUCache()
+    city_id_cache = LRUCache()
+    activity_cache = LRUCache()
 
-        Таблицы создаются с использованием метода `create_table`.
+    def __init__(self):
+        super().__init__()
+
+    def add_table(self, force: bool = False, stamp_file: str = SCHEMA_STAMP_FILE):
         """
-        table_user = 'users'
-        columns_user = [
-            ('id', 'SERIAL PRIMARY KEY'),
-            ('vk_id', 'BIGINT UNIQUE NOT NULL'),
-            ('name', 'VARCHAR(255) NOT NULL'),
-            ('city', 'VARCHAR(255)'),
-            ('birthday', 'DATE'),
-            ('gender', 'SMALLINT CHECK (gender IN (1, 2))'),
-            ('photo_ids', 'TEXT[]')
-        ]
+        Приведение схемы базы данных к актуальной версии.
 
-        table_candidate = 'candidate'
-        columns_candidate = columns_user
+        Применяет недостающие миграции из модуля migrations (таблицы пользователей,
+        кандидатов и их оценок, индексы и последующие изменения схемы).
+            Проверка выполняется один раз на развертывание: после нее в `stamp_file`
+        записывается отпечаток базы данных и последней версии миграций, и при следующих
+        запусках с тем же отпечатком к базе не обращаемся.
 
-        table_user_candidate = 'user_candidate'
-        columns_user_candidate = [
-            ('id', 'SERIAL PRIMARY KEY'),
-            ('user_id', 'BIGINT REFERENCES users(id) ON DELETE CASCADE'),
-            ('candidate_id', 'BIGINT REFERENCES candidate(id) ON DELETE CASCADE'),
-            ('preference', 'BOOLEAN NOT NULL')
-        ]
-        self.create_table(table_name=table_user, columns=columns_user)
-        self.create_table(table_name=table_candidate, columns=columns_candidate)
-        self.create_table(table_name=table_user_candidate, columns=columns_user_candidate)
+        :param force: bool Проверить схему, даже если отпечаток совпадает.
+        :param stamp_file: str Путь к файлу отпечатка проверенной схемы.
+        """
+        stamp = hashlib.sha256(repr((self.dbname, self._connect_params['host'],
+                                     LATEST_VERSION)).encode('utf-8')).hexdigest()
+        if not force and self._read_stamp(stamp_file) == stamp:
+            logger.info("Схема базы данных уже проверена, проверка пропущена")
+            return
+
+        Migrator(self).migrate()
+        with open(stamp_file, 'w', encoding='utf-8') as file:
+            file.write(stamp)
+
+    @staticmethod
+    def _read_stamp(stamp_file: str) -> str | None:
+        """Возвращает сохраненный отпечаток схемы или None, если его нет."""
+        if not os.path.exists(stamp_file):
+            return None
+        with open(stamp_file, encoding='utf-8') as file:
+            return file.read().strip()
 
     def check_user_existence_db(self, user_vk_id: int) -> int | None:
         """
@@ -337,19 +693,156 @@ class DatabaseUtils(Database):
             Функция выполняет запрос к базе данных для проверки наличия пользователя по его
         идентификатору ВКонтакте. Если пользователь найден, возвращается его идентификатор
         из базы данных. Если пользователь не найден, возвращается None.
+            Результат кэшируется в `registration_cache`, запрос к базе выполняется только
+        при промахе кэша. Отсутствие пользователя кэшируется на
+        `REGISTRATION_NEGATIVE_TTL_SECONDS`, чтобы регистрация в другом процессе бота стала видна.
+        Результат неудачного запроса не кэшируется.
 
         :param user_vk_id:int Уникальный идентификатор пользователя ВКонтакте.
 
         :return:int | None Возвращает идентификатор пользователя из базы данных,
             если он существует, или None, если пользователь не найден.
         """
+        cached = self.registration_cache.get(user_vk_id)
+        if cached is not LRUCache._MISSING:
+            return cached
+
         table_name = 'users'
         columns = 'vk_id'
         condition = 'vk_id=%s'
         values = (user_vk_id,)
 
-        result = self.select_data(table_name, columns, condition, values)
-        return result if result else None
+        result = self.select_data(table_name, columns, condition, values,
+                                  use_replica=True, user_key=user_vk_id, none_on_error=True)
+        if result is None:
+            return None
+        result = result if result else None
+        self.registration_cache.set(user_vk_id, result)
+        return result
+
+    def get_user_id(self, user_vk_id: int) -> int | None:
+        """
+        Возвращает id пользователя в таблице `users` по его VK ID.
+
+        Найденные id кэшируются в `user_id_cache` (id пользователя не меняется),
+        отсутствие пользователя не кэшируется.
+
+        :param user_vk_id: int VK ID пользователя.
+        :return: int | None id пользователя или None, если пользователь не зарегистрирован.
+        """
+        user_id = self.user_id_cache.get(user_vk_id)
+        if user_id is not LRUCache._MISSING:
+            return user_id
+
+        rows = self.select_data('users', 'id', 'vk_id = %s', (user_vk_id,),
+                                use_replica=True, user_key=user_vk_id)
+        if not rows:
+            return None
+        user_id = rows[0][0]
+        self.user_id_cache.set(user_vk_id, user_id)
+        return user_id
+
+    def find_city_id(self, city_name: str) -> int | None:
+        """
+        Возвращает сохраненный id города VK для названия из таблицы `city_alias`.
+
+        :param city_name: str Название города.
+        :return: int | None id города или None, если название еще не разрешалось.
+        """
+        name_key = normalize_city(city_name)
+        city_id = self.city_id_cache.get(name_key)
+        if city_id is not LRUCache._MISSING:
+            return city_id
+
+        rows = self.select_data('city_alias', 'city_id', 'name_key = %s', (name_key,))
+        if not rows:
+            return None
+        city_id = rows[0][0]
+        self.city_id_cache.set(name_key, city_id)
+        return city_id
+
+    def save_city_id(self, city_name: str, city_id: int):
+        """
+        Сохраняет соответствие названия города и id города VK.
+
+        :param city_name: str Название города.
+        :param city_id: int id города VK.
+        """
+        name_key = normalize_city(city_name)
+        self.execute_query("""
+            INSERT INTO city_alias (name_key, city_id) VALUES (%s, %s)
+            ON CONFLICT (name_key) DO UPDATE SET city_id = EXCLUDED.city_id
+        """, (name_key, city_id))
+        self.city_id_cache.set(name_key, city_id)
+
+    def touch_user(self, user_vk_id: int):
+        """
+        Отмечает обращение пользователя к боту и возвращает его лайки из архива.
+
+            Время обращения `users.last_active_at` обновляется не чаще раза в
+        `USER_ACTIVITY_TOUCH_SECONDS`. Тем же запросом лайки пользователя переносятся
+        из `user_candidate_archive` обратно в `user_candidate` (после долгой неактивности
+        retention.py переносит в архив все оценки), чтобы вернувшийся пользователь видел
+        свое избранное. Архивные дизлайки остаются в архиве и исключаются из поиска.
+            Отметка в `activity_cache` ставится только после фиксации транзакции
+        (`Database.on_commit`): если транзакция обработчика откатится, следующее обращение
+        снова обновит last_active_at.
+
+        :param user_vk_id: int VK ID пользователя.
+        """
+        now = monotonic()
+        touched = self.activity_cache.get(user_vk_id)
+        if touched is not LRUCache._MISSING \
+                and now - touched < USER_ACTIVITY_TOUCH_SECONDS:
+            return
+
+        restored = self.execute_query("""
+            WITH active AS (
+                UPDATE users SET last_active_at = now() WHERE vk_id = %s RETURNING id
+            ), restored AS (
+                DELETE FROM user_candidate_archive a USING active
+                WHERE a.user_id = active.id AND a.preference
+                RETURNING a.id, a.user_id, a.candidate_id, a.preference, a.decided_at
+            )
+            INSERT INTO user_candidate (id, user_id, candidate_id, preference, decided_at)
+            SELECT id, user_id, candidate_id, preference, decided_at FROM restored
+            ON CONFLICT DO NOTHING
+            RETURNING id
+        """, (user_vk_id,), fetch=True)
+        if restored is None:
+            return
+        self.on_commit(lambda: self.activity_cache.set(user_vk_id, now))
+        self.note_write(user_vk_id)
+
+    @staticmethod
+    def decision_saved(user_vk_id: int, candidate_vk_id: int = None, seen=None):
+        """
+        Действия после сохранения оценки кандидата, общие для `DatabaseUtils`
+        и `AsyncDatabase`.
+
+        Чтения пользователя временно выполняются на основном сервере (read-your-writes),
+        а новый оцененный кандидат добавляется в фильтр оцененных кандидатов.
+
+        :param user_vk_id: int VK ID пользователя.
+        :param candidate_vk_id: int VK ID кандидата с новой оценкой (None, если оценка
+                                не добавлялась).
+        :param seen: SeenCandidates Фильтр оцененных кандидатов (необязательно).
+        """
+        recent_writes.mark(user_vk_id)
+        if seen is not None and candidate_vk_id is not None:
+            seen.add(user_vk_id, candidate_vk_id)
+
+    def mark_user_registered(self, user_vk_id: int):
+        """
+        Отмечает пользователя как зарегистрированного в кэше статуса регистрации.
+
+        Вызывается после успешной вставки пользователя в таблицу `users`, чтобы заменить
+        возможную отрицательную запись в кэше.
+
+        :param user_vk_id: int VK ID пользователя.
+        """
+        self.registration_cache.set(user_vk_id, [(user_vk_id,)])
+        self.note_write(user_vk_id)
 
     def save_user_candidate(self, data: dict, table_name: str = 'users'):
         """
@@ -365,11 +858,13 @@ class DatabaseUtils(Database):
         """
         return self.insert_data(table_name=table_name, data=data)
 
-    def find_missing_candidates(self, vk_ids: list):
+    def find_missing_candidates(self, vk_ids: list, user_vk_id: int = None):
         """
         Проверка, какие кандидаты из списка vk_ids отсутствуют в таблице candidate.
 
         :param vk_ids: Список vk_id кандидатов для проверки.
+        :param user_vk_id: VK ID пользователя, для которого ищутся кандидаты (для чтения
+                           с основного сервера сразу после добавления им кандидатов).
         :return: Список vk_id кандидатов, которых нет в базе данных.
         """
         if not vk_ids:
@@ -381,7 +876,8 @@ class DatabaseUtils(Database):
         LEFT JOIN candidate c ON missing.vk_id = c.vk_id
         WHERE c.vk_id IS NULL
         """
-        missing_candidates = self.execute_query(query, params=tuple(vk_ids), fetch=True)
+        missing_candidates = self.select_query(query, tuple(vk_ids), use_replica=True,
+                                               user_key=user_vk_id)
 
         if missing_candidates is not None:
             result = [row[0] for row in missing_candidates] if missing_candidates else []
@@ -389,42 +885,80 @@ class DatabaseUtils(Database):
             result = missing_candidates
         return result
 
-    def search_for_candidates_db(self, age: list, sex: int, city: str, user_vk_id: int):
+    def search_for_candidates_db(self, age: list, sex: int, city: str, user_vk_id: int,
+                                 limit: int = None, city_id: int = None):
         """
             Поиск кандидатов по возрасту (конкретный или диапазон), полу и городу,
         которых пользователь еще не оценил.
 
+            Кандидаты выбираются из корзин `candidate_search` (нормализованный город, пол,
+        год рождения; см. миграцию 5) по индексу, поэтому точное условие возраста через AGE()
+        вычисляется только для кандидатов подходящих годов рождения, а не для всей таблицы.
+            Если известен id города VK, город сравнивается по id; кандидаты, сохраненные
+        без id города (до его появления в схеме), сравниваются по названию.
+            Оцененные кандидаты исключаются и по `user_candidate`, и по архиву
+        `user_candidate_archive` (см. retention.py).
+
         :param age: Список с двумя элементами [min_age, max_age] или одним элементом [age].
         :param sex: Пол кандидатов (1 - женский, 2 - мужской).
         :param city: Город кандидатов.
         :param user_vk_id: VK_ID пользователя, для которого ищем кандидатов.
+        :param limit: Количество первых кандидатов, которые нужно прочитать. Строки читаются
+                      с серверного курсора, и остальная часть выдачи не передается из базы.
+                      По умолчанию возвращаются все кандидаты.
+        :param city_id: id города VK (см. `AuxiliaryUtils.resolve_city_id`).
 
         :return: Список кандидатов, которые соответствуют критериям.
         """
 
         if len(age) == 1:
 
-            age_condition = "DATE_PART('year', AGE(CURRENT_DATE, birthday)) = %s"
+            age_condition = "DATE_PART('year', AGE(CURRENT_DATE, c.birthday)) = %s"
             age_values = (age[0],)
         else:
-            age_condition = "DATE_PART('year', AGE(CURRENT_DATE, birthday)) BETWEEN %s AND %s"
+            age_condition = "DATE_PART('year', AGE(CURRENT_DATE, c.birthday)) BETWEEN %s AND %s"
             age_values = (age[0], age[1])
 
-        table_name = 'candidate c'
-        columns = '*'
+        # Возраст от min_age до max_age - это годы рождения от (год - max_age - 1) до (год - min_age)
+        if city_id is None:
+            city_condition = "s.city_key = lower(trim(%s))"
+            city_values = (city,)
+        else:
+            city_condition = ("(s.city_id = %s OR "
+                              "(s.city_id IS NULL AND s.city_key = lower(trim(%s))))")
+            city_values = (city_id, city)
+
+        table_name = 'candidate_search s JOIN candidate c ON c.id = s.candidate_id'
+        columns = CANDIDATE_COLUMNS
         condition = f"""
-        {age_condition}
-        AND gender = %s
-        AND city ILIKE %s
-        AND c.id NOT IN (
-            SELECT candidate_id FROM user_candidate WHERE user_id = (
-                SELECT u.id FROM users u WHERE u.vk_id = %s)
+        {city_condition}
+        AND s.gender = %s
+        AND s.birth_year BETWEEN EXTRACT(YEAR FROM CURRENT_DATE) - %s - 1
+                             AND EXTRACT(YEAR FROM CURRENT_DATE) - %s
+        AND {age_condition}
+        AND NOT EXISTS (
+            SELECT 1 FROM user_candidate uc
+            WHERE uc.user_id = %s AND uc.candidate_id = c.id
+        )
+        AND NOT EXISTS (
+            SELECT 1 FROM user_candidate_archive a
+            WHERE a.user_id = %s AND a.candidate_id = c.id
         )
         """
 
-        values = (*age_values, sex, city, user_vk_id)
+        user_id = self.get_user_id(user_vk_id)
+        values = (*city_values, sex, age[-1], age[0], *age_values, user_id, user_id)
+
+        if limit is None:
+            return self.select_data(table_name, columns, condition, values,
+                                    use_replica=True, user_key=user_vk_id)
 
-        candidates = self.select_data(table_name, columns, condition, values)
+        rows = self.select_data(table_name, columns, condition, values, use_replica=True,
+                                user_key=user_vk_id, stream=True, batch_size=limit)
+        candidates = list(islice(rows, limit))
+        close = getattr(rows, 'close', None)
+        if close is not None:
+            close()
         return candidates
 
     def search_favorites(self, user_vk_id: int) -> list[tuple] | None:
@@ -440,19 +974,63 @@ class DatabaseUtils(Database):
 
         :return: Список кортежей с данными кандидатов или None, если избранных нет.
         """
+        user_id = self.get_user_id(user_vk_id)
+        if user_id is None:
+            return []
+
         table_name = 'candidate c'
-        columns = '*'
-        values = (user_vk_id,)
+        columns = CANDIDATE_COLUMNS
+        values = (user_id,)
         condition = """
-                    c.id  IN (
-                    SELECT uc.candidate_id FROM user_candidate uc WHERE user_id = (
-                        SELECT u.id FROM users u WHERE u.vk_id = %s)
-                        AND uc.preference = TRUE 
+                    c.id IN (
+                    SELECT uc.candidate_id FROM user_candidate uc
+                    WHERE uc.user_id = %s AND uc.preference = TRUE
                 )
                 """
-        favorites = self.select_data(table_name, columns, condition, values)
+        favorites = self.select_data(table_name, columns, condition, values,
+                                     use_replica=True, user_key=user_vk_id)
         return favorites
 
+    def favorites_page(self, user_vk_id: int, after_id: int = None, before_id: int = None,
+                       limit: int = FAVORITES_PAGE_SIZE) -> list[tuple]:
+        """
+            Возвращает страницу избранных кандидатов пользователя по ключу (keyset pagination).
+
+            Кандидаты упорядочены по id. Запрос идет по индексу user_candidate
+        (user_id, candidate_id) от переданной границы и читает не больше `limit` строк,
+        поэтому его стоимость не зависит от номера страницы и количества избранных.
+
+        :param user_vk_id: int VK ID пользователя.
+        :param after_id: int Вернуть кандидатов с id больше указанного (следующая страница).
+        :param before_id: int Вернуть кандидатов с id меньше указанного (предыдущая страница).
+        :param limit: int Максимальное количество кандидатов.
+        :return: Список строк с `CANDIDATE_COLUMNS` по возрастанию id.
+        """
+        user_id = self.get_user_id(user_vk_id)
+        if user_id is None:
+            return []
+
+        if before_id is not None:
+            bound, order = 'AND uc.candidate_id < %s', 'DESC'
+            values = (user_id, before_id, limit)
+        elif after_id is not None:
+            bound, order = 'AND uc.candidate_id > %s', 'ASC'
+            values = (user_id, after_id, limit)
+        else:
+            bound, order = '', 'ASC'
+            values = (user_id, limit)
+
+        query = f"""
+        SELECT DISTINCT ON (uc.candidate_id) {CANDIDATE_COLUMNS}
+        FROM user_candidate uc
+        JOIN candidate c ON c.id = uc.candidate_id
+        WHERE uc.user_id = %s AND uc.preference = TRUE {bound}
+        ORDER BY uc.candidate_id {order}
+        LIMIT %s
+        """
+        rows = self.select_query(query, values, use_replica=True, user_key=user_vk_id) or []
+        return rows[::-1] if order == 'DESC' else rows
+
     def candidate_status_update(self, candidate_id: int, user_vk_id: int, preference: bool):
         """
             Обновляет статус кандидата для пользователя в таблице "user_candidate".
@@ -460,6 +1038,7 @@ class DatabaseUtils(Database):
             Функция обновляет значение столбца "preference" в зависимости от выбора пользователя
         (нравится/не нравится) для конкретного кандидата. Сопоставляет кандидата и пользователя
         через их идентификаторы в базе данных.
+            Счетчики оценок обновляются тем же запросом и только если оценка изменилась.
 
         :param candidate_id: ID кандидата, статус которого нужно обновить.
         :param user_vk_id: VK ID пользователя, для которого обновляется статус кандидата.
@@ -467,14 +1046,50 @@ class DatabaseUtils(Database):
                (True - нравится, False - не нравится).
 
         """
-        table_name = 'user_candidate'
-        data = {
-            'preference': preference
-        }
-        condition = """candidate_id = %s AND user_id =(
-                        SELECT u.id FROM users u WHERE u.vk_id = %s) """
-        values = (candidate_id, user_vk_id)
-        self.update_data(table_name, data, condition, values)
+        values = (self.get_user_id(user_vk_id), candidate_id, preference)
+        self.execute_query(UPDATE_DECISION_QUERY, values, fetch=True)
+        self.decision_saved(user_vk_id)
+
+    def candidate_likes(self, candidate_ids: list[int]) -> dict[int, int]:
+        """
+        Возвращает количество лайков кандидатов из счетчиков `candidate_stats`.
+
+        :param candidate_ids: list[int] id кандидатов.
+        :return: dict {id кандидата: количество лайков}; кандидаты без оценок не включаются.
+        """
+        if not candidate_ids:
+            return {}
+        rows = self.select_data('candidate_stats', 'candidate_id, likes',
+                                'candidate_id = ANY(%s)', (list(candidate_ids),),
+                                use_replica=True)
+        return dict(rows or [])
+
+    def favorites_count(self, user_vk_id: int) -> int:
+        """
+        Возвращает количество избранных кандидатов пользователя из счетчика `user_stats`.
+
+        :param user_vk_id: int VK ID пользователя.
+        :return: int Количество избранных.
+        """
+        rows = self.select_data('user_stats', 'favorites', 'user_id = %s',
+                                (self.get_user_id(user_vk_id),),
+                                use_replica=True, user_key=user_vk_id)
+        return rows[0][0] if rows else 0
+
+    def daily_decisions(self, user_vk_id: int, days: int = 7) -> list[tuple]:
+        """
+        Возвращает количество оценок пользователя по дням из счетчика `user_daily_decisions`.
+
+        :param user_vk_id: int VK ID пользователя.
+        :param days: int Количество последних дней, включая текущий.
+        :return: list[tuple] Пары (дата, количество оценок) по возрастанию даты; дни без
+                 оценок не включаются.
+        """
+        return self.select_query("""
+            SELECT day, decisions FROM user_daily_decisions
+            WHERE user_id = %s AND day > CURRENT_DATE - %s
+            ORDER BY day
+        """, (self.get_user_id(user_vk_id), days), use_replica=True, user_key=user_vk_id) or []
 
 
 if __name__ == '__main__':
@@ -0,0 +1,199 @@
+"""
+Модуль vk_accounting.py
+
+Учет вызовов методов VK API и контроль квот.
+
+Каждый вызов VK (через `VKAPI` и API сообщества в `VKBot`) записывается с указанием метода,
+длительности, HTTP-статуса, кода ошибки VK и токена. Вместо самого токена хранится короткий
+отпечаток SHA-256, чтобы токены не попадали в логи и метрики.
+
+Вызовы агрегируются по минутам и по суткам. Для методов с суточными ограничениями
+(`VK_DAILY_QUOTAS`, например `users.search`) доступно раннее предупреждение `near_quota`:
+логика предзагрузки кандидатов использует его, чтобы перестать обращаться к VK до того,
+как пользователи увидят ошибки. Счетчики публикуются на эндпоинте метрик (см. metrics.py).
+"""
+import hashlib
+import logging
+import threading
+
+from collections import Counter, OrderedDict
+from datetime import date
+from time import time
+
+from config import VK_DAILY_QUOTAS, VK_QUOTA_WARNING_RATIO
+
+logger = logging.getLogger(__name__)
+
+
+def token_label(token: str | None) -> str:
+    """
+    Возвращает короткий отпечаток токена для учета без раскрытия самого токена.
+
+    :param token: str | None Токен доступа.
+    :return: str Первые 8 символов SHA-256 токена или 'none'.
+    """
+    if not token:
+        return 'none'
+    return hashlib.sha256(token.encode('utf-8')).hexdigest()[:8]
+
+
+class VKCallAccounting:
+    """
+        Счетчики вызовов VK API по минутам и суткам.
+
+    Атрибуты:
+    - daily_quotas: Словарь {метод: суточный лимит вызовов на токен}.
+    - warning_ratio: Доля лимита, при достижении которой `near_quota` возвращает True.
+    - totals: Counter {(метод, HTTP-статус, код ошибки VK): количество} за время работы.
+    """
+
+    def __init__(self, daily_quotas: dict = None, warning_ratio: float = VK_QUOTA_WARNING_RATIO,
+                 minutes_window: int = 60):
+        """
+        :param daily_quotas: dict Суточные лимиты методов.
+        :param warning_ratio: float Доля лимита для раннего предупреждения.
+        :param minutes_window: int Количество хранимых поминутных интервалов.
+        """
+        self.daily_quotas = dict(VK_DAILY_QUOTAS if daily_quotas is None else daily_quotas)
+        self.warning_ratio = warning_ratio
+        self.minutes_window = minutes_window
+        self.totals = Counter()
+        self._minutes = OrderedDict()
+        self._day = date.today()
+        self._daily = Counter()
+        self._latency = Counter()
+        self._warned = set()
+        self._lock = threading.Lock()
+
+    def record(self, method: str, latency: float, status: int | None = None,
+               error_code: int | None = None, token: str | None = None):
+        """
+        Записывает вызов метода VK API.
+
+        :param method: str Имя метода, например 'users.search'.
+        :param latency: float Длительность вызова в секундах.
+        :param status: int | None HTTP-статус ответа.
+        :param error_code: int | None Код ошибки VK или None при успехе.
+        :param token: str | None Токен, которым выполнен вызов.
+        """
+        label = token_label(token)
+        minute = int(time() // 60)
+        with self._lock:
+            self._roll_day()
+            self.totals[(method, status, error_code)] += 1
+            self._latency[method] += latency
+            self._daily[(method, label)] += 1
+
+            per_minute = self._minutes.get(minute)
+            if per_minute is None:
+                per_minute = self._minutes[minute] = Counter()
+                while len(self._minutes) > self.minutes_window:
+                    self._minutes.popitem(last=False)
+            per_minute[(method, label)] += 1
+
+        if error_code is not None:
+            logger.warning("Ошибка VK API в %s: код %s (токен %s)", method, error_code, label)
+
+    def record_response(self, method: str, latency: float, response, token: str | None = None):
+        """
+        Записывает вызов по HTTP-ответу VK API, извлекая статус и код ошибки.
+
+        :param method: str Имя метода.
+        :param latency: float Длительность вызова в секундах.
+        :param response: Ответ `requests`.
+        :param token: str | None Токен, которым выполнен вызов.
+        """
+        status = response.status_code if isinstance(response.status_code, int) else None
+        error_code = None
+        try:
+            payload = response.json()
+            if isinstance(payload, dict) and 'error' in payload:
+                error_code = payload['error'].get('error_code')
+        except ValueError:
+            pass
+        self.record(method, latency, status, error_code, token)
+
+    def _roll_day(self):
+        """Сбрасывает суточные счетчики при смене даты."""
+        today = date.today()
+        if today != self._day:
+            self._day = today
+            self._daily.clear()
+            self._warned.clear()
+
+    def calls_last_minute(self, method: str, token: str | None = None) -> int:
+        """
+        Возвращает количество вызовов метода за текущую минуту.
+
+        :param method: str Имя метода.
+        :param token: str | None Токен; если не указан, суммируются все токены.
+        """
+        with self._lock:
+            per_minute = self._minutes.get(int(time() // 60), Counter())
+            return self._sum(per_minute, method, token)
+
+    def calls_today(self, method: str, token: str | None = None) -> int:
+        """
+        Возвращает количество вызовов метода за текущие сутки.
+
+        :param method: str Имя метода.
+        :param token: str | None Токен; если не указан, суммируются все токены.
+        """
+        with self._lock:
+            self._roll_day()
+            return self._sum(self._daily, method, token)
+
+    @staticmethod
+    def _sum(counter: Counter, method: str, token: str | None) -> int:
+        if token is not None:
+            return counter[(method, token_label(token))]
+        return sum(count for (name, _), count in counter.items() if name == method)
+
+    def near_quota(self, method: str, token: str | None = None) -> bool:
+        """
+        Проверяет, приближается ли суточное количество вызовов метода к лимиту VK.
+
+        При первом срабатывании за сутки пишет предупреждение в лог.
+
+        :param method: str Имя метода.
+        :param token: str | None Токен; если не указан, учитываются все токены.
+        :return: bool True, если использовано не меньше `warning_ratio` лимита.
+        """
+        limit = self.daily_quotas.get(method)
+        if not limit:
+            return False
+        used = self.calls_today(method, token)
+        if used < limit * self.warning_ratio:
+            return False
+        if method not in self._warned:
+            self._warned.add(method)
+            logger.warning("Квота VK %s почти исчерпана: %s из %s вызовов за сутки",
+                           method, used, limit)
+        return True
+
+    def collect(self) -> list[str]:
+        """
+        Формирует строки метрик в формате Prometheus для эндпоинта /metrics.
+
+        :return: list[str] Строки метрик.
+        """
+        lines = ['# TYPE vkbot_vk_calls_total counter']
+        with self._lock:
+            self._roll_day()
+            for (method, status, error_code), count in sorted(self.totals.items(), key=str):
+                lines.append(f'vkbot_vk_calls_total{{method="{method}",status="{status}",'
+                             f'error_code="{error_code}"}} {count}')
+            lines.append('# TYPE vkbot_vk_call_seconds_total counter')
+            for method, seconds in sorted(self._latency.items()):
+                lines.append(f'vkbot_vk_call_seconds_total{{method="{method}"}} {seconds:.6f}')
+            lines.append('# TYPE vkbot_vk_calls_today gauge')
+            for (method, label), count in sorted(self._daily.items()):
+                lines.append(f'vkbot_vk_calls_today{{method="{method}",token="{label}"}} {count}')
+            lines.append('# TYPE vkbot_vk_daily_quota gauge')
+            for method, limit in sorted(self.daily_quotas.items()):
+                lines.append(f'vkbot_vk_daily_quota{{method="{method}"}} {limit}')
+        return lines
+
+
+# Общий учет вызовов VK процесса
+vk_accounting = VKCallAccounting()
@@ -16,7 +16,10 @@
 import logging
 import requests
 import re
+from time import perf_counter
 from config import VK_API_TOKEN, VK_API_VERSION
+from metrics import timed
+from vk_accounting import vk_accounting
 
 # Настройка логирования
 
@@ -55,7 +58,8 @@ class VKAPI:
         Получает идентификатор города по его названию.
 
     - search_users(age: list[int], gender: int, city_name: str, count: int = 10,
-    offset: int = 0) -> list | int: Ищет пользователей ВКонтакте по возрасту, полу и городу.
+    offset: int = 0, city_id: int = None) -> list | int: Ищет пользователей ВКонтакте
+    по возрасту, полу и городу.
 
     - get_top_photos(user_id, top_n=3) -> list:
         Получает топ-N фотографий пользователя ВКонтакте по количеству лайков.
@@ -66,6 +70,20 @@ class VKAPI:
         self.version = VK_API_VERSION
         self.api_url = 'https://api.vk.com/method/'
 
+    def _request(self, method: str, params: dict, timeout: float = None):
+        """
+        Выполняет GET-запрос к методу VK API и записывает вызов в учет `vk_accounting`.
+
+        :param method: str Имя метода, например 'users.search'.
+        :param params: dict Параметры запроса.
+        :param timeout: float Таймаут запроса в секундах.
+        :return: Ответ `requests`.
+        """
+        start = perf_counter()
+        response = requests.get(self.api_url + method, params=params, timeout=timeout)
+        vk_accounting.record_response(method, perf_counter() - start, response, self.token)
+        return response
+
     def _error_api(self, response):
         """
         Обрабатывает ошибки ответа API и логирует их.
@@ -77,7 +95,7 @@ class VKAPI:
             logger.error(f"Ошибка в ответе от VK API. HTTP статус: {response.status_code}")
 
             response_json = response.json()
-            logger.debug(f"Ответ от VK API: {response_json}")
+            logger.debug("Ответ от VK API: %s", response_json)
 
             if 'error' in response_json:
                 error_code = response_json['error']['error_code']
@@ -98,6 +116,7 @@ class VKAPI:
         except Exception as e:
             logger.exception(f"Ошибка при обработке ответа от VK API: {e}")
 
+    @timed('vkapi.get_users_info')
     def get_users_info(self, user_id: int | str) -> dict | None:
         """
         Получает информацию о пользователе ВКонтакте, включая имя, фамилию, пол и дату рождения.
@@ -113,6 +132,8 @@ class VKAPI:
             - 'last_name' (str): Фамилия пользователя.
             - 'sex' (int): Пол пользователя (1 - женский, 2 - мужской, 0 - не указан).
             - 'bdate' (str): Дата рождения пользователя в формате 'дд.мм.гггг' или 'дд.мм'.
+            - 'city' (str): Название города в нижнем регистре.
+            - 'city_id' (int): Идентификатор города VK.
 
         :raises: Исключения не выбрасываются, но при наличии ошибки вызывается
                  функция `_error_api`.
@@ -123,17 +144,18 @@ class VKAPI:
             'user_ids': user_id,
             'fields': 'sex, bdate, city'
         }
-        response = requests.get(self.api_url + 'users.get',
-                                params=params, timeout=0.5)
+        response = self._request('users.get', params, timeout=0.5)
         if 'error' not in response.json().keys() and response.json()['response'] != []:
             response_dict = response.json()['response'][0]
             bdate = self._format_bdate(response_dict.get('bdate', None))
+            city = response_dict.get('city') or {}
 
             result = {
                 'id': response_dict.get('id'),
                 'first_name': response_dict.get('first_name', None),
                 'last_name': response_dict.get('last_name', None),
-                'city': response_dict.get('city', {}).get('title', None).lower(),
+                'city': city['title'].lower() if city.get('title') else None,
+                'city_id': city.get('id'),
                 'sex': response_dict.get('sex', None),
                 'bdate': bdate
             }
@@ -159,6 +181,7 @@ class VKAPI:
 
         return None
 
+    @timed('vkapi.get_city_id')
     def _get_city_id(self, city_name: str) -> int | None:
         """
         Получение идентификатора города по его названию.
@@ -178,7 +201,7 @@ class VKAPI:
             'q': city_name,
             'count': 1
         }
-        response = requests.get(self.api_url + method, params=params)
+        response = self._request(method, params)
         if response.status_code == 200:
             data = response.json()
             if 'response' in data and data['response']['items']:
@@ -190,8 +213,9 @@ class VKAPI:
             self._error_api(response)
             return None
 
+    @timed('vkapi.search_users')
     def search_users(self, age: list[int], gender: int, city_name: str,
-                     count: int = 10, offset: int = 0) -> list | int:
+                     count: int = 10, offset: int = 0, city_id: int = None) -> list | int:
         """
         Поиск пользователей ВКонтакте по возрасту, полу и городу.
 
@@ -205,11 +229,14 @@ class VKAPI:
         :param city_name: str Название города для поиска пользователей.
         :param count: int Количество возвращаемых результатов (по умолчанию 10).
         :param offset: int Смещение для постраничного вывода (по умолчанию 0).
+        :param city_id: int Идентификатор города VK, если он уже известен; тогда название
+                        города не разрешается повторным запросом к VK.
 
         :return: list[int] Список идентификаторов найденных пользователей, если запрос успешен,
             иначе None.
         """
-        city_id = self._get_city_id(city_name)
+        if city_id is None:
+            city_id = self._get_city_id(city_name)
         if city_id is None:
             logger.error(f"Не удалось получить идентификатор города для {city_name}")
             return None
@@ -235,7 +262,7 @@ class VKAPI:
             'fields': 'photo_max'
         }
         result = []
-        response = requests.get(self.api_url + method, params=params)
+        response = self._request(method, params)
         if response.status_code == 200:
             data = response.json()
             if 'response' in data:
@@ -250,6 +277,7 @@ class VKAPI:
             result = None
         return result
 
+    @timed('vkapi.get_top_photos')
     def get_top_photos(self, user_id, top_n=3):
         """
             Получение топ-N фотографий пользователя из альбома профиля ВКонтакте, отсортированных
@@ -275,7 +303,7 @@ class VKAPI:
             'extended': 1,
             'photo_sizes': 0
         }
-        response = requests.get(self.api_url + method, params=params)
+        response = self._request(method, params)
         if response.status_code == 200:
             data = response.json()
 